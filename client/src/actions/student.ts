@@ -68,8 +68,9 @@ async function _createStudentsBatch(
     });
   }
 
+  // All or nothing, a partly created roster answers 207 which isn't handled yet
   const response = await api(
-    `/course/${data.courseId}/section/${data.sectionId}/student`,
+    `/course/${data.courseId}/section/${data.sectionId}/student?atomic=true`,
     HTTPMethod.POST,
     uploadData
   );
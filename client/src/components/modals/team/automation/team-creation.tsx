@@ -56,7 +56,7 @@ export function CreateTeamsForm({
             <FormField.Input
               type="number"
               min={0}
-              max={100}
+              max={500}
               defaultValue={Number(formState?.fields?.teamCount) || 0}
             />
           </FormField>
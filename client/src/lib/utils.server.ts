@@ -3,20 +3,42 @@
 import { cookies } from "next/headers";
 import { HTTPMethod } from "./utils";
 
+// The API sends its database position back after a write. Echoing it makes
+// the next reads wait for a replica that has the write, whichever server
+// process answers them.
+const LSN_HEADER = "X-DB-LSN";
+const LSN_COOKIE = "db_lsn";
+
 export async function api(endpoint: string, method: HTTPMethod, body?: object) {
-  const token = (await cookies()).get("session") ?? { value: "" };
+  const cookieStore = await cookies();
+  const token = cookieStore.get("session") ?? { value: "" };
+  const lsn = cookieStore.get(LSN_COOKIE);
 
   try {
-    return await fetch(`${process.env.API_URL}${endpoint}`, {
+    const response = await fetch(`${process.env.API_URL}${endpoint}`, {
       method,
       body: body ? JSON.stringify(body) : undefined,
       headers: {
         "Authorization": `Bearer ${token.value}`,
+        ...(lsn ? { [LSN_HEADER]: lsn.value } : {}),
         ...(method === HTTPMethod.GET
           ? {}
           : { "Content-Type": "application/json" }),
       },
     });
+
+    const writtenLsn = response.headers.get(LSN_HEADER);
+
+    if (writtenLsn) {
+      // Writes happen in server actions, where cookies can be set
+      cookieStore.set(LSN_COOKIE, writtenLsn, {
+        httpOnly: true,
+        sameSite: "lax",
+        maxAge: 60,
+      });
+    }
+
+    return response;
   } catch (e) {
     console.error(e);
     return new Response(null, {
@@ -104,6 +104,9 @@ CREATE TABLE IF NOT EXISTS students_comments (
 CREATE UNIQUE INDEX section_email ON students (email, section_id);
 CREATE UNIQUE INDEX team_name ON teams (name, course_id);
 
+-- Everything after this baseline is in server/python/db/migrations, which the
+-- server applies on startup, see server/python/db/migrate.py
+
 /*
 references:
 
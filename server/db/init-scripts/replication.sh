@@ -0,0 +1,14 @@
+#!/bin/bash
+# Lets the db-replica service in compose.yaml stream from this database.
+# Skipped unless REPLICATION_PASSWORD is set in .db.env.
+set -e
+
+if [ -z "$REPLICATION_PASSWORD" ]; then
+    exit 0
+fi
+
+psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<-EOSQL
+    CREATE ROLE replicator WITH REPLICATION LOGIN PASSWORD '$REPLICATION_PASSWORD';
+EOSQL
+
+echo "host replication replicator all scram-sha-256" >> "$PGDATA/pg_hba.conf"
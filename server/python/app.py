@@ -1,6 +1,8 @@
-import traceback
-from flask import Flask, jsonify
+from flask import Flask, current_app, jsonify
 from auth.auth import init_jwt
+from compression import init_compression
+from json_provider import init_json
+from metrics import init_metrics, record_exception
 from controllers.course_controller import course_controller
 from controllers.section_controller import section_controller
 from controllers.student_controller import student_controller
@@ -8,45 +10,87 @@ from controllers.team_controller import team_controller
 from auth.auth import auth_controller
 from controllers.label_controller import label_controller, label_assign_controller
 from controllers.comment_controller import comment_controller
-from extensions import FALAFELException
-from psycopg2.errors import UniqueViolation
+from extensions import FALAFELException, NotModifiedException, add_etag
+from psycopg2.errors import ForeignKeyViolation, UniqueViolation
+from db.db import PoolTimeout, init_db
+from db.query_log import init_query_log
 
-app = Flask(__name__)
-init_jwt(app)
-
-app.register_blueprint(course_controller)
-app.register_blueprint(section_controller)
-app.register_blueprint(student_controller)
-app.register_blueprint(auth_controller)
-app.register_blueprint(team_controller)
-app.register_blueprint(label_controller)
-app.register_blueprint(comment_controller)
-app.register_blueprint(label_assign_controller)
-
-
-@app.route("/", methods=["GET"])
 def hello():
     return {"status": "ok", "service": "CRM Flask API"}, 200
 
 
-@app.errorhandler(FALAFELException)
 def handle_custom_exception(error: FALAFELException):
     print(error)
     return jsonify({"status": error.status, "error": error.message}), error.status
 
 
-@app.errorhandler(UniqueViolation)
+def handle_not_modified(error: NotModifiedException):
+    return "", 304
+
+
 def handle_unique_violation(error: UniqueViolation):
     print(error)
     return jsonify({"status": 409, "error": "Conflict"}), 409
 
 
-@app.errorhandler(Exception)
-def handle_error(error):
+def handle_foreign_key_violation(error: ForeignKeyViolation):
+    # A write under a parent that is gone, e.g. one another worker deleted
+    # while this worker's ownership cache still had it
     print(error)
-    traceback.print_exc(error)
+    return jsonify({"status": 404, "error": "Not Found"}), 404
+
+
+def handle_pool_timeout(error: PoolTimeout):
+    print(error)
+    return jsonify({"status": 503, "error": "Service Unavailable"}), 503
+
+
+def handle_error(error):
+    record_exception(error)
+    current_app.logger.error("Unhandled exception", exc_info=error)
     return jsonify({"status": 500, "error": "Internal Server Error"}), 500
 
 
+def create_app() -> Flask:
+    """Build the Flask app
+
+    Served by gunicorn in production, see gunicorn.conf.py, and by the
+    Werkzeug dev server when this file is run directly.
+    """
+    app = Flask(__name__)
+    init_json(app)
+    # Registered first so its after_request hook times the finished, compressed response
+    init_metrics(app)
+    init_jwt(app)
+    init_db(app)
+    init_query_log(app)
+    # after_request hooks run last to first, so compression sees the finished response
+    init_compression(app)
+    app.after_request(add_etag)
+
+    app.register_blueprint(course_controller)
+    app.register_blueprint(section_controller)
+    app.register_blueprint(student_controller)
+    app.register_blueprint(auth_controller)
+    app.register_blueprint(team_controller)
+    app.register_blueprint(label_controller)
+    app.register_blueprint(comment_controller)
+    app.register_blueprint(label_assign_controller)
+
+    app.add_url_rule("/", view_func=hello, methods=["GET"])
+
+    app.register_error_handler(NotModifiedException, handle_not_modified)
+    app.register_error_handler(FALAFELException, handle_custom_exception)
+    app.register_error_handler(UniqueViolation, handle_unique_violation)
+    app.register_error_handler(ForeignKeyViolation, handle_foreign_key_violation)
+    app.register_error_handler(PoolTimeout, handle_pool_timeout)
+    app.register_error_handler(Exception, handle_error)
+
+    return app
+
+
+app = create_app()
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,13 @@
+"""ASGI entry point
+
+Every route, the course reads included, is served by the Flask app, which
+asgiref runs in a thread, so a request gets the same query log, metrics,
+compression and conditional GET handling as under gunicorn. The course
+reads still load their children concurrently, see db/parallel.py. Run with
+`uvicorn asgi:application --host 0.0.0.0 --port 5000`.
+"""
+
+from asgiref.wsgi import WsgiToAsgi
+from app import app as flask_app
+
+application = WsgiToAsgi(flask_app)
@@ -0,0 +1,157 @@
+"""Time the cascades of the set-wise team and student deletes
+
+Seeds courses with teams, students and comments inside a transaction, then
+runs EXPLAIN ANALYZE on deleting every team of one course and on deleting a
+section's students, with and without the indexes the cascades look up. Each
+run is rolled back to a savepoint, and the whole transaction is rolled back
+at the end, so the database is left as it was.
+
+Run from server/python with `python -m benchmarks.bench_cascades`.
+"""
+
+import argparse
+import psycopg2
+from db.db import DSN
+
+COURSES = 200
+TEAMS_PER_COURSE = 10
+STUDENTS_PER_TEAM = 5
+COMMENTS_PER_ROW = 3
+
+# Indexes the cascades use, created if the database doesn't have them yet
+INDEXES = {
+    "teams_course_id": "teams (course_id)",
+    "students_team_id": "students (team_id)",
+    "comments_team_id": "comments (team_id)",
+    "comments_student_id": "comments (student_id)",
+    "teams_comments_comment_id": "teams_comments (comment_id)",
+    "students_comments_comment_id": "students_comments (comment_id)",
+}
+
+DELETES = {
+    "delete course teams": "DELETE FROM teams WHERE course_id = %(course_id)s",
+    "delete section students": """
+        DELETE FROM students
+        WHERE section_id = %(section_id)s AND id = ANY(%(student_ids)s)
+    """,
+}
+
+
+def seed(cur) -> dict:
+    cur.execute(
+        """
+        INSERT INTO courses (owner_id, name)
+        SELECT 'bench', 'Course ' || i FROM generate_series(1, %s) i
+        RETURNING id
+        """,
+        (COURSES,),
+    )
+    course_ids = [row[0] for row in cur.fetchall()]
+    cur.execute(
+        """
+        INSERT INTO sections (course_id, name)
+        SELECT id, 'Section' FROM courses WHERE id = ANY(%s)
+        """,
+        (course_ids,),
+    )
+    cur.execute(
+        """
+        INSERT INTO teams (course_id, name)
+        SELECT c, 'Team ' || i
+        FROM unnest(%s::INT[]) c, generate_series(1, %s) i
+        """,
+        (course_ids, TEAMS_PER_COURSE),
+    )
+    cur.execute(
+        """
+        INSERT INTO students (section_id, team_id, name)
+        SELECT s.id, t.id, 'Student ' || i
+        FROM teams t
+        JOIN sections s ON s.course_id = t.course_id
+        CROSS JOIN generate_series(1, %s) i
+        WHERE t.course_id = ANY(%s)
+        """,
+        (STUDENTS_PER_TEAM, course_ids),
+    )
+    for parent, junction in (("team", "teams_comments"), ("student", "students_comments")):
+        table = f"{parent}s"
+        cur.execute(
+            f"""
+            WITH new_comments AS (
+                INSERT INTO comments ({parent}_id, content)
+                SELECT p.id, 'Comment ' || i
+                FROM {table} p
+                {"JOIN sections s ON s.id = p.section_id" if parent == "student" else ""}
+                CROSS JOIN generate_series(1, %s) i
+                WHERE {"s" if parent == "student" else "p"}.course_id = ANY(%s)
+                RETURNING id, {parent}_id
+            )
+            INSERT INTO {junction} ({parent}_id, comment_id)
+            SELECT {parent}_id, id FROM new_comments
+            """,
+            (COMMENTS_PER_ROW, course_ids),
+        )
+
+    course_id = course_ids[len(course_ids) // 2]
+    cur.execute("SELECT id FROM sections WHERE course_id = %s", (course_id,))
+    section_id = cur.fetchone()[0]
+    cur.execute("SELECT id FROM students WHERE section_id = %s", (section_id,))
+    student_ids = [row[0] for row in cur.fetchall()]
+    cur.execute("ANALYZE")
+
+    return {"course_id": course_id, "section_id": section_id, "student_ids": student_ids}
+
+
+def explain(cur, statement: str, params: dict) -> tuple[float, dict[str, float]]:
+    """Execution time in ms, and the time of each cascade trigger"""
+    cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + statement, params)
+    plan = cur.fetchone()[0][0]
+    triggers = {t["Trigger Name"] + " on " + t["Relation"]: t["Time"] for t in plan["Triggers"]}
+
+    return plan["Execution Time"], triggers
+
+
+def main(dsn: str) -> None:
+    conn = psycopg2.connect(dsn)
+
+    try:
+        with conn.cursor() as cur:
+            for name, definition in INDEXES.items():
+                cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+
+            params = seed(cur)
+            print(
+                f"{COURSES} courses, {TEAMS_PER_COURSE} teams and "
+                f"{TEAMS_PER_COURSE * STUDENTS_PER_TEAM} students each, "
+                f"{COMMENTS_PER_ROW} comments per team and student\n"
+            )
+
+            for label, dropped in [
+                ("all indexes", []),
+                (
+                    "without comment_id indexes",
+                    ["teams_comments_comment_id", "students_comments_comment_id"],
+                ),
+                ("without any", list(INDEXES)),
+            ]:
+                print(label)
+
+                for name, statement in DELETES.items():
+                    cur.execute("SAVEPOINT bench")
+
+                    for index in dropped:
+                        cur.execute(f"DROP INDEX {index}")
+
+                    ms, triggers = explain(cur, statement, params)
+                    cur.execute("ROLLBACK TO SAVEPOINT bench")
+                    trigger, trigger_ms = max(triggers.items(), key=lambda item: item[1])
+                    print(f"  {name:24} {ms:9.1f} ms, slowest trigger {trigger} {trigger_ms:.1f} ms")
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dsn", default=DSN, help="the database to benchmark against")
+    main(parser.parse_args().dsn)
@@ -0,0 +1,168 @@
+"""Compare query plans with and without the foreign key indexes
+
+Runs EXPLAIN ANALYZE on every registered query, and on every shape of path
+ownership check, for the course with the most students. The indexes from
+0002_foreign_key_indexes.sql are then dropped inside a transaction, the
+queries are explained again and the transaction is rolled back, so the
+database is left as it was. The drop locks the tables until then, so only
+run this against a development database with data in it.
+
+Run from server/python with `python -m benchmarks.bench_indexes`.
+"""
+
+from typing import Any, Callable
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from db import queries
+from db.db import DSN
+from db.migrate import MIGRATIONS_DIR, concurrent_indexes
+from services.ownership_services import path_owner_query
+
+INDEX_PACK = MIGRATIONS_DIR / "0002_foreign_key_indexes.sql"
+RUNS = 5
+
+
+def sample(cur) -> dict[str, Any]:
+    """Ids out of the course with the most students"""
+    cur.execute(
+        """
+        SELECT c.id, c.owner_id
+        FROM courses c
+        JOIN sections s ON s.course_id = c.id
+        JOIN students st ON st.section_id = s.id
+        GROUP BY c.id
+        ORDER BY COUNT(*) DESC
+        LIMIT 1
+        """
+    )
+    course = cur.fetchone()
+
+    if course is None:
+        raise SystemExit("No course with students to benchmark, add some data first")
+
+    cur.execute("SELECT id FROM sections WHERE course_id = %s", (course["id"],))
+    section_ids = [row["id"] for row in cur.fetchall()]
+    cur.execute("SELECT id FROM teams WHERE course_id = %s", (course["id"],))
+    team_ids = [row["id"] for row in cur.fetchall()]
+    cur.execute(
+        "SELECT id, team_id FROM students WHERE section_id = ANY(%s) ORDER BY id",
+        (section_ids,),
+    )
+    students = cur.fetchall()
+
+    return {
+        "course_id": course["id"],
+        "owner_id": course["owner_id"],
+        "section_id": section_ids[0],
+        "section_ids": section_ids,
+        "team_id": team_ids[0] if team_ids else 0,
+        "team_ids": team_ids,
+        "student_id": students[0]["id"],
+        "student_ids": [student["id"] for student in students],
+    }
+
+
+# Registered query -> its parameters out of the sample
+PARAMS: dict[str, Callable[[dict[str, Any]], tuple]] = {
+    "course_by_id": lambda s: (s["course_id"],),
+    "course_version": lambda s: (s["course_id"],),
+    "courses_by_owner": lambda s: (s["owner_id"],),
+    "section_by_id": lambda s: (s["section_id"],),
+    "sections_by_course": lambda s: (s["course_id"],),
+    "team_by_id": lambda s: (s["team_id"],),
+    "teams_by_course": lambda s: (s["course_id"],),
+    "student_by_id": lambda s: (s["student_id"],),
+    "students_by_section": lambda s: (s["section_id"],),
+    "labels_by_student": lambda s: (s["student_id"],),
+    "labels_by_team": lambda s: (s["team_id"],),
+    "comments_by_student": lambda s: (s["student_id"],),
+    "comments_by_team": lambda s: (s["team_id"],),
+    "languages_by_student": lambda s: (s["student_id"],),
+    "frameworks_by_student": lambda s: (s["student_id"],),
+    "labels_by_students": lambda s: (s["student_ids"],),
+    "labels_by_teams": lambda s: (s["team_ids"],),
+    "comments_by_students": lambda s: (s["student_ids"],),
+    "comments_by_teams": lambda s: (s["team_ids"],),
+    "experiences_by_students": lambda s: (s["student_ids"],),
+    "sections_by_courses": lambda s: ([s["course_id"]],),
+    "teams_by_courses": lambda s: ([s["course_id"]],),
+    "students_by_sections_or_teams": lambda s: (s["section_ids"], s["team_ids"]),
+}
+
+
+def statements(s: dict[str, Any]) -> dict[str, tuple[str, tuple]]:
+    """Name -> (SQL, parameters) of every statement to explain"""
+    result = {name: (queries.QUERIES[name].sql, params(s)) for name, params in PARAMS.items()}
+
+    for path in [
+        {},
+        {"section_id": s["section_id"]},
+        {"section_id": s["section_id"], "student_id": s["student_id"]},
+        {"team_id": s["team_id"]},
+    ]:
+        name, values = path_owner_query(s["course_id"], **path)
+        result[name] = (queries.QUERIES[name].sql, tuple(values))
+
+    return result
+
+
+def explain(cur, sql: str, params: tuple) -> tuple[float, str, int]:
+    """The best execution time in ms, the plan's top scan and its shared buffers"""
+    best = None
+
+    for _ in range(RUNS):
+        cur.execute(
+            "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql.rstrip().rstrip(";"), params
+        )
+        plan = cur.fetchone()["QUERY PLAN"][0]
+
+        if best is None or plan["Execution Time"] < best["Execution Time"]:
+            best = plan
+
+    node = best["Plan"]
+
+    while "Plans" in node and "Scan" not in node["Node Type"]:
+        node = node["Plans"][0]
+
+    buffers = best["Plan"].get("Shared Hit Blocks", 0) + best["Plan"].get(
+        "Shared Read Blocks", 0
+    )
+
+    return best["Execution Time"], node["Node Type"], buffers
+
+
+def main() -> None:
+    conn = psycopg2.connect(DSN)
+    indexes = concurrent_indexes(INDEX_PACK.read_text())
+
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            s = sample(cur)
+            todo = statements(s)
+            print(
+                f"course {s['course_id']}: {len(s['section_ids'])} sections, "
+                f"{len(s['team_ids'])} teams, {len(s['student_ids'])} students\n"
+            )
+
+            with_indexes = {name: explain(cur, *args) for name, args in todo.items()}
+
+            for index in indexes:
+                cur.execute(f"DROP INDEX IF EXISTS {index}")
+
+            without_indexes = {name: explain(cur, *args) for name, args in todo.items()}
+    finally:
+        conn.rollback()
+        conn.close()
+
+    print(f"{'query':40} {'without':>24} {'with':>24}")
+
+    for name in todo:
+        cells = [
+            f"{ms:7.3f} ms {buffers:5} {node[:10]}"
+            for ms, node, buffers in (without_indexes[name], with_indexes[name])
+        ]
+        print(f"{name:40} {cells[0]:>24} {cells[1]:>24}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Time JSON serialization of course trees with Flask's default and the orjson provider
+
+Run from server/python with `python -m benchmarks.bench_json`.
+"""
+
+import timeit
+from datetime import datetime, timedelta
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from psycopg2.extras import RealDictRow
+from json_provider import ORJSONProvider
+
+SIZES = {"small": 30, "medium": 120, "large": 300}
+
+
+def row(**values) -> RealDictRow:
+    result = RealDictRow()
+    result.update(values)
+    return result
+
+
+def course(student_count: int) -> RealDictRow:
+    """A course shaped like GET /course/<id>, with 5 students per team"""
+    created_at = datetime(2025, 9, 1, 12, 30)
+    labels = [
+        row(id=i, owner_id="1", name=f"Label {i}", color="#ff0000") for i in range(3)
+    ]
+    students = [
+        row(
+            id=i,
+            section_id=i % 3,
+            team_id=i // 5,
+            name=f"Student {i}",
+            email=f"student{i}@example.edu",
+            major="Computer Science",
+            leadership=5,
+            expertise=7,
+            work_with=[],
+            dont_work_with=[],
+            created_at=created_at,
+            course_id=1,
+            labels=labels[: i % 4],
+            # Comments are written one at a time, so their dates differ
+            comments=[
+                row(
+                    id=i,
+                    content="Works well with others",
+                    created_at=created_at + timedelta(minutes=i),
+                )
+            ],
+            languages=[row(id=1, name="Python"), row(id=2, name="TypeScript")],
+            frameworks=[row(id=3, name="Flask")],
+        )
+        for i in range(student_count)
+    ]
+    sections = [
+        row(
+            id=s,
+            course_id=1,
+            name=f"Section {s}",
+            course_name="Course",
+            created_at=created_at,
+            students=[student for student in students if student["section_id"] == s],
+        )
+        for s in range(3)
+    ]
+    teams = [
+        row(
+            id=t,
+            course_id=1,
+            name=f"Team {t}",
+            created_at=created_at,
+            labels=labels,
+            comments=[],
+            students=[student for student in students if student["team_id"] == t],
+        )
+        for t in range(student_count // 5)
+    ]
+
+    return row(
+        id=1,
+        owner_id="1",
+        name="Course",
+        code="CIS4592",
+        term="Fall 2025",
+        version=1,
+        created_at=created_at,
+        sections=sections,
+        teams=teams,
+    )
+
+def main() -> None:
+    app = Flask(__name__)
+    providers = {"default": DefaultJSONProvider(app), "orjson": ORJSONProvider(app)}
+
+    with app.app_context():
+        for size, student_count in SIZES.items():
+            data = course(student_count)
+
+            for name, provider in providers.items():
+                runs, total = timeit.Timer(lambda: provider.response(data)).autorange()
+                body = provider.response(data).get_data()
+
+                print(
+                    f"{size:>6} ({student_count:>3} students) {name:>7}: "
+                    f"{total / runs * 1000:8.3f} ms, {len(body):>8} bytes"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Time the overhead of per-route metrics on a request
+
+Serves the same small JSON route from an app with and without metrics through
+Flask's test client, and reports what the metrics' own overhead counter saw.
+Run from server/python with `python -m benchmarks.bench_metrics`.
+"""
+
+import timeit
+from flask import Flask
+import metrics
+
+REQUESTS = 5000
+
+
+def build(with_metrics: bool) -> Flask:
+    app = Flask(__name__)
+
+    if with_metrics:
+        metrics.init_metrics(app)
+
+    @app.route("/course/<int:course_id>")
+    def course(course_id: int):
+        return {"id": course_id, "name": "Course"}
+
+    return app
+
+
+def main() -> None:
+    for with_metrics in (False, True):
+        client = build(with_metrics).test_client()
+        seconds = min(
+            timeit.repeat(lambda: client.get("/course/1"), number=REQUESTS, repeat=3)
+        )
+        label = "with metrics" if with_metrics else "without metrics"
+        print(f"{label:16} {seconds / REQUESTS * 1e6:8.1f} us/request")
+
+    overhead = metrics.overhead_seconds.values.get((), 0)
+    print(f"overhead counter {overhead / (REQUESTS * 3) * 1e6:8.1f} us/request")
+
+    start = timeit.default_timer()
+    metrics.render()
+    print(f"render           {(timeit.default_timer() - start) * 1e3:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
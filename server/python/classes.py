@@ -55,3 +55,13 @@ class Course(TypedDict):
     term: Optional[str]
     sections: list[Section]
     created_at: str
+
+
+class NormalizedCourse(TypedDict):
+    course: dict
+    sections: dict[int, dict]
+    teams: dict[int, dict]
+    students: dict[int, dict]
+    labels: dict[int, dict]
+    comments: dict[int, dict]
+    experiences: dict[int, dict]
@@ -0,0 +1,124 @@
+"""Negotiated response compression
+
+Responses are compressed with the best encoding the client accepts, out of
+zstd, brotli and gzip. zstd and brotli are only offered when their packages
+are installed. Streamed responses are compressed chunk by chunk, everything
+else once it is at least COMPRESS_MIN_SIZE bytes.
+"""
+
+import os
+import zlib
+from typing import Callable, Iterable, Iterator
+from flask import Flask, Response, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+LEVELS = {
+    "zstd": int(os.getenv("COMPRESS_ZSTD_LEVEL", "3")),
+    "br": int(os.getenv("COMPRESS_BR_LEVEL", "5")),
+    "gzip": int(os.getenv("COMPRESS_GZIP_LEVEL", "6")),
+}
+
+
+def _gzip(chunks: Iterable[bytes], level: int) -> Iterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    for chunk in chunks:
+        # Flushing hands every chunk of a stream to the client as soon as it is ready
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    yield compressor.flush()
+
+
+def _brotli(chunks: Iterable[bytes], level: int) -> Iterator[bytes]:
+    compressor = brotli.Compressor(quality=level)
+
+    for chunk in chunks:
+        yield compressor.process(chunk) + compressor.flush()
+
+    yield compressor.finish()
+
+
+def _zstd(chunks: Iterable[bytes], level: int) -> Iterator[bytes]:
+    compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+    yield compressor.flush()
+
+
+# Encodings in the order they are preferred when the client accepts several equally
+ENCODERS: dict[str, Callable[[Iterable[bytes], int], Iterator[bytes]]] = {
+    name: encoder
+    for name, encoder, available in [
+        ("zstd", _zstd, zstandard is not None),
+        ("br", _brotli, brotli is not None),
+        ("gzip", _gzip, True),
+    ]
+    if available
+}
+
+
+def _compressible(response: Response) -> bool:
+    return (
+        request.method != "HEAD"
+        and 200 <= response.status_code < 300
+        and response.status_code != 204
+        and not response.direct_passthrough
+        and "Content-Encoding" not in response.headers
+        and (
+            response.mimetype == "application/json"
+            or response.mimetype.startswith("text/")
+        )
+    )
+
+
+def compress_response(response: Response) -> Response:
+    """Compress the response if the client accepts an encoding and it is worth it"""
+    if not _compressible(response):
+        return response
+
+    response.vary.add("Accept-Encoding")
+
+    if not response.is_streamed and response.content_length < MIN_SIZE:
+        return response
+
+    encoding = request.accept_encodings.best_match(list(ENCODERS))
+
+    if encoding is None:
+        return response
+
+    encoder = ENCODERS[encoding]
+    level = LEVELS[encoding]
+
+    if response.is_streamed:
+        response.response = encoder(response.iter_encoded(), level)
+        response.headers.pop("Content-Length", None)
+    else:
+        response.set_data(b"".join(encoder([response.get_data()], level)))
+
+    response.headers["Content-Encoding"] = encoding
+
+    # The compressed bytes differ from the uncompressed ones, so an ETag can only be weak
+    etag, weak = response.get_etag()
+
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+
+    return response
+
+
+def init_compression(app: Flask) -> None:
+    app.after_request(compress_response)
@@ -3,9 +3,14 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import get_jwt, jwt_required
 from extensions import (
     BadRequestException,
-    check_exists_and_owned,
+    NotFoundException,
+    check_not_modified,
+    check_path_owned,
+    get_read_options,
+    select_fields,
+    wants_normalized,
 )
-from services import course_services
+from services import course_services, tree_services
 
 course_controller = Blueprint("course", __name__)
 
@@ -30,13 +35,14 @@ def create_course():
 @course_controller.route("/course", methods=["GET"])
 @jwt_required()
 def list_courses():
+    load, fields = get_read_options(root_children=("sections", "teams"))
     current_user = get_jwt()
-    courses = course_services.get_courses(current_user["sub"])
+    courses = course_services.get_courses(current_user["sub"], **load)
 
-    return jsonify(courses)
+    return jsonify(select_fields(courses, fields))
 
 
-@course_controller.route("/course/<string:course_id>", methods=["PATCH"])
+@course_controller.route("/course/<int:course_id>", methods=["PATCH"])
 @jwt_required()
 def update_course(course_id: int):
     data = request.get_json()
@@ -44,28 +50,37 @@ def update_course(course_id: int):
     if not data:
         raise BadRequestException()
 
-    raw_course = course_services.get_course_by_id(course_id)
-    course = check_exists_and_owned(raw_course)
-    updated = course_services.update_course(course["id"], data)
+    check_path_owned(course_id)
+    updated = course_services.update_course(course_id, data)
 
     return jsonify(updated), 200
 
 
-@course_controller.route("/course/<string:course_id>", methods=["GET"])
+@course_controller.route("/course/<int:course_id>", methods=["GET"])
 @jwt_required()
 def get_course_id(course_id: int):
-    raw_course = course_services.get_course_by_id(course_id)
-    course = check_exists_and_owned(raw_course)
+    load, fields = get_read_options(root_children=("sections", "teams"))
+    normalized = wants_normalized()
+    check_path_owned(course_id)
+    check_not_modified(course_id, variant="normalized" if normalized else None)
+    course = course_services.get_course_by_id(course_id, **load)
 
-    return jsonify(course)
+    if course is None:
+        raise NotFoundException()
 
+    course = select_fields(course, fields)
+    resp = jsonify(tree_services.normalize_course(course) if normalized else course)
+    # The format can be negotiated through the Accept header
+    resp.vary.add("Accept")
 
-@course_controller.route("/course/<string:course_id>", methods=["DELETE"])
+    return resp
+
+
+@course_controller.route("/course/<int:course_id>", methods=["DELETE"])
 @jwt_required()
 def delete_course(course_id: int):
-    raw_course = course_services.get_course_by_id(course_id)
-    course = check_exists_and_owned(raw_course)
-    course_services.delete_course(course["id"])
+    check_path_owned(course_id)
+    course_services.delete_course(course_id)
 
     return "", 204
 
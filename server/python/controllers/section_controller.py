@@ -1,12 +1,19 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
-from extensions import BadRequestException, check_exists_and_owned
-from services import section_services, course_services
+from extensions import (
+    BadRequestException,
+    NotFoundException,
+    check_not_modified,
+    check_path_owned,
+    get_read_options,
+    select_fields,
+)
+from services import section_services
 
 section_controller = Blueprint("section", __name__)
 
 
-@section_controller.route("/course/<string:course_id>/section", methods=["POST"])
+@section_controller.route("/course/<int:course_id>/section", methods=["POST"])
 @jwt_required()
 def create_section(course_id: int):
     data = request.get_json()
@@ -15,36 +22,41 @@ def create_section(course_id: int):
     if not name:
         raise BadRequestException()
 
-    raw_course = course_services.get_course_by_id(course_id)
-    course = check_exists_and_owned(raw_course, path_parts=[course_id])
-    section = section_services.create_section(course["id"], name)
+    check_path_owned(course_id)
+    section = section_services.create_section(course_id, name)
 
     return jsonify(section), 201
 
 
-@section_controller.route("/course/<string:course_id>/section", methods=["GET"])
+@section_controller.route("/course/<int:course_id>/section", methods=["GET"])
 @jwt_required()
 def list_sections(course_id: int):
-    raw_course = course_services.get_course_by_id(course_id)
-    course = check_exists_and_owned(raw_course, path_parts=[course_id])
-    sections = section_services.get_sections_by_course(course["id"])
+    load, fields = get_read_options(root_children=("students",))
+    check_path_owned(course_id)
+    check_not_modified(course_id)
+    sections = section_services.get_sections_by_course(course_id, **load)
 
-    return jsonify(sections), 200
+    return jsonify(select_fields(sections, fields)), 200
 
 
 @section_controller.route(
-    "/course/<string:course_id>/section/<string:section_id>", methods=["GET"]
+    "/course/<int:course_id>/section/<int:section_id>", methods=["GET"]
 )
 @jwt_required()
 def get_section(course_id: int, section_id: int):
-    raw_section = section_services.get_section_by_id(section_id)
-    section = check_exists_and_owned(raw_section, path_parts=[course_id, section_id])
+    load, fields = get_read_options(root_children=("students",))
+    check_path_owned(course_id, section_id=section_id)
+    check_not_modified(course_id)
+    section = section_services.get_section_by_id(section_id, **load)
+
+    if section is None:
+        raise NotFoundException()
 
-    return jsonify(section), 200
+    return jsonify(select_fields(section, fields)), 200
 
 
 @section_controller.route(
-    "/course/<string:course_id>/section/<string:section_id>", methods=["PATCH"]
+    "/course/<int:course_id>/section/<int:section_id>", methods=["PATCH"]
 )
 @jwt_required()
 def update_section(section_id: int, course_id: int):
@@ -53,20 +65,18 @@ def update_section(section_id: int, course_id: int):
     if not data:
         raise BadRequestException()
 
-    raw_section = section_services.get_section_by_id(section_id)
-    section = check_exists_and_owned(raw_section, path_parts=[course_id, section_id])
-    updated_section = section_services.update_section(section["id"], data)
+    check_path_owned(course_id, section_id=section_id)
+    updated_section = section_services.update_section(section_id, data)
 
     return jsonify(updated_section), 200
 
 
 @section_controller.route(
-    "/course/<string:course_id>/section/<string:section_id>", methods=["DELETE"]
+    "/course/<int:course_id>/section/<int:section_id>", methods=["DELETE"]
 )
 @jwt_required()
 def delete_section(course_id: int, section_id: int):
-    raw_section = section_services.get_section_by_id(section_id)
-    section = check_exists_and_owned(raw_section, path_parts=[course_id, section_id])
-    section_services.delete_section(section["id"])
+    check_path_owned(course_id, section_id=section_id)
+    section_services.delete_section(section_id)
 
     return jsonify({"status": 204, "message": "Section deleted"}), 204
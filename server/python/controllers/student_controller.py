@@ -1,66 +1,83 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
-from psycopg2.extras import RealDictCursor
-from db.db import get_conn, put_conn
-from extensions import BadRequestException, check_exists_and_owned
-from services import course_services, section_services, student_services
+from extensions import (
+    BadRequestException,
+    NotFoundException,
+    check_not_modified,
+    check_path_owned,
+    get_read_options,
+    select_fields,
+)
+from services import student_services
 
 student_controller = Blueprint("student", __name__)
 
+STUDENT_CHILDREN = ("labels", "comments", "languages", "frameworks")
+
 
 @student_controller.route(
-    "/course/<string:course_id>/section/<string:section_id>/student", methods=["POST"]
+    "/course/<int:course_id>/section/<int:section_id>/student", methods=["POST"]
 )
 @jwt_required()
 def create_students(course_id: int, section_id: int):
-    raw_section = section_services.get_section_by_id(section_id)
-    section = check_exists_and_owned(raw_section, path_parts=[course_id, section_id])
+    check_path_owned(course_id, section_id=section_id)
 
     raw_student_data = request.get_json()
+    atomic = request.args.get("atomic", "false").lower() == "true"
 
-    # Validate shape of student data
-    for student in raw_student_data:
-        if "name" not in student:
-            raise BadRequestException()
+    if not isinstance(raw_student_data, list):
+        raise BadRequestException()
+
+    created_data, errors = student_services.create_students(
+        section_id, raw_student_data, atomic=atomic
+    )
 
-    created_data = []
+    # Nothing created is still an error, single creates rely on the 409
+    if errors and (atomic or not created_data):
+        if any(error["status"] == 400 for error in errors):
+            status, message = 400, "Bad request"
+        else:
+            status, message = 409, "Conflict"
 
-    for student in raw_student_data:
-        new_student = student_services.create_student(section["id"], student)
-        created_data.append(new_student)
+        return jsonify({"status": status, "error": message, "errors": errors}), status
+    elif errors:
+        return jsonify({"created": created_data, "errors": errors}), 207
 
     return jsonify(created_data), 201
 
 
 @student_controller.route(
-    "/course/<string:course_id>/section/<string:section_id>/student", methods=["GET"]
+    "/course/<int:course_id>/section/<int:section_id>/student", methods=["GET"]
 )
 @jwt_required()
 def list_students_by_section(course_id: int, section_id: int):
-    raw_section = section_services.get_section_by_id(section_id)
-    section = check_exists_and_owned(raw_section, path_parts=[course_id, section_id])
+    load, fields = get_read_options(root_children=STUDENT_CHILDREN)
+    check_path_owned(course_id, section_id=section_id)
+    check_not_modified(course_id)
+    students = student_services.get_students_by_section(section_id, **load)
 
-    students = student_services.get_students_by_section(section["id"])
-
-    return jsonify(students), 200
+    return jsonify(select_fields(students, fields)), 200
 
 
 @student_controller.route(
-    "/course/<string:course_id>/section/<string:section_id>/student/<string:student_id>",
+    "/course/<int:course_id>/section/<int:section_id>/student/<int:student_id>",
     methods=["GET"],
 )
 @jwt_required()
 def get_student(course_id: int, section_id: int, student_id: int):
-    raw_student = student_services.get_student_by_id(student_id)
-    student = check_exists_and_owned(
-        raw_student, path_parts=[course_id, section_id, student_id]
-    )
+    load, fields = get_read_options(root_children=STUDENT_CHILDREN)
+    check_path_owned(course_id, section_id=section_id, student_id=student_id)
+    check_not_modified(course_id)
+    student = student_services.get_student_by_id(student_id, **load)
+
+    if student is None:
+        raise NotFoundException()
 
-    return jsonify(student), 200
+    return jsonify(select_fields(student, fields)), 200
 
 
 @student_controller.route(
-    "/course/<string:course_id>/section/<string:section_id>/student/<string:student_id>",
+    "/course/<int:course_id>/section/<int:section_id>/student/<int:student_id>",
     methods=["PATCH"],
 )
 @jwt_required()
@@ -70,9 +87,7 @@ def update_student(course_id: int, section_id: int, student_id: int):
     if not data:
         raise BadRequestException()
 
-    student = student_services.get_student_by_id(student_id)
-    check_exists_and_owned(student, path_parts=[course_id, section_id, student_id])
-
+    check_path_owned(course_id, section_id=section_id, student_id=student_id)
     updated_student = student_services.update_student(student_id, data)
     return jsonify(updated_student), 200
 
@@ -82,8 +97,7 @@ def update_student(course_id: int, section_id: int, student_id: int):
 )
 @jwt_required()
 def bulk_update_students(course_id: int, section_id: int):
-    raw_section = section_services.get_section_by_id(section_id)
-    section = check_exists_and_owned(raw_section, path_parts=[course_id, section_id])
+    check_path_owned(course_id, section_id=section_id)
 
     data = request.get_json()
 
@@ -94,7 +108,7 @@ def bulk_update_students(course_id: int, section_id: int):
         if "email" not in item:
             raise BadRequestException()
 
-    changed = student_services.bulk_update_students(section["id"], data)
+    changed = student_services.bulk_update_students(section_id, data)
 
     return jsonify(changed)
 
@@ -110,66 +124,53 @@ def bulk_move_students(course_id: int):
     if not data or "moves" not in data or not isinstance(data["moves"], list):
         raise BadRequestException()
 
-    # Type enforcement for each move
+    # Type enforcement for each move, a null teamId takes the student off their team
     for move in data["moves"]:
         if (
+            not isinstance(move, dict) or
             "sectionId" not in move or
             "studentId" not in move or
             "teamId" not in move or
             not isinstance(move["sectionId"], int) or
             not isinstance(move["studentId"], int) or
-            not isinstance(move["teamId"], int)
+            not (move["teamId"] is None or isinstance(move["teamId"], int))
         ):
             raise BadRequestException()
 
-    changed = []
-    checked_sections = []
-    conn = get_conn()
-
-    try:
-        for i in range(len(data["moves"])):
-            section_id = data["moves"][i]["sectionId"]
-            student_id = data["moves"][i]["studentId"]
-            team_id = data["moves"][i]["teamId"]
-
-            if (
-                not isinstance(section_id, int) or
-                not isinstance(student_id, int) or
-                not isinstance(team_id, int)
-            ):
-                raise BadRequestException()
-
-            # Optimization to prevent rechecking previously authorized sections
-            if section_id not in checked_sections:
-                raw_section = section_services.get_section_by_id(section_id)
-                check_exists_and_owned(raw_section, path_parts=[course_id, section_id])
-                checked_sections.append(section_id)
-
-            changed.append(student_services.update_student(
-                student_id=student_id,
-                data={
-                    "team_id": team_id
-                },
-                conn=conn,
-            ))
-
-        conn.commit()
-    finally:
-        put_conn(conn)
+    check_path_owned(course_id)
+
+    full = request.args.get("full", "false").lower() == "true"
+    changed = student_services.move_students(course_id, data["moves"], full=full)
 
     return jsonify(changed)
 
 
 @student_controller.route(
-    "/course/<string:course_id>/section/<string:section_id>/student/<string:student_id>",
+    "/course/<int:course_id>/section/<int:section_id>/student/<int:student_id>",
     methods=["DELETE"],
 )
 @jwt_required()
 def delete_student(course_id: int, section_id: int, student_id: int):
-    raw_student = student_services.get_student_by_id(student_id)
-    student = check_exists_and_owned(
-        raw_student, path_parts=[course_id, section_id, student_id]
-    )
-
-    student_services.delete_student(student["id"])
+    check_path_owned(course_id, section_id=section_id, student_id=student_id)
+    student_services.delete_student(student_id)
     return jsonify({"status": 204, "message": "Student deleted"}), 204
+
+
+@student_controller.route(
+    "/course/<int:course_id>/section/<int:section_id>/student", methods=["DELETE"]
+)
+@jwt_required()
+def bulk_delete_students(course_id: int, section_id: int):
+    data = request.get_json()
+
+    if (
+        not data or
+        not isinstance(data.get("ids"), list) or
+        not all(isinstance(student_id, int) for student_id in data["ids"])
+    ):
+        raise BadRequestException()
+
+    check_path_owned(course_id, section_id=section_id)
+    deleted = student_services.delete_students(section_id, data["ids"])
+
+    return jsonify(deleted), 200
@@ -1,12 +1,17 @@
+import re
 import pytest
+from unittest.mock import MagicMock, patch
 from ...app import app
 from flask import Flask
 from flask_jwt_extended import create_access_token
+from db import query_log, queries
+from services.ownership_services import ownership_cache
 
 
 @pytest.fixture()
 def test_app():
     app.config["SECRET_KEY"] = "boo"
+    ownership_cache.clear()
 
     with app.app_context():
         yield app
@@ -24,3 +29,86 @@ def test_client(test_app):
     client.environ_base["HTTP_AUTHORIZATION"] = f"Bearer {token}"
 
     return client
+
+
+@pytest.fixture(autouse=True)
+def mock_get_course_version():
+    # Conditional GETs look up the course version before anything else
+    with patch("services.course_services.get_course_version") as mock:
+        mock.return_value = 1
+        yield mock
+
+
+def normalize(statement: str) -> str:
+    return " ".join(statement.split())
+
+
+class FakeDB:
+    """Answers statements with canned rows and counts what runs
+
+    Set `rows[name]` to what the registered statement called `name` returns,
+    or `rows[sql]` to what the statement `sql` returns when it isn't registered.
+    Unregistered statements must match whole, ignoring whitespace, and the
+    rows built by execute_values stand in as the `VALUES %s` they replaced.
+    Anything without rows returns none. Statements are recorded to the active
+    query logs like they are on a real connection, so `query_budget` sees them.
+    """
+
+    # What the fake mogrify renders every execute_values row as
+    ROW = "\x00"
+
+    def __init__(self):
+        self.rows: dict[str, list[dict]] = {}
+        self.conn = MagicMock()
+        cur = self.conn.cursor.return_value.__enter__.return_value
+        cur.execute.side_effect = self.execute
+        cur.fetchall.side_effect = lambda: list(self.result)
+        cur.fetchone.side_effect = lambda: self.result[0] if self.result else None
+        # What execute_values needs to build its statement
+        cur.connection.encoding = "UTF8"
+        cur.mogrify.side_effect = lambda template, args: self.ROW.encode()
+        self.result: list[dict] = []
+
+    def execute(self, statement: str | bytes, params=None) -> None:
+        if isinstance(statement, bytes):
+            statement = statement.decode()
+
+        names = {query.sql: name for name, query in queries.QUERIES.items()}
+        text = re.sub(f"{self.ROW}(,{self.ROW})*", "%s", normalize(statement))
+        query_log.record(text, 0.0)
+
+        if statement in names:
+            self.result = self.rows.get(names[statement], [])
+        else:
+            statements = {normalize(sql): rows for sql, rows in self.rows.items()}
+            self.result = statements.get(text, [])
+
+
+@pytest.fixture()
+def make_students():
+    """Build student rows as the database returns them, `fields` overrides every row"""
+
+    def make(count: int, **fields) -> list[dict]:
+        return [
+            {
+                "id": i,
+                "section_id": 1,
+                "team_id": None,
+                "name": f"S{i}",
+                "email": f"s{i}@test.com",
+                **fields,
+            }
+            for i in range(1, count + 1)
+        ]
+
+    return make
+
+
+@pytest.fixture()
+def fake_db():
+    """Serve the request's connection from a FakeDB instead of Postgres"""
+    db = FakeDB()
+
+    with patch("db.db.get_pool") as mock_get_pool:
+        mock_get_pool.return_value.getconn.return_value = db.conn
+        yield db
@@ -0,0 +1,16 @@
+from ...app import create_app
+
+
+def test_create_app_is_independent():
+    first = create_app()
+    second = create_app()
+
+    assert first is not second
+    assert {rule.rule for rule in first.url_map.iter_rules()} == {
+        rule.rule for rule in second.url_map.iter_rules()
+    }
+
+    resp = first.test_client().get("/")
+
+    assert resp.status_code == 200
+    assert resp.get_json() == {"status": "ok", "service": "CRM Flask API"}
@@ -0,0 +1,110 @@
+import asyncio
+import gzip
+import json
+from unittest.mock import patch
+from flask_jwt_extended import create_access_token
+from ... import asgi
+
+
+def request(path: str, headers: dict[str, str] | None = None) -> tuple[int, dict, bytes]:
+    """Run a GET through the ASGI app, and return its status, headers and body"""
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "query_string": query.encode(),
+        "headers": [
+            (name.lower().encode(), value.encode()) for name, value in (headers or {}).items()
+        ],
+        "root_path": "",
+        "scheme": "http",
+        "server": ("testserver", 80),
+        "client": ("127.0.0.1", 50000),
+        "http_version": "1.1",
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(asgi.application(scope, receive, send))
+    response_headers = {
+        name.decode().lower(): value.decode() for name, value in messages[0]["headers"]
+    }
+
+    return (
+        messages[0]["status"],
+        response_headers,
+        b"".join(m.get("body", b"") for m in messages[1:]),
+    )
+
+
+def authorization() -> dict[str, str]:
+    asgi.flask_app.config["JWT_SECRET_KEY"] = "test-secret"
+
+    with asgi.flask_app.app_context():
+        return {"Authorization": f"Bearer {create_access_token(identity='1')}"}
+
+
+def course(course_id, **load):
+    students = [{"id": i, "section_id": 3, "name": f"Student {i}"} for i in range(50)]
+
+    return {"id": course_id, "name": "Course 1", "sections": [{"id": 3, "students": students}]}
+
+
+@patch("controllers.course_controller.course_services")
+@patch("services.ownership_services.get_path_owner")
+def test_get_course_goes_through_flask(mock_get_path_owner, mock_course_services):
+    mock_get_path_owner.return_value = "1"
+    mock_course_services.get_course_by_id.side_effect = course
+    headers = {**authorization(), "Accept-Encoding": "gzip"}
+
+    status, response_headers, body = request("/course/1", headers)
+
+    # Compressed, tagged and varied like every other Flask response
+    assert status == 200
+    assert response_headers["content-encoding"] == "gzip"
+    assert response_headers["etag"] == 'W/"course-1-v1"'
+    assert "Accept" in response_headers["vary"]
+    assert json.loads(gzip.decompress(body))["sections"][0]["students"][0]["id"] == 0
+
+    status, _, body = request(
+        "/course/1", {**headers, "If-None-Match": response_headers["etag"]}
+    )
+
+    assert status == 304
+    assert body == b""
+    mock_course_services.get_course_by_id.assert_called_once()
+
+
+@patch("controllers.course_controller.course_services")
+@patch("services.ownership_services.get_path_owner")
+def test_get_course_normalized(mock_get_path_owner, mock_course_services):
+    mock_get_path_owner.return_value = "1"
+    mock_course_services.get_course_by_id.side_effect = course
+
+    status, _, body = request("/course/1?format=normalized", authorization())
+
+    assert status == 200
+    assert json.loads(body)["course"]["sections"] == [3]
+
+    status, _, _ = request("/course/1?format=xml", authorization())
+
+    assert status == 400
+
+
+def test_missing_token():
+    status, _, _ = request("/course")
+
+    assert status == 401
+
+
+def test_other_routes_go_to_flask():
+    status, _, body = request("/")
+
+    assert status == 200
+    assert b"CRM Flask API" in body
@@ -0,0 +1,76 @@
+import gzip
+import pytest
+from flask import Flask, Response, jsonify
+from ... import compression
+
+app = Flask(__name__)
+compression.init_compression(app)
+
+ROWS = [{"id": i, "labels": [{"name": "Needs help", "color": "#ff0000"}]} for i in range(100)]
+
+
+@app.route("/large")
+def large():
+    return jsonify(ROWS)
+
+
+@app.route("/small")
+def small():
+    return jsonify({"id": 1})
+
+
+@app.route("/stream")
+def stream():
+    return Response((f"{i}\n" for i in range(1000)), mimetype="text/plain")
+
+
+def test_compresses_large_responses():
+    resp = app.test_client().get("/large", headers={"Accept-Encoding": "gzip"})
+
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in resp.headers["Vary"]
+    assert int(resp.headers["Content-Length"]) < len(jsonify_bytes())
+    assert gzip.decompress(resp.data) == jsonify_bytes()
+
+
+def test_leaves_small_responses_alone():
+    resp = app.test_client().get("/small", headers={"Accept-Encoding": "gzip"})
+
+    assert "Content-Encoding" not in resp.headers
+    assert resp.get_json() == {"id": 1}
+
+
+def test_needs_an_accepted_encoding():
+    client = app.test_client()
+
+    for accept in [None, "identity", "compress", "gzip;q=0"]:
+        headers = {"Accept-Encoding": accept} if accept else {}
+        resp = client.get("/large", headers=headers)
+
+        assert "Content-Encoding" not in resp.headers
+        assert resp.get_json() == ROWS
+
+
+def test_compresses_streams():
+    resp = app.test_client().get("/stream", headers={"Accept-Encoding": "gzip"})
+
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in resp.headers
+    assert gzip.decompress(resp.data) == "".join(f"{i}\n" for i in range(1000)).encode()
+
+
+@pytest.mark.parametrize("encoding", ["br", "zstd"])
+def test_prefers_better_encodings(encoding):
+    if encoding not in compression.ENCODERS:
+        pytest.skip(f"{encoding} is not installed")
+
+    resp = app.test_client().get(
+        "/large", headers={"Accept-Encoding": f"gzip, {encoding}"}
+    )
+
+    assert resp.headers["Content-Encoding"] == encoding
+
+
+def jsonify_bytes() -> bytes:
+    with app.app_context():
+        return jsonify(ROWS).get_data()
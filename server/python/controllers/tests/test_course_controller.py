@@ -0,0 +1,134 @@
+import pytest
+from unittest.mock import patch
+from flask.testing import FlaskClient
+from db.query_log import query_budget
+
+
+def courses():
+    return [
+        {"id": 1, "owner_id": "1", "name": "Course 1", "code": "TST0000", "term": None},
+        {"id": 2, "owner_id": "1", "name": "Course 2", "code": "TST0001", "term": None},
+    ]
+
+
+@patch("controllers.course_controller.course_services")
+def test_list_courses_full_by_default(mock_course_services, test_client: FlaskClient):
+    mock_course_services.get_courses.return_value = courses()
+
+    resp = test_client.get("/course")
+
+    assert resp.status_code == 200
+    mock_course_services.get_courses.assert_called_once_with(
+        "1", depth=None, include=None
+    )
+    assert resp.get_json() == courses()
+
+
+@patch("controllers.course_controller.course_services")
+def test_list_courses_fields_skips_children(
+    mock_course_services, test_client: FlaskClient
+):
+    mock_course_services.get_courses.return_value = courses()
+
+    resp = test_client.get("/course?fields=name")
+
+    assert resp.status_code == 200
+    # No child collection was asked for, so none are loaded
+    mock_course_services.get_courses.assert_called_once_with(
+        "1", depth=0, include=None
+    )
+    assert resp.get_json() == [
+        {"id": 1, "name": "Course 1"},
+        {"id": 2, "name": "Course 2"},
+    ]
+
+
+@patch("controllers.course_controller.course_services")
+def test_list_courses_depth_and_include(
+    mock_course_services, test_client: FlaskClient
+):
+    mock_course_services.get_courses.return_value = courses()
+
+    resp = test_client.get("/course?depth=2&include=sections,students")
+
+    assert resp.status_code == 200
+    mock_course_services.get_courses.assert_called_once_with(
+        "1", depth=2, include={"sections", "students"}
+    )
+
+
+@patch("controllers.course_controller.course_services")
+def test_list_courses_bad_options(mock_course_services, test_client: FlaskClient):
+    for query in ["depth=-1", "depth=all", "include=sections,grades"]:
+        resp = test_client.get(f"/course?{query}")
+
+        assert resp.status_code == 400
+
+    mock_course_services.get_courses.assert_not_called()
+
+
+@patch("controllers.course_controller.course_services")
+@patch("services.ownership_services.get_path_owner")
+def test_get_course_normalized(
+    mock_get_path_owner, mock_course_services, test_client: FlaskClient
+):
+    def course(course_id, **load):
+        student = {"id": 5, "section_id": 3, "labels": [{"id": 9, "name": "L"}]}
+
+        return {
+            "id": course_id,
+            "name": "Course 1",
+            "sections": [{"id": 3, "students": [student]}],
+            "teams": [{"id": 4, "students": [student]}],
+        }
+
+    mock_get_path_owner.return_value = "1"
+    mock_course_services.get_course_by_id.side_effect = course
+
+    for headers, query in [
+        ({}, "?format=normalized"),
+        ({"Accept": "application/json; profile=normalized"}, ""),
+    ]:
+        resp = test_client.get(f"/course/1{query}", headers=headers)
+
+        assert resp.status_code == 200
+        assert resp.get_json() == {
+            "course": {"id": 1, "name": "Course 1", "sections": [3], "teams": [4]},
+            "sections": {"3": {"id": 3, "students": [5]}},
+            "teams": {"4": {"id": 4, "students": [5]}},
+            "students": {"5": {"id": 5, "section_id": 3, "labels": [9]}},
+            "labels": {"9": {"id": 9, "name": "L"}},
+            "comments": {},
+            "experiences": {},
+        }
+        assert "Accept" in resp.headers["Vary"]
+        # Each format has its own ETag
+        assert resp.headers["ETag"] == 'W/"course-1-v1-normalized"'
+
+    resp = test_client.get("/course/1")
+
+    assert "sections" in resp.get_json()
+    assert resp.headers["ETag"] == 'W/"course-1-v1"'
+
+    assert test_client.get("/course/1?format=xml").status_code == 400
+
+
+@pytest.mark.parametrize("student_count", [1, 50])
+def test_get_course_query_budget(fake_db, test_client: FlaskClient, student_count: int):
+    fake_db.rows = {
+        "path_owner": [{"owner_id": "1"}],
+        "course_by_id": [courses()[0]],
+        "sections_by_courses": [{"id": 1, "course_id": 1, "name": "A"}],
+        "teams_by_courses": [{"id": 1, "course_id": 1, "name": "Team 1"}],
+        "students_by_sections_or_teams": [
+            {"id": i, "section_id": 1, "team_id": 1, "course_id": 1, "name": f"S{i}"}
+            for i in range(1, student_count + 1)
+        ],
+    }
+
+    # One statement per collection, however many students the course has
+    with query_budget(10, max_repeats=1):
+        resp = test_client.get("/course/1")
+
+    assert resp.status_code == 200
+    assert len(resp.get_json()["sections"][0]["students"]) == student_count
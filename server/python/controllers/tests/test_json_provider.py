@@ -0,0 +1,52 @@
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from psycopg2.extras import RealDictRow
+from ...json_provider import ORJSONProvider
+
+
+def student() -> RealDictRow:
+    row = RealDictRow()
+    row.update(
+        {
+            "name": "Zoë",
+            "id": 1,
+            "created_at": datetime(2025, 9, 1, 12, 30, tzinfo=timezone.utc),
+            "grade": Decimal("3.5"),
+            "labels": [{"name": "L", "id": 3}],
+            "work_with": [],
+        }
+    )
+    return row
+
+
+def test_same_json_as_the_default_provider():
+    app = Flask(__name__)
+    data = {"students": [student()]}
+
+    fast = ORJSONProvider(app).dumps(data)
+    default = DefaultJSONProvider(app).dumps(data)
+
+    assert json.loads(fast) == json.loads(default)
+    assert json.loads(fast)["students"][0]["created_at"] == "Mon, 01 Sep 2025 12:30:00 GMT"
+    # Keys stay sorted
+    assert fast.index('"created_at"') < fast.index('"grade"') < fast.index('"id"')
+
+
+def test_response_is_compact_outside_debug():
+    app = Flask(__name__)
+    app.json = ORJSONProvider(app)
+
+    with app.app_context():
+        assert app.json.response({"b": 1, "a": [1, 2]}).get_data() == b'{"a":[1,2],"b":1}\n'
+
+        app.debug = True
+        assert b"\n  " in app.json.response({"a": 1}).get_data()
+
+
+def test_loads():
+    app = Flask(__name__)
+
+    assert ORJSONProvider(app).loads(b'{"a": [1, "\\u00e9"]}') == {"a": [1, "é"]}
@@ -0,0 +1,148 @@
+import os
+import re
+import pytest
+from unittest.mock import patch
+from flask.testing import FlaskClient
+import metrics
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    for metric in metrics.REQUEST_METRICS:
+        metric.values.clear()
+
+
+@pytest.fixture(autouse=True)
+def metrics_token():
+    with patch.object(metrics, "METRICS_TOKEN", "secret"):
+        yield
+
+
+def scrape(test_client: FlaskClient) -> str:
+    resp = test_client.get("/metrics", headers={"Authorization": "Bearer secret"})
+    assert resp.status_code == 200
+
+    return resp.get_data(as_text=True)
+
+
+def sample(body: str, name: str, **labels: str) -> float | None:
+    """The value of one sample in an exposition, None when it isn't there"""
+    for line in body.splitlines():
+        match = re.fullmatch(r"(\w+)(?:\{(.*)\})? (\S+)", line)
+
+        if match is None or match.group(1) != name:
+            continue
+
+        found = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', match.group(2) or ""))
+
+        if all(found.get(key) == value for key, value in labels.items()):
+            return float(match.group(3))
+
+    return None
+
+
+@patch("controllers.course_controller.course_services")
+def test_counts_requests_by_route(mock_course_services, test_client: FlaskClient):
+    mock_course_services.get_courses.return_value = []
+
+    test_client.get("/course")
+    test_client.get("/course")
+    test_client.get("/course?depth=nope")
+    body = scrape(test_client)
+
+    route = {"blueprint": "course", "route": "/course", "method": "GET"}
+    assert sample(body, "http_requests_total", **route, status="2xx") == 2
+    assert sample(body, "http_requests_total", **route, status="4xx") == 1
+    assert sample(body, "http_request_duration_seconds_count", **route) == 3
+    assert sample(body, "http_request_duration_seconds_bucket", **route, le="+Inf") == 3
+    assert sample(body, "http_response_size_bytes_count", **route) == 3
+    assert sample(body, "http_request_db_queries_total", **route) == 0
+    # Scrapes don't count themselves
+    assert sample(body, "http_requests_total", route="/metrics") is None
+    assert "# TYPE http_request_duration_seconds histogram" in body
+    assert sample(body, "metrics_overhead_seconds_total") > 0
+
+
+@patch("controllers.course_controller.course_services")
+def test_counts_unhandled_exceptions(mock_course_services, test_client: FlaskClient):
+    mock_course_services.get_courses.side_effect = RuntimeError("boom")
+
+    assert test_client.get("/course").status_code == 500
+    body = scrape(test_client)
+
+    assert sample(body, "http_request_exceptions_total", exception="RuntimeError") == 1
+    assert sample(body, "http_requests_total", route="/course", status="5xx") == 1
+
+
+@patch("controllers.course_controller.course_services")
+def test_scrapes_serve_every_worker(mock_course_services, test_client: FlaskClient, tmp_path):
+    mock_course_services.get_courses.return_value = []
+    route = {"route": "/course", "status": "2xx"}
+
+    with patch.object(metrics, "METRICS_DIR", str(tmp_path)):
+        metrics.clear_snapshots()
+
+        # Another worker serves two requests and flushes its snapshot
+        with patch.object(metrics.os, "getpid", return_value=111):
+            test_client.get("/course")
+            test_client.get("/course")
+            metrics.write_snapshot()
+
+        # This worker has only served its own request
+        for metric in metrics.REQUEST_METRICS:
+            metric.values.clear()
+
+        test_client.get("/course")
+        own = str(os.getpid())
+
+        # Whichever worker takes the scrape serves both
+        body = scrape(test_client)
+        assert sample(body, "http_requests_total", **route, pid="111") == 2
+        assert sample(body, "http_requests_total", **route, pid=own) == 1
+        assert sample(body, "http_request_duration_seconds_count", pid="111") == 2
+
+        # Once it exits its series are gone rather than reset
+        metrics.remove_snapshot(111)
+        body = scrape(test_client)
+        assert sample(body, "http_requests_total", **route, pid="111") is None
+        assert sample(body, "http_requests_total", **route, pid=own) == 1
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("t_seconds", "Test", (0.1, 1))
+
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe((("route", 'a"b'),), value)
+
+    assert list(histogram.render())[2:] == [
+        't_seconds_bucket{route="a\\"b",le="0.1"} 2',
+        't_seconds_bucket{route="a\\"b",le="1"} 3',
+        't_seconds_bucket{route="a\\"b",le="+Inf"} 4',
+        't_seconds_sum{route="a\\"b"} 3.65',
+        't_seconds_count{route="a\\"b"} 4',
+    ]
+
+
+def test_metrics_token(test_client: FlaskClient):
+    resp = test_client.get("/metrics", headers={"Authorization": "Bearer secret"})
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/plain"
+
+    assert test_client.get("/metrics").status_code == 403
+    resp = test_client.get("/metrics", headers={"Authorization": "Bearer wrong"})
+    assert resp.status_code == 403
+
+
+def test_metrics_through_proxy(test_client: FlaskClient):
+    # Caddy and the published port both connect from the Docker network
+    proxied = {"REMOTE_ADDR": "172.18.0.3", "HTTP_X_FORWARDED_FOR": "8.8.8.8"}
+
+    assert test_client.get("/metrics", environ_base=proxied).status_code == 403
+
+
+def test_metrics_off_without_token(test_client: FlaskClient):
+    with patch.object(metrics, "METRICS_TOKEN", None):
+        assert test_client.get("/metrics").status_code == 403
+        resp = test_client.get("/metrics", headers={"Authorization": "Bearer "})
+
+    assert resp.status_code == 403
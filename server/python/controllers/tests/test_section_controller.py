@@ -0,0 +1,190 @@
+import pytest
+from unittest.mock import patch
+from flask.testing import FlaskClient
+from psycopg2.errors import ForeignKeyViolation
+from db.query_log import query_budget
+from services.ownership_services import ownership_cache
+
+
+@patch("controllers.section_controller.section_services")
+@patch("services.ownership_services.get_path_owner")
+def test_get_section_owned(
+    mock_get_path_owner,
+    mock_section_services,
+    test_client: FlaskClient,
+):
+    section = {"id": 2, "course_id": 1, "name": "Section A", "students": []}
+    mock_get_path_owner.return_value = "1"
+    mock_section_services.get_section_by_id.return_value = section
+
+    resp = test_client.get("/course/1/section/2")
+
+    assert resp.status_code == 200
+    mock_get_path_owner.assert_called_once_with(
+        1, section_id=2, student_id=None, team_id=None
+    )
+    assert resp.get_json() == section
+
+
+@patch("controllers.section_controller.section_services")
+@patch("services.ownership_services.get_path_owner")
+def test_get_section_not_owned(
+    mock_get_path_owner,
+    mock_section_services,
+    test_client: FlaskClient,
+):
+    mock_get_path_owner.return_value = "2"
+
+    resp = test_client.get("/course/1/section/2")
+
+    assert resp.status_code == 403
+    # Nothing is loaded for a path the user doesn't own
+    mock_section_services.get_section_by_id.assert_not_called()
+
+
+@patch("controllers.section_controller.section_services")
+@patch("services.ownership_services.get_path_owner")
+def test_get_section_wrong_course(
+    mock_get_path_owner,
+    mock_section_services,
+    test_client: FlaskClient,
+):
+    mock_get_path_owner.return_value = None
+
+    resp = test_client.get("/course/1/section/2")
+
+    assert resp.status_code == 404
+    mock_section_services.get_section_by_id.assert_not_called()
+
+
+@patch("controllers.section_controller.section_services")
+@patch("services.ownership_services.get_path_owner")
+def test_get_section_ownership_cached(
+    mock_get_path_owner,
+    mock_section_services,
+    test_client: FlaskClient,
+):
+    mock_get_path_owner.return_value = "1"
+    mock_section_services.get_section_by_id.return_value = {"id": 2, "course_id": 1}
+
+    for _ in range(3):
+        resp = test_client.get("/course/1/section/2")
+        assert resp.status_code == 200
+
+    # Only the first request has to resolve ownership from the database
+    mock_get_path_owner.assert_called_once()
+
+    # Deleting the section drops it from the cache
+    mock_section_services.delete_section.side_effect = (
+        lambda section_id: ownership_cache.invalidate_sections([section_id])
+    )
+    test_client.delete("/course/1/section/2")
+    mock_get_path_owner.return_value = None
+
+    resp = test_client.get("/course/1/section/2")
+    assert resp.status_code == 404
+
+
+@patch("controllers.section_controller.section_services")
+@patch("services.ownership_services.get_path_owner")
+def test_get_section_not_modified(
+    mock_get_path_owner,
+    mock_section_services,
+    mock_get_course_version,
+    test_client: FlaskClient,
+):
+    mock_get_path_owner.return_value = "1"
+    mock_get_course_version.return_value = 7
+    mock_section_services.get_section_by_id.return_value = {"id": 2, "course_id": 1}
+
+    resp = test_client.get("/course/1/section/2")
+
+    assert resp.status_code == 200
+    etag = resp.headers["ETag"]
+    assert etag == 'W/"course-1-v7"'
+    assert set(resp.vary) >= {"Accept", "Accept-Encoding"}
+
+    resp = test_client.get("/course/1/section/2", headers={"If-None-Match": etag})
+
+    # The course hasn't changed, so nothing under it is loaded again
+    assert resp.status_code == 304
+    assert resp.headers["ETag"] == etag
+    assert set(resp.vary) >= {"Accept", "Accept-Encoding"}
+    assert resp.data == b""
+    mock_section_services.get_section_by_id.assert_called_once()
+
+    # A write under the course bumped its version
+    mock_get_course_version.return_value = 8
+    resp = test_client.get("/course/1/section/2", headers={"If-None-Match": etag})
+
+    assert resp.status_code == 200
+    assert resp.headers["ETag"] == 'W/"course-1-v8"'
+
+
+@patch("controllers.section_controller.section_services")
+@patch("services.ownership_services.get_path_owner")
+def test_not_modified_needs_ownership(
+    mock_get_path_owner,
+    mock_section_services,
+    test_client: FlaskClient,
+):
+    mock_get_path_owner.return_value = "2"
+
+    resp = test_client.get(
+        "/course/1/section/2", headers={"If-None-Match": 'W/"course-1-v1"'}
+    )
+
+    assert resp.status_code == 403
+
+
+
+def test_writes_under_a_section_deleted_by_another_worker(fake_db, test_client: FlaskClient):
+    # Another worker deleted the section, this one still has it cached as owned
+    ownership_cache.add("1", 1, section_id=2)
+
+    # The UPDATE matches no row
+    resp = test_client.patch("/course/1/section/2", json={"name": "B"})
+    assert resp.status_code == 404
+
+    # The INSERT references a section that is gone
+    fake_db.conn.cursor.return_value.__enter__.return_value.execute.side_effect = (
+        ForeignKeyViolation()
+    )
+    resp = test_client.post("/course/1/section/2/student", json=[{"name": "S"}])
+    assert resp.status_code == 404
+
+
+SECTION = {"id": 2, "course_id": 1, "name": "Section A"}
+
+
+@pytest.mark.parametrize("student_count", [1, 50])
+@pytest.mark.parametrize(
+    "path, rows",
+    [
+        (
+            "/course/1/section/2",
+            {"path_owner_section": [{"owner_id": "1"}], "section_by_id": [SECTION]},
+        ),
+        (
+            "/course/1/section",
+            {"path_owner": [{"owner_id": "1"}], "sections_by_course": [SECTION]},
+        ),
+    ],
+    ids=["get", "list"],
+)
+def test_get_query_budget(
+    fake_db, make_students, test_client: FlaskClient, path, rows, student_count: int
+):
+    fake_db.rows = {
+        **rows,
+        "students_by_sections_or_teams": make_students(student_count, section_id=2),
+    }
+
+    # One statement per collection, however many students the section has
+    with query_budget(6, max_repeats=1):
+        resp = test_client.get(path)
+
+    assert resp.status_code == 200
+    sections = resp.get_json()
+    section = sections[0] if isinstance(sections, list) else sections
+    assert len(section["students"]) == student_count
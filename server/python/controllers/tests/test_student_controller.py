@@ -1,5 +1,7 @@
+import pytest
 from unittest.mock import MagicMock, patch
 from flask.testing import FlaskClient
+from db.query_log import query_budget
 
 
 def payload(times: int):
@@ -8,20 +10,15 @@ def payload(times: int):
     ]
 
 
-@patch("controllers.student_controller.check_exists_and_owned")
+@patch("controllers.student_controller.check_path_owned")
 @patch("controllers.student_controller.student_services")
-@patch("controllers.student_controller.section_services")
 def test_bulk_update_route(
-    mock_section_services,
     mock_student_services,
-    mock_check_exists_and_owned,
+    mock_check_path_owned,
     test_client,
 ):
-    raw_section = {"id": 1, "name": "Example Section", "course_id": 1}
-    mock_section_services.get_section_by_id.return_value = raw_section
     mock_student_services.bulk_update_students = MagicMock()
     mock_student_services.bulk_update_students.return_value = payload(10)
-    mock_check_exists_and_owned.return_value = raw_section
 
     resp = test_client.patch(
         "/course/1/section/1/student",
@@ -29,7 +26,323 @@ def test_bulk_update_route(
     )
     resp_data = resp.get_json()
 
+    # Make sure the ownership of the path was checked
+    mock_check_path_owned.assert_called_once_with(1, section_id=1)
     # Make sure the controller is just spitting back what the service sends
     assert len(resp_data) == 10
     # Make sure the request was successful
     assert resp.status_code == 200
+
+
+@patch("controllers.student_controller.check_path_owned")
+@patch("controllers.student_controller.student_services")
+def test_create_students_route(
+    mock_student_services,
+    mock_check_path_owned,
+    test_client,
+):
+    mock_student_services.create_students.return_value = ([{"id": 1}, {"id": 2}], [])
+
+    resp = test_client.post(
+        "/course/1/section/1/student",
+        json=[{"name": "Trent Reed"}, {"name": "Isaac Maddox"}],
+    )
+
+    mock_check_path_owned.assert_called_once_with(1, section_id=1)
+    mock_student_services.create_students.assert_called_once_with(
+        1, [{"name": "Trent Reed"}, {"name": "Isaac Maddox"}], atomic=False
+    )
+    assert resp.status_code == 201
+    assert resp.get_json() == [{"id": 1}, {"id": 2}]
+
+
+@patch("controllers.student_controller.check_path_owned")
+@patch("controllers.student_controller.student_services")
+def test_create_students_route_partial(
+    mock_student_services,
+    mock_check_path_owned,
+    test_client,
+):
+    errors = [{"index": 1, "status": 400, "error": "Missing name"}]
+    mock_student_services.create_students.return_value = ([{"id": 1}], errors)
+
+    resp = test_client.post(
+        "/course/1/section/1/student",
+        json=[{"name": "Trent Reed"}, {}],
+    )
+
+    assert resp.status_code == 207
+    assert resp.get_json() == {"created": [{"id": 1}], "errors": errors}
+
+
+@patch("controllers.student_controller.check_path_owned")
+@patch("controllers.student_controller.student_services")
+def test_create_students_route_none_created(
+    mock_student_services,
+    mock_check_path_owned,
+    test_client,
+):
+    errors = [{"index": 0, "status": 409, "error": "Conflict"}]
+    mock_student_services.create_students.return_value = ([], errors)
+
+    resp = test_client.post(
+        "/course/1/section/1/student",
+        json=[{"name": "Trent Reed", "email": "trent@test.com"}],
+    )
+
+    # A single create of a duplicate email fails like it did before partial success
+    assert resp.status_code == 409
+    assert resp.get_json() == {"status": 409, "error": "Conflict", "errors": errors}
+
+
+@patch("controllers.student_controller.check_path_owned")
+@patch("controllers.student_controller.student_services")
+def test_create_students_route_atomic(
+    mock_student_services,
+    mock_check_path_owned,
+    test_client,
+):
+    errors = [{"index": 0, "status": 409, "error": "Conflict"}]
+    mock_student_services.create_students.return_value = ([], errors)
+
+    resp = test_client.post(
+        "/course/1/section/1/student?atomic=true",
+        json=[{"name": "Trent Reed", "email": "trent@test.com"}],
+    )
+
+    mock_student_services.create_students.assert_called_once_with(
+        1, [{"name": "Trent Reed", "email": "trent@test.com"}], atomic=True
+    )
+    assert resp.status_code == 409
+    assert resp.get_json()["errors"] == errors
+
+
+@patch("controllers.student_controller.check_path_owned")
+@patch("controllers.student_controller.student_services")
+def test_move_students_route(
+    mock_student_services,
+    mock_check_path_owned,
+    test_client,
+):
+    moves = [
+        {"sectionId": 1, "studentId": 1, "teamId": 2},
+        {"sectionId": 1, "studentId": 2, "teamId": None},
+    ]
+    mock_student_services.move_students.return_value = [{"studentId": 1, "teamId": 2}]
+
+    resp = test_client.patch("/course/1/section/move_students", json={"moves": moves})
+
+    mock_check_path_owned.assert_called_once_with(1)
+    mock_student_services.move_students.assert_called_once_with(1, moves, full=False)
+    assert resp.status_code == 200
+    assert resp.get_json() == [{"studentId": 1, "teamId": 2}]
+
+
+@patch("controllers.student_controller.check_path_owned")
+@patch("controllers.student_controller.student_services")
+def test_move_students_route_invalid(
+    mock_student_services,
+    mock_check_path_owned,
+    test_client,
+):
+    resp = test_client.patch(
+        "/course/1/section/move_students",
+        json={"moves": [{"sectionId": 1, "studentId": "1", "teamId": 2}]},
+    )
+
+    mock_student_services.move_students.assert_not_called()
+    assert resp.status_code == 400
+
+
+@patch("controllers.student_controller.check_path_owned")
+@patch("controllers.student_controller.student_services")
+def test_bulk_delete_students_route(
+    mock_student_services,
+    mock_check_path_owned,
+    test_client,
+):
+    mock_student_services.delete_students.return_value = [1, 2]
+
+    resp = test_client.delete("/course/1/section/1/student", json={"ids": [1, 2, 3]})
+
+    mock_check_path_owned.assert_called_once_with(1, section_id=1)
+    mock_student_services.delete_students.assert_called_once_with(1, [1, 2, 3])
+    assert resp.status_code == 200
+    assert resp.get_json() == [1, 2]
+
+
+@patch("controllers.student_controller.student_services")
+def test_get_student_include_takes_field_names(
+    mock_student_services, test_client: FlaskClient
+):
+    mock_student_services.get_student_by_id.return_value = {"id": 1, "name": "S"}
+
+    with patch("controllers.student_controller.check_path_owned"):
+        resp = test_client.get("/course/1/section/1/student/1?include=languages,labels")
+
+    assert resp.status_code == 200
+    # languages and frameworks both come out of the experiences load
+    mock_student_services.get_student_by_id.assert_called_once_with(
+        1, depth=None, include={"experiences", "labels"}
+    )
+
+
+
+@pytest.mark.parametrize("student_count", [1, 50])
+@pytest.mark.parametrize(
+    "path, owner, statement",
+    [
+        ("/course/1/section/1/student", "path_owner_section", "students_by_section"),
+        (
+            "/course/1/section/1/student/1",
+            "path_owner_section_student",
+            "student_by_id",
+        ),
+    ],
+    ids=["list", "get"],
+)
+def test_get_query_budget(
+    fake_db,
+    make_students,
+    test_client: FlaskClient,
+    path,
+    owner,
+    statement,
+    student_count: int,
+):
+    fake_db.rows = {
+        owner: [{"owner_id": "1"}],
+        statement: make_students(student_count),
+    }
+
+    # One statement per child collection, however many students there are
+    with query_budget(5, max_repeats=1):
+        resp = test_client.get(path)
+
+    assert resp.status_code == 200
+
+
+# The statements of the bulk services, as they run
+INSERT_STUDENTS = """
+    INSERT INTO students (section_id, name, email, major)
+    VALUES %s
+    ON CONFLICT (email, section_id) DO NOTHING
+    RETURNING *;
+"""
+STUDENT_IDS_BY_EMAIL = """
+    SELECT id, email
+    FROM students
+    WHERE section_id = %s AND email = ANY(%s);
+"""
+STUDENTS_BY_IDS = """
+    SELECT *
+    FROM students
+    WHERE id = ANY(%s);
+"""
+VALID_MOVES = """
+    SELECT COUNT(*) AS valid
+    FROM unnest(%s::int[], %s::int[], %s::int[]) AS v(student_id, section_id, team_id)
+    JOIN students st
+    ON st.id = v.student_id AND st.section_id = v.section_id
+    JOIN sections se
+    ON se.id = st.section_id AND se.course_id = %s
+    LEFT JOIN teams t
+    ON t.id = v.team_id AND t.course_id = se.course_id
+    WHERE v.team_id IS NULL OR t.id IS NOT NULL;
+"""
+MOVE_STUDENTS = """
+    UPDATE students s
+    SET team_id = v.team_id
+    FROM unnest(%s::int[], %s::int[]) AS v(student_id, team_id)
+    WHERE s.id = v.student_id AND s.team_id IS DISTINCT FROM v.team_id
+    RETURNING s.*;
+"""
+DELETE_STUDENTS = """
+    DELETE FROM students
+    WHERE section_id = %s AND id = ANY(%s)
+    RETURNING id;
+"""
+
+
+@pytest.mark.parametrize("student_count", [1, 50])
+def test_create_students_query_budget(
+    fake_db, make_students, test_client: FlaskClient, student_count: int
+):
+    fake_db.rows = {
+        "path_owner_section": [{"owner_id": "1"}],
+        INSERT_STUDENTS: make_students(student_count),
+    }
+    data = [
+        {"name": student["name"], "email": student["email"]}
+        for student in make_students(student_count)
+    ]
+
+    # Every student is inserted by the same statement
+    with query_budget(2, max_repeats=1):
+        resp = test_client.post("/course/1/section/1/student", json=data)
+
+    assert resp.status_code == 201
+    assert len(resp.get_json()) == student_count
+
+
+@pytest.mark.parametrize("student_count", [1, 50])
+def test_bulk_update_students_query_budget(
+    fake_db, make_students, test_client: FlaskClient, student_count: int
+):
+    fake_db.rows = {
+        "path_owner_section": [{"owner_id": "1"}],
+        STUDENT_IDS_BY_EMAIL: make_students(student_count),
+        STUDENTS_BY_IDS: make_students(student_count),
+    }
+    data = [
+        {"email": student["email"], "major": "CS", "languages": ["Python"]}
+        for student in make_students(student_count)
+    ]
+
+    with query_budget(9, max_repeats=1):
+        resp = test_client.patch("/course/1/section/1/student", json=data)
+
+    assert resp.status_code == 200
+    assert len(resp.get_json()) == student_count
+
+
+@pytest.mark.parametrize("student_count", [1, 50])
+def test_move_students_query_budget(
+    fake_db, make_students, test_client: FlaskClient, student_count: int
+):
+    moved = make_students(student_count, team_id=2)
+    fake_db.rows = {
+        "path_owner": [{"owner_id": "1"}],
+        VALID_MOVES: [{"valid": student_count}],
+        MOVE_STUDENTS: moved,
+    }
+    moves = [
+        {"sectionId": 1, "studentId": student["id"], "teamId": 2}
+        for student in moved
+    ]
+
+    # Checking and moving every student takes one statement each
+    with query_budget(3, max_repeats=1):
+        resp = test_client.patch(
+            "/course/1/section/move_students", json={"moves": moves}
+        )
+
+    assert resp.status_code == 200
+    assert len(resp.get_json()) == student_count
+
+
+@pytest.mark.parametrize("student_count", [1, 50])
+def test_bulk_delete_students_query_budget(
+    fake_db, make_students, test_client: FlaskClient, student_count: int
+):
+    ids = [student["id"] for student in make_students(student_count)]
+    fake_db.rows = {
+        "path_owner_section": [{"owner_id": "1"}],
+        DELETE_STUDENTS: [{"id": student_id} for student_id in ids],
+    }
+
+    with query_budget(2, max_repeats=1):
+        resp = test_client.delete("/course/1/section/1/student", json={"ids": ids})
+
+    assert resp.status_code == 200
+    assert resp.get_json() == ids
@@ -0,0 +1,76 @@
+import pytest
+from unittest.mock import patch
+from flask.testing import FlaskClient
+from db.query_log import query_budget
+
+
+@patch("controllers.team_controller.check_path_owned")
+@patch("controllers.team_controller.team_services")
+def test_bulk_create_teams(
+    mock_team_services,
+    mock_check_path_owned,
+    test_client: FlaskClient,
+):
+    mock_team_services.create_teams.return_value = [{"id": 1}, {"id": 2}]
+
+    resp = test_client.post(
+        "/course/1/team/bulk_create", json={"teamCount": 2, "prefix": "Team "}
+    )
+
+    assert resp.status_code == 201
+    mock_check_path_owned.assert_called_once_with(1)
+    # Every team is created with one call to the service
+    mock_team_services.create_teams.assert_called_once_with(1, ["Team 1", "Team 2"])
+    assert resp.get_json() == [{"id": 1}, {"id": 2}]
+
+
+@patch("controllers.team_controller.check_path_owned")
+@patch("controllers.team_controller.team_services")
+def test_bulk_create_teams_too_many(
+    mock_team_services,
+    mock_check_path_owned,
+    test_client: FlaskClient,
+):
+    resp = test_client.post(
+        "/course/1/team/bulk_create", json={"teamCount": 501, "prefix": "Team "}
+    )
+
+    assert resp.status_code == 400
+    mock_team_services.create_teams.assert_not_called()
+
+
+
+TEAM = {"id": 2, "course_id": 1, "name": "Team 1"}
+
+
+@pytest.mark.parametrize("student_count", [1, 50])
+@pytest.mark.parametrize(
+    "path, rows",
+    [
+        (
+            "/course/1/team/2",
+            {"path_owner_team": [{"owner_id": "1"}], "team_by_id": [TEAM]},
+        ),
+        (
+            "/course/1/team",
+            {"path_owner": [{"owner_id": "1"}], "teams_by_course": [TEAM]},
+        ),
+    ],
+    ids=["get", "list"],
+)
+def test_get_query_budget(
+    fake_db, make_students, test_client: FlaskClient, path, rows, student_count: int
+):
+    fake_db.rows = {
+        **rows,
+        "students_by_sections_or_teams": make_students(student_count, team_id=2),
+    }
+
+    # One statement per collection, however many students the team has
+    with query_budget(8, max_repeats=1):
+        resp = test_client.get(path)
+
+    assert resp.status_code == 200
+    teams = resp.get_json()
+    team = teams[0] if isinstance(teams, list) else teams
+    assert len(team["students"]) == student_count
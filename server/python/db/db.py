@@ -1,31 +1,453 @@
+import itertools
 import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Any
 import psycopg2
-from psycopg2 import pool
+from flask import Flask, Response, g, has_request_context, request
+from psycopg2 import extensions, pool
+from db import queries
+from db.query_log import CountingConnection
 
-DSN = (
-    f"dbname={os.getenv('POSTGRES_DB')} "
-    f"user={os.getenv('POSTGRES_USER')} "
-    f"password={os.getenv('POSTGRES_PASSWORD')} "
-    f"host=db "
-    f"port=5432"
-)
+
+def _dsn(host: str) -> str:
+    host, _, port = host.partition(":")
+    return (
+        f"dbname={os.getenv('POSTGRES_DB')} "
+        f"user={os.getenv('POSTGRES_USER')} "
+        f"password={os.getenv('POSTGRES_PASSWORD')} "
+        f"host={host} "
+        f"port={port or 5432}"
+    )
+
+
+DSN = _dsn("db")
+# Streaming replicas of the primary that GET requests read from, see get_read_pool
+REPLICA_DSNS = [
+    _dsn(host.strip())
+    for host in os.getenv("POSTGRES_REPLICA_HOSTS", "").split(",")
+    if host.strip()
+]
+# Header carrying the primary's WAL position after a write, which the client
+# sends back so its reads wait for a replica that has replayed it
+LSN_HEADER = "X-DB-LSN"
+_LSN = re.compile(r"[0-9A-Fa-f]{1,8}/[0-9A-Fa-f]{1,8}")
 
 conn_pool = None
+replica_pools: list["ConnectionPool"] | None = None
+conn_pool_lock = threading.Lock()
+_next_replica = itertools.count()
+# Pools inherited from the parent process, see reset_pool
+_inherited_pools: list["ConnectionPool"] = []
+
+
+class PoolTimeout(pool.PoolError):
+    """Raised when no connection frees up before the checkout timeout"""
+
+
+class ConnectionPool:
+    """A thread-safe connection pool that queues checkouts instead of failing
+
+    Connections are opened lazily up to `max_size`. Once they are all in use,
+    `getconn` waits up to `timeout` seconds for one to be returned before
+    raising PoolTimeout. Connections are closed instead of being reused once
+    they have been checked out `max_uses` times or are older than `max_age`
+    seconds, and idle connections are pinged before they are handed out again
+    if they sat unused for more than `validate_after` seconds.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        min_size: int = 1,
+        max_size: int = 15,
+        timeout: float = 5,
+        max_uses: int = 1000,
+        max_age: float = 3600,
+        validate_after: float = 30,
+    ):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.validate_after = validate_after
+
+        self._cond = threading.Condition()
+        self._idle: deque[extensions.connection] = deque()
+        # id(conn) -> {"created_at", "uses", "returned_at"}
+        self._meta: dict[int, dict[str, float]] = {}
+        self._opening = 0
+        self._in_use = 0
+        self._stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "wait_time": 0.0,
+            "max_wait_time": 0.0,
+            "opened": 0,
+            "recycled": 0,
+            "discarded": 0,
+        }
+
+        for _ in range(min_size):
+            self._idle.append(self._register(self._open()))
+
+    def _open(self) -> extensions.connection:
+        # Statements on pooled connections are counted per request, see db/query_log.py
+        return psycopg2.connect(self.dsn, connection_factory=CountingConnection)
+
+    def _register(self, conn: extensions.connection) -> extensions.connection:
+        now = time.monotonic()
+        self._meta[id(conn)] = {"created_at": now, "uses": 0, "returned_at": now}
+        self._stats["opened"] += 1
+        queries.track(conn)
+        return conn
+
+    def _connect(self) -> extensions.connection:
+        """Open a connection for a slot reserved through `_opening`"""
+        try:
+            conn = self._open()
+        except Exception:
+            with self._cond:
+                self._opening -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._opening -= 1
+            return self._register(conn)
+
+    def _close(self, conn: extensions.connection) -> None:
+        self._meta.pop(id(conn), None)
+
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _expired(self, conn: extensions.connection) -> bool:
+        meta = self._meta[id(conn)]
+        return (
+            meta["uses"] >= self.max_uses
+            or time.monotonic() - meta["created_at"] >= self.max_age
+        )
+
+    def _usable(self, conn: extensions.connection) -> bool:
+        """Check an idle connection is still alive before it is handed out"""
+        if conn.closed or self._expired(conn):
+            return False
+
+        if time.monotonic() - self._meta[id(conn)]["returned_at"] < self.validate_after:
+            return True
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _size(self) -> int:
+        return len(self._idle) + self._in_use + self._opening
 
+    def getconn(self) -> extensions.connection:
+        """Check out a connection, waiting up to the pool timeout for one to free up"""
+        start = time.monotonic()
+        deadline = start + self.timeout
 
-def get_pool():
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+
+                if self._size() < self.max_size:
+                    conn = None
+                    self._opening += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    if not self._idle and self._size() >= self.max_size:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(
+                            f"No connection available after {self.timeout} seconds"
+                        )
+
+        # Opening and pinging happen outside of the lock so other threads aren't held up
+        if conn is None:
+            conn = self._connect()
+        elif not self._usable(conn):
+            with self._cond:
+                self._stats["discarded"] += 1
+                self._close(conn)
+                self._opening += 1
+
+            conn = self._connect()
+
+        waited = time.monotonic() - start
+
+        with self._cond:
+            self._in_use += 1
+            self._meta[id(conn)]["uses"] += 1
+            self._stats["checkouts"] += 1
+            self._stats["wait_time"] += waited
+            self._stats["max_wait_time"] = max(self._stats["max_wait_time"], waited)
+
+        return conn
+
+    def putconn(self, conn: extensions.connection) -> None:
+        """Return a connection, closing it if it is broken or due to be recycled"""
+        status = (
+            extensions.TRANSACTION_STATUS_UNKNOWN
+            if conn.closed
+            else conn.info.transaction_status
+        )
+
+        # Never hand out a connection with a transaction still open
+        if status in (
+            extensions.TRANSACTION_STATUS_INTRANS,
+            extensions.TRANSACTION_STATUS_INERROR,
+        ):
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                status = extensions.TRANSACTION_STATUS_UNKNOWN
+
+        with self._cond:
+            if id(conn) not in self._meta:
+                # Not one of ours, or already closed by the pool
+                conn.close()
+                return
+
+            self._in_use -= 1
+
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                self._stats["discarded"] += 1
+                self._close(conn)
+            elif self._expired(conn):
+                self._stats["recycled"] += 1
+                self._close(conn)
+            else:
+                self._meta[id(conn)]["returned_at"] = time.monotonic()
+                self._idle.append(conn)
+
+            self._cond.notify()
+
+    def stats(self) -> dict[str, Any]:
+        """Counters describing how the pool has been used"""
+        with self._cond:
+            return {
+                **self._stats,
+                "size": self._size(),
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+            }
+
+    def closeall(self) -> None:
+        with self._cond:
+            while self._idle:
+                self._close(self._idle.pop())
+
+
+def _new_pool(dsn: str) -> ConnectionPool:
+    return ConnectionPool(
+        dsn,
+        min_size=int(os.getenv("DB_POOL_MIN_SIZE", "1")),
+        max_size=int(os.getenv("DB_POOL_MAX_SIZE", "15")),
+        timeout=float(os.getenv("DB_POOL_TIMEOUT", "5")),
+        max_uses=int(os.getenv("DB_POOL_MAX_USES", "1000")),
+        max_age=float(os.getenv("DB_POOL_MAX_AGE", "3600")),
+    )
+
+
+def get_pool() -> ConnectionPool:
+    """The pool of the primary, which takes every write"""
     global conn_pool
-    if conn_pool is None:
-        conn_pool = pool.SimpleConnectionPool(minconn=1, maxconn=15, dsn=DSN)
+    with conn_pool_lock:
+        if conn_pool is None:
+            conn_pool = _new_pool(DSN)
 
     return conn_pool
 
 
+def get_replica_pool() -> ConnectionPool | None:
+    """The pool of a replica, taking turns between replicas, None when there are none"""
+    global replica_pools
+    if not REPLICA_DSNS:
+        return None
+
+    with conn_pool_lock:
+        if replica_pools is None:
+            replica_pools = [_new_pool(dsn) for dsn in REPLICA_DSNS]
+
+    return replica_pools[next(_next_replica) % len(replica_pools)]
+
+
+def _replayed(replica_pool: ConnectionPool, lsn: str) -> bool:
+    """Check whether a replica has replayed the primary's WAL up to `lsn`"""
+    conn = replica_pool.getconn()
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_last_wal_replay_lsn() >= %s::pg_lsn;", (lsn,))
+            replayed = cur.fetchone()[0]
+
+        conn.rollback()
+        return bool(replayed)
+    finally:
+        replica_pool.putconn(conn)
+
+
+def get_read_pool() -> ConnectionPool:
+    """The pool the current request reads from
+
+    GET and HEAD requests read from a replica. A client that wrote gets the
+    primary's WAL position back in the X-DB-LSN header, see add_write_lsn. When
+    it sends that back, it reads from the primary until the replica has
+    replayed that far, so it sees its own writes whichever process serves it.
+    Everything else, and anything outside of a request, uses the primary. The
+    choice is kept for the rest of the request.
+    """
+    if not has_request_context():
+        return get_pool()
+
+    if "db_read_pool" not in g:
+        replica_pool = None
+
+        if request.method in ("GET", "HEAD"):
+            replica_pool = get_replica_pool()
+            lsn = request.headers.get(LSN_HEADER, "")
+
+            if replica_pool and _LSN.fullmatch(lsn) and not _replayed(replica_pool, lsn):
+                replica_pool = None
+
+        g.db_read_pool = replica_pool or get_pool()
+
+    return g.db_read_pool
+
+
+def pool_stats() -> dict[str, dict[str, Any]]:
+    """ConnectionPool.stats of every pool this process has opened, by name"""
+    pools = {"primary": conn_pool}
+    pools.update({f"replica{i}": replica for i, replica in enumerate(replica_pools or [])})
+
+    return {name: open_pool.stats() for name, open_pool in pools.items() if open_pool}
+
+
+def reset_pool() -> None:
+    """Forget any pool inherited through fork, called in each new worker process
+
+    The inherited connections share their sockets with the parent process, so
+    they are kept referenced instead of closed. Closing or garbage collecting
+    them would end the parent's sessions.
+    """
+    global conn_pool, replica_pools, conn_pool_lock
+
+    if conn_pool is not None:
+        _inherited_pools.append(conn_pool)
+    if replica_pools is not None:
+        _inherited_pools.extend(replica_pools)
+
+    conn_pool = None
+    replica_pools = None
+    conn_pool_lock = threading.Lock()
+
+
+def close_pool() -> None:
+    """Close every idle connection of this process's pools, called when a worker exits"""
+    global conn_pool, replica_pools
+
+    with conn_pool_lock:
+        for open_pool in [conn_pool, *(replica_pools or [])]:
+            if open_pool is not None:
+                open_pool.closeall()
+
+        conn_pool = None
+        replica_pools = None
+
+
 def get_conn() -> psycopg2.extensions.connection:
-    """open 1 of 5 connections from pool"""
-    return get_pool().getconn()
+    """get the request's database session, or check out a connection outside of a request
+
+    Inside a request the first call checks a connection out of the pool and
+    every later call returns that same connection, so one request holds at most
+    one connection. Reads made by GET requests share a single snapshot and may
+    come from a replica, see get_read_pool.
+    """
+    if not has_request_context():
+        return get_pool().getconn()
+
+    if "db_conn" not in g:
+        start = time.perf_counter()
+        conn = get_read_pool().getconn()
+        # Reported per route, see metrics.py
+        g.db_pool_wait = time.perf_counter() - start
+
+        if request.method in ("GET", "HEAD"):
+            conn.set_session(isolation_level=extensions.ISOLATION_LEVEL_REPEATABLE_READ)
+
+        g.db_conn = conn
+
+    return g.db_conn
 
 
 def put_conn(conn):
-    """put away a connection"""
+    """put away a connection, the request's session is kept until the request ends"""
+    if has_request_context() and g.get("db_conn") is conn:
+        return
+
     return get_pool().putconn(conn)
+
+
+def close_request_conn(error: BaseException | None = None) -> None:
+    """Return the request's database session to the pool"""
+    conn = g.pop("db_conn", None)
+
+    if conn is None:
+        return
+
+    if not conn.closed:
+        try:
+            # Anything a service didn't commit is dropped with the request
+            conn.rollback()
+            conn.set_session(isolation_level="DEFAULT")
+        except psycopg2.Error:
+            pass
+
+    g.pop("db_read_pool").putconn(conn)
+
+
+def add_write_lsn(response: Response) -> Response:
+    """Send the primary's WAL position back after a write, see get_read_pool"""
+    conn = g.get("db_conn")
+
+    if (
+        not REPLICA_DSNS
+        or conn is None
+        or conn.closed
+        or request.method in ("GET", "HEAD")
+        or response.status_code >= 400
+    ):
+        return response
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_current_wal_lsn()::TEXT;")
+            response.headers[LSN_HEADER] = cur.fetchone()[0]
+    except psycopg2.Error:
+        pass
+
+    return response
+
+
+def init_db(app: Flask) -> None:
+    app.after_request(add_write_lsn)
+    app.teardown_request(close_request_conn)
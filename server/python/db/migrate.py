@@ -0,0 +1,263 @@
+"""Versioned schema migrations
+
+init.sql is the baseline schema a fresh database starts from. Every change
+after it is a numbered file in db/migrations, e.g. `0002_foreign_key_indexes.sql`,
+applied in order and recorded in schema_migrations so each runs once.
+
+A migration runs in one transaction together with its bookkeeping row,
+unless its first line is `-- migrate: no-transaction`. Those, e.g. ones with
+CREATE INDEX CONCURRENTLY, run statement by statement in autocommit and must
+be safe to run again after failing halfway.
+
+Run from server/python with `python -m db.migrate`, gunicorn also runs it on
+startup.
+"""
+
+import argparse
+import re
+import time
+from dataclasses import dataclass
+from pathlib import Path
+import psycopg2
+from psycopg2 import extensions, sql
+from db.db import DSN
+
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+NO_TRANSACTION = "-- migrate: no-transaction"
+# Any number, so two servers starting at once apply migrations one at a time
+LOCK_ID = 7_370_212
+
+_FILE_NAME = re.compile(r"^(\d+)_(\w+)\.sql$")
+_CONCURRENT_INDEX = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)",
+    re.IGNORECASE,
+)
+
+
+@dataclass(frozen=True)
+class Migration:
+    """One migration file
+
+    Args:
+      version (int): The number the file name starts with
+      name (str): The rest of the file name
+      sql (str): The contents of the file
+      transactional (bool): False for files marked `-- migrate: no-transaction`
+    """
+
+    version: int
+    name: str
+    sql: str
+    transactional: bool = True
+
+
+def load_migrations(directory: Path = MIGRATIONS_DIR) -> list[Migration]:
+    """Read the migration files in version order
+
+    Raises:
+      ValueError: When two files have the same version
+    """
+    migrations: dict[int, Migration] = {}
+
+    for path in sorted(directory.glob("*.sql")):
+        match = _FILE_NAME.match(path.name)
+
+        if match is None:
+            continue
+
+        version = int(match.group(1))
+
+        if version in migrations:
+            raise ValueError(
+                f"Migrations {migrations[version].name} and {match.group(2)} "
+                f"share version {version}"
+            )
+
+        text = path.read_text()
+        migrations[version] = Migration(
+            version,
+            match.group(2),
+            text,
+            transactional=not text.lstrip().startswith(NO_TRANSACTION),
+        )
+
+    return [migrations[version] for version in sorted(migrations)]
+
+
+def split_statements(text: str) -> list[str]:
+    """Split a no-transaction migration into its statements
+
+    Only `--` comments and semicolons ending a statement are understood, so
+    these files can't hold function bodies or strings containing semicolons.
+    """
+    lines = [line.split("--", 1)[0] for line in text.splitlines()]
+    statements = " ".join(lines).split(";")
+
+    return [" ".join(statement.split()) for statement in statements if statement.strip()]
+
+
+def concurrent_indexes(text: str) -> list[str]:
+    """Names of the indexes a migration creates CONCURRENTLY"""
+    return _CONCURRENT_INDEX.findall(text)
+
+
+def _ensure_table(conn: extensions.connection) -> None:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+            )
+            """
+        )
+
+
+def applied_versions(conn: extensions.connection) -> set[int]:
+    with conn.cursor() as cur:
+        cur.execute("SELECT version FROM schema_migrations")
+
+        return {row[0] for row in cur.fetchall()}
+
+
+def _record(cur, migration: Migration) -> None:
+    cur.execute(
+        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+        (migration.version, migration.name),
+    )
+
+
+def _drop_invalid_indexes(conn: extensions.connection, migration: Migration) -> None:
+    """Drop indexes a failed CREATE INDEX CONCURRENTLY left behind
+
+    They are kept as INVALID, and `IF NOT EXISTS` would skip rebuilding them.
+    """
+    names = concurrent_indexes(migration.sql)
+
+    if not names:
+        return
+
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT c.relname FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = ANY(%s) AND NOT i.indisvalid
+            """,
+            (names,),
+        )
+
+        for (name,) in cur.fetchall():
+            cur.execute(
+                sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(
+                    sql.Identifier(name)
+                )
+            )
+
+
+def apply(conn: extensions.connection, migration: Migration) -> None:
+    """Apply one migration and record it, the connection is left in autocommit"""
+    if migration.transactional:
+        conn.autocommit = False
+
+        try:
+            with conn, conn.cursor() as cur:
+                cur.execute(migration.sql)
+                _record(cur, migration)
+        finally:
+            conn.autocommit = True
+
+        return
+
+    _drop_invalid_indexes(conn, migration)
+
+    with conn.cursor() as cur:
+        for statement in split_statements(migration.sql):
+            cur.execute(statement)
+
+        _record(cur, migration)
+
+
+def _connect(dsn: str, wait: float) -> extensions.connection:
+    deadline = time.monotonic() + wait
+
+    while True:
+        try:
+            return psycopg2.connect(dsn)
+        except psycopg2.OperationalError:
+            # Postgres may still be starting, e.g. right after `docker compose up`
+            if time.monotonic() >= deadline:
+                raise
+
+            time.sleep(1)
+
+
+def migrate(dsn: str = DSN, wait: float = 0) -> list[Migration]:
+    """Apply every migration the database doesn't have yet
+
+    Args:
+      dsn (str): The database to migrate
+      wait (float): Seconds to keep retrying while the database refuses connections
+
+    Returns:
+      The migrations that were applied
+    """
+    conn = _connect(dsn, wait)
+    conn.autocommit = True
+    applied: list[Migration] = []
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (LOCK_ID,))
+
+        try:
+            _ensure_table(conn)
+            done = applied_versions(conn)
+
+            for migration in load_migrations():
+                if migration.version in done:
+                    continue
+
+                print(f"Applying migration {migration.version} {migration.name}")
+                apply(conn, migration)
+                applied.append(migration)
+        finally:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (LOCK_ID,))
+    finally:
+        conn.close()
+
+    return applied
+
+
+def status(dsn: str = DSN) -> list[tuple[Migration, bool]]:
+    """Every migration and whether it has been applied"""
+    conn = _connect(dsn, 0)
+    conn.autocommit = True
+
+    try:
+        _ensure_table(conn)
+        done = applied_versions(conn)
+    finally:
+        conn.close()
+
+    return [(migration, migration.version in done) for migration in load_migrations()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--status", action="store_true", help="list migrations instead of applying them"
+    )
+    parser.add_argument(
+        "--wait", type=float, default=0, help="seconds to wait for the database"
+    )
+    args = parser.parse_args()
+
+    if args.status:
+        for migration, done in status():
+            print(f"{'applied' if done else 'pending':8} {migration.version:04} {migration.name}")
+    else:
+        applied = migrate(wait=args.wait)
+        print(f"{len(applied)} migration(s) applied")
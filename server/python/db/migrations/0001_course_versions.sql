@@ -0,0 +1,134 @@
+-- GETs under a course answer If-None-Match from courses.version, so every
+-- statement that changes a course or anything shown under it bumps it.
+
+ALTER TABLE courses ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 1;
+
+CREATE OR REPLACE FUNCTION bump_own_course_version() RETURNS TRIGGER AS $$
+BEGIN
+    -- updates that already bump the version are left alone
+    IF NEW.version = OLD.version THEN
+        NEW.version := OLD.version + 1;
+    END IF;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS courses_version ON courses;
+CREATE TRIGGER courses_version BEFORE UPDATE ON courses
+FOR EACH ROW EXECUTE FUNCTION bump_own_course_version();
+
+-- Bumps every course with a row changed by the statement. The trigger's
+-- arguments name the columns leading to the course: course_id, section_id,
+-- student_id, team_id, or label_id for the id of a label.
+CREATE OR REPLACE FUNCTION bump_course_versions() RETURNS TRIGGER AS $$
+DECLARE
+    changed JSONB[] := '{}';
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        changed := changed || ARRAY(SELECT to_jsonb(n) FROM new_rows n);
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        changed := changed || ARRAY(SELECT to_jsonb(o) FROM old_rows o);
+    END IF;
+
+    UPDATE courses
+    SET version = version + 1
+    WHERE id IN (
+        SELECT (r.data ->> 'course_id')::INT
+        FROM unnest(changed) AS r(data)
+        WHERE 'course_id' = ANY(TG_ARGV)
+        UNION
+        SELECT se.course_id
+        FROM unnest(changed) AS r(data)
+        JOIN sections se ON se.id = (r.data ->> 'section_id')::INT
+        WHERE 'section_id' = ANY(TG_ARGV)
+        UNION
+        SELECT se.course_id
+        FROM unnest(changed) AS r(data)
+        JOIN students st ON st.id = (r.data ->> 'student_id')::INT
+        JOIN sections se ON se.id = st.section_id
+        WHERE 'student_id' = ANY(TG_ARGV)
+        UNION
+        SELECT t.course_id
+        FROM unnest(changed) AS r(data)
+        JOIN teams t ON t.id = (r.data ->> 'team_id')::INT
+        WHERE 'team_id' = ANY(TG_ARGV)
+        UNION
+        -- labels belong to a user, so a changed label changes every course using it
+        SELECT se.course_id
+        FROM unnest(changed) AS r(data)
+        JOIN student_labels sl ON sl.label_id = (r.data ->> 'id')::INT
+        JOIN students st ON st.id = sl.student_id
+        JOIN sections se ON se.id = st.section_id
+        WHERE 'label_id' = ANY(TG_ARGV)
+        UNION
+        SELECT t.course_id
+        FROM unnest(changed) AS r(data)
+        JOIN teams_labels tl ON tl.label_id = (r.data ->> 'id')::INT
+        JOIN teams t ON t.id = tl.team_id
+        WHERE 'label_id' = ANY(TG_ARGV)
+    );
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    t RECORD;
+    args TEXT;
+BEGIN
+    FOR t IN
+        SELECT *
+        FROM (VALUES
+            ('sections', ARRAY['course_id']),
+            ('teams', ARRAY['course_id']),
+            ('students', ARRAY['section_id']),
+            ('comments', ARRAY['student_id', 'team_id']),
+            ('student_labels', ARRAY['student_id']),
+            ('teams_labels', ARRAY['team_id']),
+            ('students_experiences', ARRAY['student_id']),
+            ('students_comments', ARRAY['student_id']),
+            ('teams_comments', ARRAY['team_id'])
+        ) AS tables (name, args)
+    LOOP
+        args := (SELECT string_agg(quote_literal(a), ', ') FROM unnest(t.args) a);
+
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t.name || '_version_insert', t.name);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t.name || '_version_update', t.name);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t.name || '_version_delete', t.name);
+
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER INSERT ON %I '
+            'REFERENCING NEW TABLE AS new_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION bump_course_versions(%s)',
+            t.name || '_version_insert', t.name, args
+        );
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER UPDATE ON %I '
+            'REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION bump_course_versions(%s)',
+            t.name || '_version_update', t.name, args
+        );
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER DELETE ON %I '
+            'REFERENCING OLD TABLE AS old_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION bump_course_versions(%s)',
+            t.name || '_version_delete', t.name, args
+        );
+    END LOOP;
+END $$;
+
+DROP TRIGGER IF EXISTS labels_version_update ON labels;
+CREATE TRIGGER labels_version_update AFTER UPDATE ON labels
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION bump_course_versions('label_id');
+
+/*
+references:
+
+https://www.postgresql.org/docs/current/sql-createtrigger.html
+https://www.postgresql.org/docs/current/plpgsql-trigger.html
+*/
@@ -0,0 +1,21 @@
+-- migrate: no-transaction
+-- Foreign keys that child lookups filter on and ON DELETE CASCADE scans.
+-- Built CONCURRENTLY so a live database keeps taking writes meanwhile.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS sections_course_id ON sections (course_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS teams_course_id ON teams (course_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS students_section_id ON students (section_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS students_team_id ON students (team_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS courses_owner_id ON courses (owner_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS comments_student_id ON comments (student_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS comments_team_id ON comments (team_id);
+
+-- The reverse side of the junction tables, their primary keys start with the other column
+CREATE INDEX CONCURRENTLY IF NOT EXISTS student_labels_label_id ON student_labels (label_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS teams_labels_label_id ON teams_labels (label_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS students_experiences_experience_id ON students_experiences (experience_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS students_comments_comment_id ON students_comments (comment_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS teams_comments_comment_id ON teams_comments (comment_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS students_courses_course_id ON students_courses (course_id);
+
+-- labels.owner_id needs none, UNIQUE (owner_id, name) already starts with it
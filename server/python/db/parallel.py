@@ -0,0 +1,143 @@
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Callable, TypeVar
+from flask import g, has_request_context, request
+from psycopg2.extensions import connection
+from db import query_log
+from db.db import ConnectionPool, get_read_pool
+
+T = TypeVar("T")
+
+
+@dataclass
+class Budget:
+    """The extra connections a request may still load with, and the pool they come from"""
+
+    slots: threading.Semaphore
+    pool: ConnectionPool
+    # Where the request's statements are counted, worker threads record to them too
+    query_logs: tuple[query_log.QueryLog, ...] = ()
+
+
+executor: ThreadPoolExecutor | None = None
+executor_lock = threading.Lock()
+
+# The budget of the request a worker thread is loading for, see _budget
+_current_budget: ContextVar[Budget | None] = ContextVar(
+    "parallel_budget", default=None
+)
+
+
+def max_connections() -> int:
+    """How many connections one request may load with at once, 1 turns parallel loads off"""
+    return max(1, int(os.getenv("DB_PARALLEL_CONNECTIONS", "1")))
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("DB_PARALLEL_WORKERS", "4")),
+                thread_name_prefix="db-parallel",
+            )
+
+    return executor
+
+
+def reset_executor() -> None:
+    """Forget an executor inherited through fork, its threads didn't come along"""
+    global executor, executor_lock
+    executor = None
+    executor_lock = threading.Lock()
+
+
+def _budget() -> Budget | None:
+    """The budget of the current request, None when it may take no extra connections
+
+    Only GET and HEAD requests load in parallel. Their reads are all committed
+    data, while a request that writes must read its own uncommitted changes
+    back on its own connection.
+    """
+    budget = _current_budget.get()
+
+    if budget is not None:
+        return budget
+
+    if not has_request_context() or request.method not in ("GET", "HEAD"):
+        return None
+
+    if "parallel_budget" not in g:
+        g.parallel_budget = Budget(
+            threading.Semaphore(max_connections() - 1),
+            get_read_pool(),
+            query_log.active(),
+        )
+
+    return g.parallel_budget
+
+
+def _run_on_own_conn(budget: Budget, load: Callable[[connection], T]) -> T:
+    token = _current_budget.set(budget)
+
+    try:
+        conn = budget.pool.getconn()
+
+        try:
+            with query_log.collecting(*budget.query_logs):
+                return load(conn)
+        finally:
+            budget.pool.putconn(conn)
+    finally:
+        _current_budget.reset(token)
+        budget.slots.release()
+
+
+def run_all(
+    loads: dict[str, Callable[[connection | None], T]], conn: connection | None = None
+) -> dict[str, T]:
+    """Run independent loads, in parallel when the request's budget allows it
+
+    Each load gets the connection to query on. The first one always runs on
+    `conn` in the calling thread, and every other load that can take a slot
+    from the request's budget runs in a worker thread on a connection of its
+    own. Loads left over run on `conn` after the first one. Loads on other
+    connections don't share the request's snapshot.
+
+    Args:
+      loads (dict[str, Callable[[connection | None], T]]): The loads to run, by name
+      conn (connection | None): The caller's connection, None to check one out per load
+
+    Returns:
+      The result of every load, by name
+    """
+    budget = _budget() if len(loads) > 1 and max_connections() > 1 else None
+    futures: dict[str, Future] = {}
+
+    if budget is not None:
+        pool = get_executor()
+
+        for name, load in list(loads.items())[1:]:
+            if not budget.slots.acquire(blocking=False):
+                break
+
+            futures[name] = pool.submit(_run_on_own_conn, budget, load)
+
+    results: dict[str, Any] = {}
+
+    for name, load in loads.items():
+        if name not in futures:
+            results[name] = load(conn)
+
+    for name, future in futures.items():
+        # A load still queued behind other requests runs here instead of waiting
+        if future.cancel():
+            budget.slots.release()
+            results[name] = loads[name](conn)
+        else:
+            results[name] = future.result()
+
+    return {name: results[name] for name in loads}
@@ -0,0 +1,361 @@
+import re
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Any, Sequence
+from psycopg2 import extensions
+
+
+@dataclass(frozen=True)
+class Query:
+    """A named SQL statement
+
+    Args:
+      name (str): The name the statement is prepared under
+      sql (str): The statement, with %s placeholders
+      prepare (bool): False for statements whose best plan depends on their
+        parameters, e.g. `= ANY(%s)` over arrays of very different sizes,
+        which are always planned from scratch
+    """
+
+    name: str
+    sql: str
+    prepare: bool = True
+
+
+QUERIES: dict[str, Query] = {}
+
+# Connections opened by the pool -> names of the statements prepared on them.
+# Anything else, e.g. a connection opened by hand, runs the plain SQL.
+_prepared: "weakref.WeakKeyDictionary[extensions.connection, set[str]]" = (
+    weakref.WeakKeyDictionary()
+)
+_stats: dict[str, dict[str, float]] = {}
+_lock = threading.Lock()
+
+
+def register(name: str, sql: str, prepare: bool = True) -> str:
+    """Add a statement to the registry, registering the same statement twice is a no-op
+
+    Returns:
+      The name of the statement
+    """
+    with _lock:
+        existing = QUERIES.get(name)
+
+        if existing is not None and existing.sql != sql:
+            raise ValueError(f"Query {name} is already registered with different SQL")
+
+        QUERIES[name] = Query(name, sql, prepare)
+        _stats.setdefault(name, {"calls": 0, "prepared_calls": 0, "total_time": 0.0})
+
+    return name
+
+
+def track(conn: extensions.connection) -> None:
+    """Let statements be prepared on a connection, called by the pool when it opens one"""
+    _prepared[conn] = set()
+
+
+def _positional(sql: str) -> str:
+    """Turn %s placeholders into the $1, $2, ... that PREPARE expects"""
+    count = 0
+
+    def number(_: re.Match) -> str:
+        nonlocal count
+        count += 1
+        return f"${count}"
+
+    return re.sub(r"%s", number, sql)
+
+
+def execute(cur: Any, name: str, params: Sequence[Any] = ()) -> None:
+    """Run a registered statement on the cursor
+
+    The first time a statement runs on a pooled connection it is PREPAREd, and
+    from then on it is run by name with EXECUTE so Postgres skips parsing and
+    planning it.
+
+    Args:
+      cur (RealDictCursor): The cursor to run the statement on
+      name (str): The name of a registered statement
+      params (Sequence[Any]): Values for the statement's placeholders
+    """
+    query = QUERIES[name]
+    prepared = _prepared.get(cur.connection) if query.prepare else None
+    start = time.perf_counter()
+
+    if prepared is None:
+        cur.execute(query.sql, params)
+    else:
+        if name not in prepared:
+            cur.execute(f"PREPARE {name} AS {_positional(query.sql).rstrip().rstrip(';')}")
+            prepared.add(name)
+
+        placeholders = ", ".join(["%s"] * len(params))
+        cur.execute(
+            f"EXECUTE {name} ({placeholders});" if params else f"EXECUTE {name};",
+            params,
+        )
+
+    record(name, time.perf_counter() - start, prepared=prepared is not None)
+
+
+def record(name: str, elapsed: float, prepared: bool = False) -> None:
+    """Count one run of a registered statement"""
+    with _lock:
+        stats = _stats[name]
+        stats["calls"] += 1
+        stats["prepared_calls"] += prepared
+        stats["total_time"] += elapsed
+
+
+def stats() -> dict[str, dict[str, float]]:
+    """Calls and total time of every registered statement"""
+    with _lock:
+        return {name: dict(values) for name, values in _stats.items()}
+
+
+# The columns a course is served with, `version` only feeds the ETag
+COURSE_COLUMNS = "id, owner_id, name, code, term, created_at"
+
+# Hot lookups
+
+register(
+    "course_by_id",
+    f"""
+    SELECT {COURSE_COLUMNS}
+    FROM courses
+    WHERE id = %s;
+    """,
+)
+register(
+    "course_version",
+    """
+    SELECT version
+    FROM courses
+    WHERE id = %s;
+    """,
+)
+register(
+    "courses_by_owner",
+    f"""
+    SELECT {COURSE_COLUMNS}
+    FROM courses
+    WHERE owner_id = %s
+    ORDER BY id;
+    """,
+)
+register(
+    "section_by_id",
+    """
+    SELECT s.*, c.name AS course_name
+    FROM sections s
+    JOIN courses c ON s.course_id = c.id
+    WHERE s.id = %s
+    ORDER BY s.id;
+    """,
+)
+register(
+    "sections_by_course",
+    """
+    SELECT s.*, c.name AS course_name
+    FROM sections s
+    JOIN courses c ON s.course_id = c.id
+    WHERE c.id = %s
+    ORDER BY s.id;
+    """,
+)
+register(
+    "team_by_id",
+    """
+    SELECT *
+    FROM teams
+    WHERE id = %s;
+    """,
+)
+register(
+    "teams_by_course",
+    """
+    SELECT *
+    FROM teams
+    WHERE course_id = %s
+    ORDER BY id;
+    """,
+)
+register(
+    "student_by_id",
+    """
+    SELECT *
+    FROM students
+    WHERE id = %s;
+    """,
+)
+register(
+    "students_by_section",
+    """
+    SELECT st.*, c.id AS course_id
+    FROM students st
+    JOIN sections se
+    ON   se.id = st.section_id
+    JOIN courses c
+    ON   c.id = se.course_id
+    WHERE section_id = %s;
+    """,
+)
+register(
+    "labels_by_student",
+    """
+    SELECT l.*
+    FROM labels l
+    INNER JOIN student_labels sl
+    ON sl.label_id = l.id
+    WHERE sl.student_id = %s
+    """,
+)
+register(
+    "labels_by_team",
+    """
+    SELECT l.*
+    FROM labels l
+    INNER JOIN teams_labels tl
+    ON tl.label_id = l.id
+    WHERE tl.team_id = %s
+    """,
+)
+register(
+    "comments_by_student",
+    """
+    SELECT c.*
+    FROM comments c
+    JOIN students_comments sc ON c.id = sc.comment_id
+    WHERE sc.student_id = %s;
+    """,
+)
+register(
+    "comments_by_team",
+    """
+    SELECT c.*
+    FROM comments c
+    JOIN teams_comments tc ON c.id = tc.comment_id
+    WHERE tc.team_id = %s;
+    """,
+)
+register(
+    "languages_by_student",
+    """
+    SELECT e.id, e.name
+    FROM experiences e
+    JOIN students_experiences se
+    ON se.student_id = %s AND se.experience_id = e.id
+    WHERE e.type = 'language';
+    """,
+)
+register(
+    "frameworks_by_student",
+    """
+    SELECT e.id, e.name
+    FROM experiences e
+    JOIN students_experiences se
+    ON se.student_id = %s AND se.experience_id = e.id
+    WHERE e.type = 'framework';
+    """,
+)
+
+# Batch loaders, the size of the id array changes the plan so these are never prepared
+
+register(
+    "labels_by_students",
+    """
+    SELECT sl.student_id AS parent_id, l.*
+    FROM labels l
+    INNER JOIN student_labels sl
+    ON sl.label_id = l.id
+    WHERE sl.student_id = ANY(%s)
+    ORDER BY l.id;
+    """,
+    prepare=False,
+)
+register(
+    "labels_by_teams",
+    """
+    SELECT tl.team_id AS parent_id, l.*
+    FROM labels l
+    INNER JOIN teams_labels tl
+    ON tl.label_id = l.id
+    WHERE tl.team_id = ANY(%s)
+    ORDER BY l.id;
+    """,
+    prepare=False,
+)
+register(
+    "comments_by_students",
+    """
+    SELECT sc.student_id AS parent_id, c.*
+    FROM comments c
+    JOIN students_comments sc ON c.id = sc.comment_id
+    WHERE sc.student_id = ANY(%s)
+    ORDER BY c.id;
+    """,
+    prepare=False,
+)
+register(
+    "comments_by_teams",
+    """
+    SELECT tc.team_id AS parent_id, c.*
+    FROM comments c
+    JOIN teams_comments tc ON c.id = tc.comment_id
+    WHERE tc.team_id = ANY(%s)
+    ORDER BY c.id;
+    """,
+    prepare=False,
+)
+register(
+    "experiences_by_students",
+    """
+    SELECT se.student_id AS parent_id, e.id, e.name, e.type
+    FROM experiences e
+    JOIN students_experiences se
+    ON se.experience_id = e.id
+    WHERE se.student_id = ANY(%s)
+    ORDER BY e.id;
+    """,
+    prepare=False,
+)
+
+# Course tree loaders, batched like the child loaders above
+
+register(
+    "sections_by_courses",
+    """
+    SELECT s.*, c.name AS course_name
+    FROM sections s
+    JOIN courses c ON s.course_id = c.id
+    WHERE c.id = ANY(%s)
+    ORDER BY s.id;
+    """,
+    prepare=False,
+)
+register(
+    "teams_by_courses",
+    """
+    SELECT *
+    FROM teams
+    WHERE course_id = ANY(%s)
+    ORDER BY id;
+    """,
+    prepare=False,
+)
+register(
+    "students_by_sections_or_teams",
+    """
+    SELECT st.*, se.course_id AS course_id
+    FROM students st
+    JOIN sections se
+    ON se.id = st.section_id
+    WHERE st.section_id = ANY(%s) OR st.team_id = ANY(%s)
+    ORDER BY st.id;
+    """,
+    prepare=False,
+)
@@ -0,0 +1,216 @@
+"""Per-request query counting
+
+Every cursor on a pooled connection reports the statements it runs to the
+query logs active at the time. Each request gets one, so it is easy to see
+when an endpoint regresses into a query per row. In debug mode the totals are
+sent back in response headers, otherwise requests over the query budget are
+logged. `query_budget` lets tests hold a block of code to a budget.
+"""
+
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import cache
+from typing import Any, Iterator
+from flask import Flask, Response, current_app, g, has_request_context, request
+from psycopg2 import extensions, sql
+
+# Most statements a request may run, and most times it may run the same one,
+# before it is logged as over budget
+MAX_QUERIES = int(os.getenv("DB_QUERY_BUDGET", "50"))
+MAX_REPEATS = int(os.getenv("DB_QUERY_REPEAT_BUDGET", "10"))
+
+
+@dataclass(eq=False)
+class QueryLog:
+    """The statements run while the log was active
+
+    Args:
+      count (int): How many statements ran
+      time (float): Seconds spent running them
+      statements (Counter[str]): How many times each statement ran, by its SQL
+    """
+
+    count: int = 0
+    time: float = 0.0
+    statements: Counter[str] = field(default_factory=Counter)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, statement: str, elapsed: float) -> None:
+        # Parallel loads record from worker threads
+        with self._lock:
+            self.count += 1
+            self.time += elapsed
+            self.statements[statement] += 1
+
+    def repeats(self, min_count: int = 2) -> dict[str, int]:
+        """Statements that ran at least `min_count` times, a sign of a query per row"""
+        with self._lock:
+            return {s: n for s, n in self.statements.items() if n >= min_count}
+
+    def over_budget(self, max_queries: int, max_repeats: int | None = None) -> list[str]:
+        """Describe how the log went over a budget, empty when it didn't
+
+        Args:
+          max_queries (int): Most statements allowed
+          max_repeats (int | None): Most times one statement may run, None for any
+        """
+        problems = []
+
+        if self.count > max_queries:
+            problems.append(f"{self.count} queries, budget is {max_queries}")
+
+        if max_repeats is not None:
+            for statement, count in self.repeats(max_repeats + 1).items():
+                problems.append(f"{count}x (budget {max_repeats}): {statement}")
+
+        return problems
+
+
+# Logs recording outside of a request's own thread, see `collecting`
+_current_logs: ContextVar[tuple[QueryLog, ...]] = ContextVar("query_logs", default=())
+
+
+def active() -> tuple[QueryLog, ...]:
+    """The logs statements run now are recorded to"""
+    logs = _current_logs.get()
+
+    if has_request_context() and "query_log" in g:
+        if all(log is not g.query_log for log in logs):
+            logs += (g.query_log,)
+
+    return logs
+
+
+@contextmanager
+def collecting(*logs: QueryLog) -> Iterator[None]:
+    """Record to these logs, as well as the request's, for the rest of the block"""
+    token = _current_logs.set(_current_logs.get() + logs)
+
+    try:
+        yield
+    finally:
+        _current_logs.reset(token)
+
+
+def record(statement: str, elapsed: float) -> None:
+    """Record one statement to every active log"""
+    for log in active():
+        log.record(statement, elapsed)
+
+
+class _CountingCursor:
+    """Mixed into a cursor class so its statements are recorded"""
+
+    def _record(self, query: Any, elapsed: float) -> None:
+        logs = active()
+
+        if not logs:
+            return
+
+        if isinstance(query, sql.Composable):
+            query = query.as_string(self)
+        elif isinstance(query, bytes):
+            query = query.decode()
+
+        # Placeholders, not values, so every run of a statement counts as the same one
+        statement = " ".join(query.split())
+
+        for log in logs:
+            log.record(statement, elapsed)
+
+    def execute(self, query: Any, vars: Any = None) -> Any:
+        start = time.perf_counter()
+
+        try:
+            return super().execute(query, vars)
+        finally:
+            self._record(query, time.perf_counter() - start)
+
+    def executemany(self, query: Any, vars_list: Any) -> Any:
+        start = time.perf_counter()
+
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            self._record(query, time.perf_counter() - start)
+
+
+@cache
+def counting_cursor(cursor_factory: type) -> type:
+    """The counting version of a cursor class, e.g. RealDictCursor"""
+    return type(
+        f"Counting{cursor_factory.__name__}", (_CountingCursor, cursor_factory), {}
+    )
+
+
+class CountingConnection(extensions.connection):
+    """A connection whose cursors are counted, whatever cursor_factory they ask for"""
+
+    def cursor(self, *args: Any, **kwargs: Any) -> extensions.cursor:
+        factory = kwargs.get("cursor_factory") or self.cursor_factory or extensions.cursor
+        kwargs["cursor_factory"] = counting_cursor(factory)
+
+        return super().cursor(*args, **kwargs)
+
+
+@contextmanager
+def query_budget(max_queries: int, max_repeats: int | None = None) -> Iterator[QueryLog]:
+    """Fail when the block runs more statements than its budget
+
+    Args:
+      max_queries (int): Most statements the block may run
+      max_repeats (int | None): Most times the block may run one statement, None for any
+
+    Raises:
+      AssertionError: When the block went over budget
+    """
+    log = QueryLog()
+
+    with collecting(log):
+        yield log
+
+    problems = log.over_budget(max_queries, max_repeats)
+
+    if problems:
+        raise AssertionError("Over the query budget:\n" + "\n".join(problems))
+
+
+def start_request_log() -> None:
+    g.query_log = QueryLog()
+
+
+def report_request_log(response: Response) -> Response:
+    """Send the request's totals back in debug mode, log requests over budget otherwise"""
+    log: QueryLog | None = g.get("query_log")
+
+    if log is None:
+        return response
+
+    if current_app.debug:
+        response.headers["X-DB-Queries"] = str(log.count)
+        response.headers["X-DB-Repeated-Queries"] = str(sum(log.repeats().values()))
+        response.headers["Server-Timing"] = (
+            f'db;dur={log.time * 1000:.1f};desc="{log.count} queries"'
+        )
+
+    problems = log.over_budget(MAX_QUERIES, MAX_REPEATS)
+
+    if problems:
+        current_app.logger.warning(
+            "%s %s went over the query budget: %s",
+            request.method,
+            request.path,
+            "; ".join(problems),
+        )
+
+    return response
+
+
+def init_query_log(app: Flask) -> None:
+    app.before_request(start_request_log)
+    app.after_request(report_request_log)
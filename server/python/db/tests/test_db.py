@@ -0,0 +1,236 @@
+import threading
+import pytest
+from unittest.mock import MagicMock, patch
+from flask import Flask
+from psycopg2 import extensions
+from db.db import ConnectionPool, PoolTimeout, get_conn, init_db, put_conn
+
+
+def fake_connection() -> MagicMock:
+    conn = MagicMock()
+    conn.closed = 0
+    conn.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+    return conn
+
+
+@patch("db.db.psycopg2.connect")
+class TestConnectionPool:
+    def test_reuses_returned_connections(self, mock_connect: MagicMock):
+        mock_connect.side_effect = lambda dsn, **kwargs: fake_connection()
+        conn_pool = ConnectionPool("dsn", min_size=1, max_size=2)
+
+        conn = conn_pool.getconn()
+        conn_pool.putconn(conn)
+
+        assert conn_pool.getconn() is conn
+        assert mock_connect.call_count == 1
+
+        stats = conn_pool.stats()
+        assert stats["checkouts"] == 2
+        assert stats["in_use"] == 1
+        assert stats["idle"] == 0
+
+    def test_waits_for_a_connection(self, mock_connect: MagicMock):
+        mock_connect.side_effect = lambda dsn, **kwargs: fake_connection()
+        conn_pool = ConnectionPool("dsn", min_size=0, max_size=1, timeout=5)
+        conn = conn_pool.getconn()
+
+        # Another thread returns the connection while this one is waiting
+        timer = threading.Timer(0.05, conn_pool.putconn, (conn,))
+        timer.start()
+
+        assert conn_pool.getconn() is conn
+        timer.join()
+
+        stats = conn_pool.stats()
+        assert stats["timeouts"] == 0
+        assert stats["max_wait_time"] > 0
+
+    def test_times_out_when_exhausted(self, mock_connect: MagicMock):
+        mock_connect.side_effect = lambda dsn, **kwargs: fake_connection()
+        conn_pool = ConnectionPool("dsn", min_size=0, max_size=1, timeout=0.01)
+        conn_pool.getconn()
+
+        with pytest.raises(PoolTimeout):
+            conn_pool.getconn()
+
+        assert conn_pool.stats()["timeouts"] == 1
+
+    def test_recycles_after_max_uses(self, mock_connect: MagicMock):
+        mock_connect.side_effect = lambda dsn, **kwargs: fake_connection()
+        conn_pool = ConnectionPool("dsn", min_size=0, max_size=1, max_uses=2)
+
+        first = conn_pool.getconn()
+        conn_pool.putconn(first)
+        conn_pool.putconn(conn_pool.getconn())
+
+        # The second return used the connection up, so a new one is opened
+        assert conn_pool.getconn() is not first
+        first.close.assert_called_once()
+        assert conn_pool.stats()["recycled"] == 1
+
+    def test_rolls_back_and_discards(self, mock_connect: MagicMock):
+        mock_connect.side_effect = lambda dsn, **kwargs: fake_connection()
+        conn_pool = ConnectionPool("dsn", min_size=0, max_size=2)
+
+        open_transaction = conn_pool.getconn()
+        open_transaction.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+        broken = conn_pool.getconn()
+        broken.closed = 2
+
+        conn_pool.putconn(open_transaction)
+        conn_pool.putconn(broken)
+
+        open_transaction.rollback.assert_called_once()
+        stats = conn_pool.stats()
+        assert stats["idle"] == 1
+        assert stats["discarded"] == 1
+        assert stats["size"] == 1
+
+
+@patch("db.db.get_pool")
+class TestRequestSession:
+    @staticmethod
+    def app() -> Flask:
+        app = Flask(__name__)
+        init_db(app)
+        return app
+
+    def test_one_connection_per_request(self, mock_get_pool: MagicMock):
+        app = TestRequestSession.app()
+        conn = fake_connection()
+        mock_get_pool.return_value.getconn.return_value = conn
+
+        with app.test_request_context("/course/1", method="GET"):
+            first = get_conn()
+            put_conn(first)
+            second = get_conn()
+            put_conn(second)
+
+            assert first is second is conn
+            # Only the end of the request gives the connection back
+            mock_get_pool.return_value.putconn.assert_not_called()
+
+        mock_get_pool.return_value.getconn.assert_called_once()
+        mock_get_pool.return_value.putconn.assert_called_once_with(conn)
+        # GET requests read from a single snapshot
+        conn.set_session.assert_any_call(
+            isolation_level=extensions.ISOLATION_LEVEL_REPEATABLE_READ
+        )
+        conn.rollback.assert_called_once()
+
+    def test_no_connection_unless_used(self, mock_get_pool: MagicMock):
+        app = TestRequestSession.app()
+
+        with app.test_request_context("/course/1", method="PATCH"):
+            pass
+
+        mock_get_pool.return_value.getconn.assert_not_called()
+        mock_get_pool.return_value.putconn.assert_not_called()
+
+    def test_outside_request(self, mock_get_pool: MagicMock):
+        conn = get_conn()
+        put_conn(conn)
+
+        mock_get_pool.return_value.putconn.assert_called_once_with(conn)
+
+
+@patch("db.db.REPLICA_DSNS", ["replica"])
+@patch("db.db.get_replica_pool")
+@patch("db.db.get_pool")
+class TestReplicaRouting:
+    def test_reads_go_to_a_replica(
+        self, mock_get_pool: MagicMock, mock_get_replica_pool: MagicMock
+    ):
+        app = TestRequestSession.app()
+        conn = fake_connection()
+        mock_get_replica_pool.return_value.getconn.return_value = conn
+
+        with app.test_request_context("/course/1", method="GET"):
+            assert get_conn() is conn
+
+        mock_get_pool.return_value.getconn.assert_not_called()
+        # The connection goes back to the pool it came from
+        mock_get_replica_pool.return_value.putconn.assert_called_once_with(conn)
+
+    def test_writes_go_to_the_primary(
+        self, mock_get_pool: MagicMock, mock_get_replica_pool: MagicMock
+    ):
+        app = TestRequestSession.app()
+        conn = fake_connection()
+        mock_get_pool.return_value.getconn.return_value = conn
+
+        with app.test_request_context("/course/1", method="PATCH"):
+            assert get_conn() is conn
+
+        mock_get_replica_pool.return_value.getconn.assert_not_called()
+        mock_get_pool.return_value.putconn.assert_called_once_with(conn)
+
+    @staticmethod
+    def worker(seen: MagicMock) -> Flask:
+        """An app like one gunicorn worker's, with routes that read and write"""
+        app = TestRequestSession.app()
+
+        @app.route("/course/1", methods=["GET", "PATCH"])
+        def course():
+            seen.get_conn_result = get_conn()
+            return "ok"
+
+        return app
+
+    def test_reads_after_a_write_go_to_the_primary_on_any_worker(
+        self, mock_get_pool: MagicMock, mock_get_replica_pool: MagicMock
+    ):
+        primary = fake_connection()
+        primary.cursor.return_value.__enter__.return_value.fetchone.return_value = (
+            "0/3000060",
+        )
+        replica = fake_connection()
+        replica_cur = replica.cursor.return_value.__enter__.return_value
+        mock_get_pool.return_value.getconn.return_value = primary
+        mock_get_replica_pool.return_value.getconn.return_value = replica
+        seen = MagicMock()
+
+        with patch("db.db.REPLICA_DSNS", ["replica"]):
+            writer = self.worker(seen).test_client()
+            reader = self.worker(seen).test_client()
+
+            # The write on one worker hands back the primary's WAL position
+            resp = writer.patch("/course/1")
+            lsn = resp.headers["X-DB-LSN"]
+            assert lsn == "0/3000060"
+
+            # Another worker reads from the primary while the replica lags behind it
+            replica_cur.fetchone.return_value = (False,)
+            reader.get("/course/1", headers={"X-DB-LSN": lsn})
+            assert seen.get_conn_result is primary
+            replica_cur.execute.assert_called_with(
+                "SELECT pg_last_wal_replay_lsn() >= %s::pg_lsn;", (lsn,)
+            )
+
+            # and from the replica once it has caught up
+            replica_cur.fetchone.return_value = (True,)
+            reader.get("/course/1", headers={"X-DB-LSN": lsn})
+            assert seen.get_conn_result is replica
+
+            # Clients that didn't write, or send garbage, aren't checked
+            replica_cur.execute.reset_mock()
+            resp = reader.get("/course/1", headers={"X-DB-LSN": "'; DROP"})
+            assert seen.get_conn_result is replica
+            assert "X-DB-LSN" not in resp.headers
+            replica_cur.execute.assert_not_called()
+
+
+class TestResetPool:
+    def test_reset_pool_keeps_inherited_connections(self):
+        import db.db
+
+        inherited = MagicMock()
+        db.db.conn_pool = inherited
+
+        db.db.reset_pool()
+
+        # A forked worker must not close the parent's sockets
+        inherited.closeall.assert_not_called()
+        assert db.db.conn_pool is None
+        assert inherited in db.db._inherited_pools
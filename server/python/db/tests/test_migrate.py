@@ -0,0 +1,128 @@
+from pathlib import Path
+import pytest
+from unittest.mock import MagicMock, call, patch
+from db import migrate
+from db.migrate import Migration, load_migrations, split_statements
+
+
+def write(directory: Path, name: str, text: str) -> None:
+    (directory / name).write_text(text)
+
+
+class TestLoadMigrations:
+    def test_orders_by_version(self, tmp_path: Path):
+        write(tmp_path, "0010_later.sql", "SELECT 10;")
+        write(tmp_path, "0002_earlier.sql", "-- migrate: no-transaction\nSELECT 2;")
+        write(tmp_path, "notes.txt", "not a migration")
+
+        migrations = load_migrations(tmp_path)
+
+        assert [(m.version, m.name, m.transactional) for m in migrations] == [
+            (2, "earlier", False),
+            (10, "later", True),
+        ]
+
+    def test_rejects_duplicate_versions(self, tmp_path: Path):
+        write(tmp_path, "0003_one.sql", "SELECT 1;")
+        write(tmp_path, "3_two.sql", "SELECT 2;")
+
+        with pytest.raises(ValueError):
+            load_migrations(tmp_path)
+
+    def test_shipped_migrations_load(self):
+        migrations = load_migrations()
+
+        assert [m.version for m in migrations] == sorted({m.version for m in migrations})
+        assert not next(m for m in migrations if m.name == "foreign_key_indexes").transactional
+
+
+def test_split_statements():
+    text = """-- migrate: no-transaction
+    -- a comment; with a semicolon
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS a ON t (x);
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS b
+        ON t (y); -- trailing
+    """
+
+    assert split_statements(text) == [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS a ON t (x)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS b ON t (y)",
+    ]
+
+
+def fake_connection(applied: list[int]) -> MagicMock:
+    conn = MagicMock()
+    cur = conn.cursor.return_value.__enter__.return_value
+    # Fetches in order: applied versions, then the invalid indexes check
+    cur.fetchall.side_effect = [[(version,) for version in applied], [("b",)]]
+    return conn
+
+
+@patch("db.migrate.psycopg2.connect")
+@patch("db.migrate.load_migrations")
+class TestMigrate:
+    migrations = [
+        Migration(1, "first", "ALTER TABLE t ADD COLUMN x INT;"),
+        Migration(
+            2,
+            "indexes",
+            "-- migrate: no-transaction\n"
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS a ON t (x);\n"
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS b ON t (y);\n",
+            transactional=False,
+        ),
+    ]
+
+    def executed(self, conn: MagicMock) -> list[str]:
+        cur = conn.cursor.return_value.__enter__.return_value
+        return [str(c.args[0]) for c in cur.execute.call_args_list]
+
+    def test_skips_applied_migrations(self, mock_load: MagicMock, mock_connect: MagicMock):
+        mock_load.return_value = self.migrations
+        conn = fake_connection(applied=[1, 2])
+        mock_connect.return_value = conn
+
+        assert migrate.migrate("dsn") == []
+
+        executed = self.executed(conn)
+        assert not any("ALTER TABLE" in sql or "CREATE INDEX" in sql for sql in executed)
+        assert "pg_advisory_unlock" in executed[-1]
+        conn.close.assert_called_once()
+
+    def test_applies_pending_migrations_in_order(
+        self, mock_load: MagicMock, mock_connect: MagicMock
+    ):
+        mock_load.return_value = self.migrations
+        conn = fake_connection(applied=[])
+        mock_connect.return_value = conn
+
+        applied = migrate.migrate("dsn")
+
+        assert [m.version for m in applied] == [1, 2]
+
+        cur = conn.cursor.return_value.__enter__.return_value
+        executed = self.executed(conn)
+        first = executed.index("ALTER TABLE t ADD COLUMN x INT;")
+        create_a = executed.index("CREATE INDEX CONCURRENTLY IF NOT EXISTS a ON t (x)")
+
+        # The transactional migration and its row commit together
+        assert "INSERT INTO schema_migrations" in executed[first + 1]
+        assert cur.execute.call_args_list[first + 1].args[1] == (1, "first")
+        # The invalid index is dropped before the statements run one by one
+        assert "indisvalid" in executed[first + 2]
+        assert "DROP INDEX CONCURRENTLY" in executed[first + 3]
+        assert create_a == first + 4
+        assert executed[create_a + 1] == "CREATE INDEX CONCURRENTLY IF NOT EXISTS b ON t (y)"
+        assert cur.execute.call_args_list[create_a + 2].args[1] == (2, "indexes")
+        assert conn.autocommit is True
+
+    def test_waits_for_the_database(self, mock_load: MagicMock, mock_connect: MagicMock):
+        mock_load.return_value = []
+        conn = fake_connection(applied=[])
+        mock_connect.side_effect = [migrate.psycopg2.OperationalError(), conn]
+
+        with patch("db.migrate.time.sleep") as mock_sleep:
+            migrate.migrate("dsn", wait=5)
+
+        mock_sleep.assert_called_once_with(1)
+        assert mock_connect.call_args_list == [call("dsn"), call("dsn")]
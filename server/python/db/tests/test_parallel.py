@@ -0,0 +1,87 @@
+import os
+import threading
+from unittest.mock import MagicMock, patch
+from flask import Flask
+from db import parallel
+
+app = Flask(__name__)
+
+
+def loads(names: list[str], barrier: threading.Barrier | None = None) -> dict:
+    def load(name: str):
+        def run(conn):
+            if barrier is not None:
+                barrier.wait(timeout=5)
+            return name, conn, threading.current_thread()
+
+        return run
+
+    return {name: load(name) for name in names}
+
+
+@patch("db.parallel.get_read_pool")
+class TestRunAll:
+    def test_sequential_by_default(self, mock_get_read_pool: MagicMock):
+        conn = MagicMock()
+
+        with app.test_request_context("/course/1", method="GET"):
+            results = parallel.run_all(loads(["a", "b"]), conn=conn)
+
+        assert {name: result[1] for name, result in results.items()} == {"a": conn, "b": conn}
+        mock_get_read_pool.assert_not_called()
+
+    @patch.dict(os.environ, {"DB_PARALLEL_CONNECTIONS": "3"})
+    def test_parallel_in_read_requests(self, mock_get_read_pool: MagicMock):
+        conn = MagicMock()
+        worker_conns = [MagicMock(), MagicMock()]
+        mock_get_read_pool.return_value.getconn.side_effect = worker_conns
+        # Only passes if all three loads run at the same time
+        barrier = threading.Barrier(3)
+
+        with app.test_request_context("/course/1", method="GET"):
+            results = parallel.run_all(loads(["a", "b", "c"], barrier), conn=conn)
+
+        assert list(results) == ["a", "b", "c"]
+        assert results["a"][1] is conn
+        assert results["a"][2] is threading.current_thread()
+        assert {results["b"][1], results["c"][1]} == set(worker_conns)
+
+        for worker_conn in worker_conns:
+            mock_get_read_pool.return_value.putconn.assert_any_call(worker_conn)
+
+    @patch.dict(os.environ, {"DB_PARALLEL_CONNECTIONS": "2"})
+    def test_request_cap(self, mock_get_read_pool: MagicMock):
+        conn = MagicMock()
+        mock_get_read_pool.return_value.getconn.side_effect = lambda: MagicMock()
+
+        a_started = threading.Event()
+        b_started = threading.Event()
+        request_loads = {
+            # "b" holds its slot until every load has been handed out
+            "a": lambda c: b_started.wait(timeout=5) and (a_started.set() or c),
+            "b": lambda c: b_started.set() or (a_started.wait(timeout=5) and c),
+            "c": lambda c: c,
+        }
+
+        with app.test_request_context("/course/1", method="GET"):
+            results = parallel.run_all(request_loads, conn=conn)
+
+        # One extra connection, the load without a slot runs on the caller's
+        assert [result is conn for result in results.values()] == [True, False, True]
+        assert mock_get_read_pool.return_value.getconn.call_count == 1
+
+    @patch.dict(os.environ, {"DB_PARALLEL_CONNECTIONS": "3"})
+    def test_sequential_when_writing(self, mock_get_read_pool: MagicMock):
+        conn = MagicMock()
+
+        with app.test_request_context("/course/1", method="PATCH"):
+            results = parallel.run_all(loads(["a", "b"]), conn=conn)
+
+        assert all(result[1] is conn for result in results.values())
+        mock_get_read_pool.assert_not_called()
+
+        # Outside of a request as well
+        results = parallel.run_all(loads(["a", "b"]), conn=conn)
+
+        assert all(result[1] is conn for result in results.values())
+        mock_get_read_pool.assert_not_called()
@@ -0,0 +1,69 @@
+import pytest
+from unittest.mock import MagicMock
+from db import queries
+
+
+def cursor(tracked: bool) -> MagicMock:
+    cur = MagicMock()
+
+    if tracked:
+        queries.track(cur.connection)
+
+    return cur
+
+
+class TestExecute:
+    def test_prepares_once_per_connection(self):
+        cur = cursor(tracked=True)
+
+        queries.execute(cur, "student_by_id", (1,))
+        queries.execute(cur, "student_by_id", (2,))
+
+        assert cur.execute.call_count == 3
+        (prepare,) = cur.execute.call_args_list[0][0]
+        assert " ".join(prepare.split()) == (
+            "PREPARE student_by_id AS SELECT * FROM students WHERE id = $1"
+        )
+        assert cur.execute.call_args_list[1][0] == ("EXECUTE student_by_id (%s);", (1,))
+        assert cur.execute.call_args_list[2][0] == ("EXECUTE student_by_id (%s);", (2,))
+
+        # A new connection prepares its own copy
+        other = cursor(tracked=True)
+        queries.execute(other, "student_by_id", (1,))
+        assert other.execute.call_count == 2
+
+    def test_untracked_connection_runs_sql(self):
+        cur = cursor(tracked=False)
+
+        queries.execute(cur, "student_by_id", (1,))
+
+        cur.execute.assert_called_once_with(queries.QUERIES["student_by_id"].sql, (1,))
+
+    def test_unprepared_query_runs_sql(self):
+        cur = cursor(tracked=True)
+
+        queries.execute(cur, "labels_by_students", ([1, 2],))
+
+        cur.execute.assert_called_once_with(
+            queries.QUERIES["labels_by_students"].sql, ([1, 2],)
+        )
+
+    def test_counts_calls(self):
+        before = queries.stats()["team_by_id"]
+
+        queries.execute(cursor(tracked=True), "team_by_id", (1,))
+        queries.execute(cursor(tracked=False), "team_by_id", (1,))
+
+        after = queries.stats()["team_by_id"]
+        assert after["calls"] == before["calls"] + 2
+        assert after["prepared_calls"] == before["prepared_calls"] + 1
+
+
+class TestRegister:
+    def test_register_is_idempotent(self):
+        sql = queries.QUERIES["team_by_id"].sql
+
+        assert queries.register("team_by_id", sql) == "team_by_id"
+
+        with pytest.raises(ValueError):
+            queries.register("team_by_id", "SELECT 1;")
@@ -0,0 +1,126 @@
+import pytest
+from unittest.mock import patch
+from flask import Flask
+from psycopg2 import sql
+from db import query_log
+from db.query_log import QueryLog, collecting, counting_cursor, init_query_log, query_budget
+
+
+class FakeCursor:
+    def __init__(self):
+        self.executed = []
+
+    def execute(self, query, vars=None):
+        self.executed.append((query, vars))
+
+    def executemany(self, query, vars_list):
+        self.executed.append((query, vars_list))
+
+
+class TestCountingCursor:
+    def test_records_statements_to_active_logs(self):
+        cur = counting_cursor(FakeCursor)()
+        log = QueryLog()
+
+        with collecting(log):
+            cur.execute("SELECT *\n    FROM students\n    WHERE id = %s", (1,))
+            cur.execute("SELECT * FROM students WHERE id = %s", (2,))
+            cur.executemany("DELETE FROM labels WHERE id = %s", [(1,), (2,)])
+
+        cur.execute("SELECT 1")
+
+        # The statements still run, and only the ones inside the block are counted
+        assert len(cur.executed) == 4
+        assert log.count == 3
+        assert log.statements == {
+            "SELECT * FROM students WHERE id = %s": 2,
+            "DELETE FROM labels WHERE id = %s": 1,
+        }
+        assert log.repeats() == {"SELECT * FROM students WHERE id = %s": 2}
+
+    def test_records_failed_statements(self):
+        class FailingCursor(FakeCursor):
+            def execute(self, query, vars=None):
+                raise ValueError()
+
+        cur = counting_cursor(FailingCursor)()
+        log = QueryLog()
+
+        with collecting(log), pytest.raises(ValueError):
+            cur.execute("SELECT 1")
+
+        assert log.count == 1
+
+    def test_composed_statements(self):
+        cur = counting_cursor(FakeCursor)()
+        log = QueryLog()
+
+        with patch.object(sql.Composed, "as_string", return_value='DROP INDEX "a"'):
+            with collecting(log):
+                cur.execute(sql.SQL("DROP INDEX {}").format(sql.Identifier("a")))
+
+        assert log.statements == {'DROP INDEX "a"': 1}
+
+    def test_class_is_cached(self):
+        assert counting_cursor(FakeCursor) is counting_cursor(FakeCursor)
+
+
+class TestQueryBudget:
+    def test_within_budget(self):
+        with query_budget(2, max_repeats=1) as log:
+            query_log.record("SELECT 1", 0.001)
+            query_log.record("SELECT 2", 0.001)
+
+        assert log.count == 2
+
+    def test_too_many_queries(self):
+        with pytest.raises(AssertionError, match="3 queries, budget is 2"):
+            with query_budget(2):
+                for i in range(3):
+                    query_log.record(f"SELECT {i}", 0.001)
+
+    def test_repeated_query(self):
+        with pytest.raises(AssertionError, match="3x \\(budget 2\\): SELECT 1"):
+            with query_budget(10, max_repeats=2):
+                for _ in range(3):
+                    query_log.record("SELECT 1", 0.001)
+
+
+class TestRequestLog:
+    @pytest.fixture()
+    def app(self) -> Flask:
+        app = Flask(__name__)
+        init_query_log(app)
+
+        @app.route("/")
+        def index():
+            for _ in range(3):
+                query_log.record("SELECT * FROM students WHERE id = %s", 0.002)
+
+            return "ok"
+
+        return app
+
+    def test_headers_in_debug_mode(self, app: Flask):
+        app.debug = True
+        resp = app.test_client().get("/")
+
+        assert resp.headers["X-DB-Queries"] == "3"
+        assert resp.headers["X-DB-Repeated-Queries"] == "3"
+        assert resp.headers["Server-Timing"] == 'db;dur=6.0;desc="3 queries"'
+
+    def test_logs_requests_over_budget(self, app: Flask):
+        with patch.object(query_log, "MAX_REPEATS", 2), patch.object(
+            app.logger, "warning"
+        ) as mock_warning:
+            resp = app.test_client().get("/")
+
+        assert "X-DB-Queries" not in resp.headers
+        mock_warning.assert_called_once()
+        assert mock_warning.call_args.args[1:3] == ("GET", "/")
+
+    def test_quiet_within_budget(self, app: Flask):
+        with patch.object(app.logger, "warning") as mock_warning:
+            app.test_client().get("/")
+
+        mock_warning.assert_not_called()
@@ -1,6 +1,9 @@
-from typing import TypeVar
+from collections import defaultdict
+from typing import Any, Iterable, TypeVar
+from flask import Response, g, request
 from flask_jwt_extended import get_jwt
-from classes import Course, Section, Student
+from werkzeug.http import parse_options_header
+from classes import Course, Label
 
 
 class FALAFELException(Exception):
@@ -28,54 +31,258 @@ class UnauthorizedException(FALAFELException):
     message = "Unauthorized"
 
 
-T = TypeVar("T", Course, Section, Student)
+class NotModifiedException(FALAFELException):
+    status = 304
+    message = "Not Modified"
 
 
-def check_exists_and_owned(item: T | None, path_parts: list[int] | None = None) -> T:
+T = TypeVar("T", Course, Label)
+
+
+def check_exists_and_owned(item: T | None) -> T:
     """Check if the passed in item is not None and is owned by the current user.
 
+    Only for top-level items that carry their own owner_id, like courses and labels.
+    Anything nested under a course is checked with check_path_owned.
+
     Args:
-      item (Course | Section | Student | None): The entity to check ownership of
-      path_parts (list[int]): A list of all relevant parameters, in order [course_id, section_id, student_id]
+      item (Course | Label | None): The entity to check ownership of
 
     Returns:
       The item (non-None) if existent and owned by current user
 
     Raises:
       NotFoundException: If the item is None
-      UnauthorizedException: If the current user doesn't own the item
+      ForbiddenException: If the current user doesn't own the item
     """
-    if path_parts is None:
-        path_parts = []
-
     if item is None:
         raise NotFoundException()
 
     user = get_jwt()
 
-    if item.get("owner_id"):
-        # Course item
-        if user["sub"] != item.get("owner_id"):
-            raise ForbiddenException()
-    elif item.get("course_id"):
-        # Section item
-        from services import course_services
+    if user["sub"] != item.get("owner_id"):
+        raise ForbiddenException()
 
-        course = course_services.get_course_by_id(course_id=item.get("course_id", -1))
+    return item
 
-        if not course or course["id"] != int(path_parts[0]):
-            raise NotFoundException()
 
-        check_exists_and_owned(course, path_parts=path_parts)
-    elif item.get("section_id"):
-        # Student item
-        from services import section_services
+def check_path_owned(
+    course_id: int,
+    section_id: int | None = None,
+    student_id: int | None = None,
+    team_id: int | None = None,
+) -> None:
+    """Check that a route's path exists and its course is owned by the current user.
 
-        section = section_services.get_section_by_id(item.get("section_id", -1))
+    The whole path and the owner are resolved in one query, without loading the
+    entities or any of their children. Paths the user was already shown to own are
+    answered from the ownership cache without a query.
 
-        if not section or section["id"] != int(path_parts[1]):
-            raise NotFoundException()
+    Args:
+      course_id (int): The course in the path
+      section_id (int | None): The section in the path, if any
+      student_id (int | None): The student in the path, if any (requires section_id)
+      team_id (int | None): The team in the path, if any
 
-        check_exists_and_owned(section, path_parts=path_parts)
+    Raises:
+      NotFoundException: If any part of the path doesn't exist or belong to its parent
+      ForbiddenException: If the current user doesn't own the course
+    """
+    from services import ownership_services
 
-    return item
+    user_id = get_jwt()["sub"]
+    path = {"section_id": section_id, "student_id": student_id, "team_id": team_id}
+
+    if ownership_services.ownership_cache.contains(user_id, course_id, **path):
+        return
+
+    owner_id = ownership_services.get_path_owner(course_id, **path)
+
+    if owner_id is None:
+        raise NotFoundException()
+
+    if user_id != owner_id:
+        raise ForbiddenException()
+
+    ownership_services.ownership_cache.add(user_id, course_id, **path)
+
+
+def check_not_modified(course_id: int, variant: str | None = None) -> None:
+    """Tag the response with the course's version and stop early if the client has it.
+
+    The ETag comes from the course's version, which the database bumps on every
+    write to the course or anything under it, so answering a refetch of an
+    unchanged course costs a single indexed lookup. Call it after the path's
+    ownership was checked.
+
+    Args:
+      course_id (int): The course the route reads from
+      variant (str | None): The representation served, when the route has several
+
+    Raises:
+      NotFoundException: If the course doesn't exist
+      NotModifiedException: If the request's If-None-Match has the current ETag
+    """
+    from services import course_services
+
+    version = course_services.get_course_version(course_id)
+
+    if version is None:
+        raise NotFoundException()
+
+    g.etag = f"course-{course_id}-v{version}" + (f"-{variant}" if variant else "")
+
+    if request.if_none_match.contains_weak(g.etag):
+        raise NotModifiedException()
+
+
+def add_etag(response: Response) -> Response:
+    """Put the ETag set by check_not_modified on the response"""
+    etag = g.pop("etag", None)
+
+    if etag is not None and response.status_code in (200, 304):
+        response.set_etag(etag, weak=True)
+        # Let clients keep the response, but only use it after revalidating
+        response.headers["Cache-Control"] = "private, no-cache"
+        # The same URL is served normalized and compressed depending on these
+        response.vary.update(("Accept", "Accept-Encoding"))
+
+    return response
+
+
+def group_by_parent(rows: Iterable[dict[str, Any]]) -> dict[int, list[dict[str, Any]]]:
+    """Bucket rows from a batched child query by their `parent_id` column.
+
+    The `parent_id` column is removed from each row so the child keeps the same
+    shape as the equivalent single-parent lookup.
+
+    Args:
+      rows (Iterable[dict]): Rows selected with a `parent_id` column
+
+    Returns:
+      A dict of parent id to the list of its child rows
+    """
+    grouped: dict[int, list[dict[str, Any]]] = defaultdict(list)
+
+    for row in rows:
+        grouped[row.pop("parent_id")].append(row)
+
+    return grouped
+
+
+CHILD_COLLECTIONS = {"sections", "teams", "students", "labels", "comments", "experiences"}
+# Keys of the returned entities that come out of a child collection with another name,
+# so `include` takes the same names as `fields`
+CHILD_ALIASES = {"languages": "experiences", "frameworks": "experiences"}
+
+
+def wants_child(name: str, depth: int | None, include: set[str] | None) -> bool:
+    """Check whether a child collection should be loaded.
+
+    Args:
+      name (str): The child collection, one of CHILD_COLLECTIONS
+      depth (int | None): How many levels may still be loaded below the parent, None for no limit
+      include (set[str] | None): The child collections that may be loaded, None for all of them
+
+    Returns:
+      True if the child collection is within both the depth and the include set
+    """
+    return (depth is None or depth > 0) and (include is None or name in include)
+
+
+def child_depth(depth: int | None) -> int | None:
+    """The depth left for the children of an entity loaded with `depth`"""
+    return None if depth is None else depth - 1
+
+
+def get_read_options(
+    root_children: Iterable[str] = (),
+) -> tuple[dict[str, Any], set[str] | None]:
+    """Parse the `depth`, `include` and `fields` query parameters of a GET request.
+
+    `depth` limits how many levels of children are loaded, `include` limits which child
+    collections are loaded at any level and `fields` limits the keys of the returned
+    entities. Without any of them the full nesting is returned.
+
+    Args:
+      root_children (Iterable[str]): The child collections directly below the returned entity.
+        When `fields` names none of them, no children are loaded at all.
+
+    Returns:
+      The `depth`/`include` keyword arguments for the service call, and the requested fields
+
+    Raises:
+      BadRequestException: If a parameter is malformed or names an unknown collection
+    """
+    depth: int | None = None
+    include: set[str] | None = None
+    fields: set[str] | None = None
+
+    if "depth" in request.args:
+        try:
+            depth = int(request.args["depth"])
+        except ValueError:
+            raise BadRequestException()
+
+        if depth < 0:
+            raise BadRequestException()
+
+    if "include" in request.args:
+        include = {
+            CHILD_ALIASES.get(name, name) for name in request.args["include"].split(",") if name
+        }
+
+        if not include <= CHILD_COLLECTIONS:
+            raise BadRequestException()
+
+    if "fields" in request.args:
+        fields = {name for name in request.args["fields"].split(",") if name}
+
+        if depth is None and not fields & set(root_children):
+            depth = 0
+
+    return {"depth": depth, "include": include}, fields
+
+
+def wants_normalized() -> bool:
+    """Check whether a GET asked for the normalized format instead of the nested one.
+
+    It is asked for with `?format=normalized`, or with an Accept of
+    `application/json; profile=normalized`. `?format=nested` asks for the default.
+
+    Raises:
+      BadRequestException: If `format` names an unknown format
+    """
+    response_format = request.args.get("format")
+
+    if response_format is not None:
+        if response_format not in ("nested", "normalized"):
+            raise BadRequestException()
+
+        return response_format == "normalized"
+
+    for value, quality in request.accept_mimetypes:
+        mimetype, options = parse_options_header(value)
+
+        if (
+            quality > 0
+            and mimetype == "application/json"
+            and options.get("profile") == "normalized"
+        ):
+            return True
+
+    return False
+
+
+def select_fields(data: Any, fields: set[str] | None) -> Any:
+    """Drop every key not in `fields` from an entity or a list of entities.
+
+    The `id` key is always kept so the client can still address what it received.
+    """
+    if fields is None or data is None:
+        return data
+
+    if isinstance(data, list):
+        return [select_fields(item, fields) for item in data]
+
+    return {key: val for key, val in data.items() if key in fields or key == "id"}
@@ -0,0 +1,73 @@
+"""gunicorn settings for serving the API
+
+Run with `gunicorn -c gunicorn.conf.py`. Every setting can be overridden from
+the environment, see the README.
+"""
+
+import multiprocessing
+import os
+import tempfile
+
+wsgi_app = "app:app"
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# Processes for the cores, threads for the time each request waits on Postgres
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+# A request holds at most DB_PARALLEL_CONNECTIONS connections, see db/parallel.py
+os.environ.setdefault(
+    "DB_POOL_MAX_SIZE",
+    str(threads * int(os.getenv("DB_PARALLEL_CONNECTIONS", "1"))),
+)
+
+# On SIGTERM workers stop accepting and get this long to finish in-flight requests
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+keepalive = 5
+
+# Reload on code changes in development, otherwise import the app once and fork
+reload = os.getenv("FLASK_ENV") == "development"
+preload_app = not reload
+
+# Workers share their metrics through snapshots here, see metrics.py
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "crm-metrics"))
+
+accesslog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+
+def on_starting(server):
+    from metrics import clear_snapshots
+
+    clear_snapshots()
+
+    # Bring the schema up to date once, before any worker serves a request
+    if os.getenv("DB_MIGRATE_ON_START", "1") == "1":
+        from db.migrate import migrate
+
+        migrate(wait=float(os.getenv("DB_MIGRATE_WAIT", "30")))
+
+
+def post_fork(server, worker):
+    from db.db import reset_pool
+    from db.parallel import reset_executor
+    from metrics import start_worker
+
+    reset_pool()
+    reset_executor()
+    start_worker()
+
+
+def worker_exit(server, worker):
+    from db.db import close_pool
+
+    close_pool()
+
+
+def child_exit(server, worker):
+    from metrics import remove_snapshot
+
+    # Its series end with it, scrapes only serve live workers
+    remove_snapshot(worker.pid)
@@ -0,0 +1,389 @@
+"""Per-route request metrics in the Prometheus text format
+
+Every request is counted by blueprint, route, method and status class, with
+histograms of its latency, response size, time spent in Postgres and time
+spent waiting for a pooled connection. GET /metrics serves them together with
+the connection pool and prepared statement counters, and the time the
+collection itself took.
+
+Every process keeps its own metrics. Under gunicorn METRICS_DIR is set, each
+worker writes a snapshot of its metrics there every METRICS_FLUSH_SECONDS, and
+a scrape, whichever worker takes it, serves every live worker's samples
+labelled with its pid. Sum over `pid` to aggregate, a worker that exits takes
+its series with it instead of making a counter go back down.
+
+/metrics only answers requests carrying `Authorization: Bearer $METRICS_TOKEN`,
+and is off while that is unset. The source address can't vouch for a scrape,
+everything Caddy forwards and the published port both arrive from the private
+Docker network.
+"""
+
+import bisect
+import copy
+import hmac
+import json
+import os
+import threading
+import time
+import traceback
+from typing import Any, Iterable
+from flask import Flask, Response, g, request
+from db import queries
+from db.db import pool_stats
+from extensions import ForbiddenException
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Where gunicorn workers share their snapshots, see gunicorn.conf.py
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "1"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _samples(name: str, kind: str, help: str, values: dict[Labels, float]) -> Iterable[str]:
+    yield f"# HELP {name} {help}"
+    yield f"# TYPE {name} {kind}"
+
+    for labels, value in values.items():
+        yield f"{name}{_format_labels(labels)} {_format_value(value)}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: dict[Labels, float] = {}
+
+    def inc(self, labels: Labels, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self, values: dict[Labels, float] | None = None) -> Iterable[str]:
+        """The samples of `values`, this process's own by default"""
+        if values is None:
+            values = self.values
+
+        return _samples(self.name, "counter", self.help, values)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # labels -> [count per bucket, the last one for above every bucket], sum
+        self.values: dict[Labels, tuple[list[int], list[float]]] = {}
+
+    def observe(self, labels: Labels, value: float) -> None:
+        counts, total = self.values.setdefault(
+            labels, ([0] * (len(self.buckets) + 1), [0.0])
+        )
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def render(
+        self, values: dict[Labels, tuple[list[int], list[float]]] | None = None
+    ) -> Iterable[str]:
+        """The samples of `values`, this process's own by default"""
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+
+        if values is None:
+            values = self.values
+
+        for labels, (counts, total) in values.items():
+            cumulative = 0
+
+            for bound, count in zip([*self.buckets, "+Inf"], counts):
+                cumulative += count
+                le = bound if bound == "+Inf" else _format_value(bound)
+                yield f"{self.name}_bucket{_format_labels((*labels, ('le', le)))} {cumulative}"
+
+            yield f"{self.name}_sum{_format_labels(labels)} {_format_value(total[0])}"
+            yield f"{self.name}_count{_format_labels(labels)} {cumulative}"
+
+
+_lock = threading.Lock()
+
+requests_total = Counter("http_requests_total", "Requests by route and status class")
+request_seconds = Histogram(
+    "http_request_duration_seconds", "Time to produce the response", LATENCY_BUCKETS
+)
+response_bytes = Histogram(
+    "http_response_size_bytes", "Size of the response body as sent", SIZE_BUCKETS
+)
+db_seconds = Histogram(
+    "http_request_db_seconds", "Time the request spent running statements", LATENCY_BUCKETS
+)
+db_queries = Counter("http_request_db_queries_total", "Statements run by requests")
+pool_wait_seconds = Histogram(
+    "http_request_pool_wait_seconds",
+    "Time the request waited for a pooled connection",
+    LATENCY_BUCKETS,
+)
+exceptions_total = Counter(
+    "http_request_exceptions_total", "Unhandled exceptions answered with a 500"
+)
+overhead_seconds = Counter(
+    "metrics_overhead_seconds_total", "Time spent collecting and rendering these metrics"
+)
+
+REQUEST_METRICS = [
+    requests_total,
+    request_seconds,
+    response_bytes,
+    db_seconds,
+    db_queries,
+    pool_wait_seconds,
+    exceptions_total,
+    overhead_seconds,
+]
+
+
+def _route_labels() -> Labels:
+    rule = request.url_rule
+
+    return (
+        ("blueprint", request.blueprint or ""),
+        ("route", rule.rule if rule is not None else "unmatched"),
+        ("method", request.method),
+    )
+
+
+def start_request() -> None:
+    g.metrics_start = time.perf_counter()
+
+
+def record_request(response: Response) -> Response:
+    """Count the finished response, registered first so it runs after every other hook"""
+    start = g.get("metrics_start")
+
+    if start is None or request.endpoint == "metrics":
+        return response
+
+    now = time.perf_counter()
+    labels = _route_labels()
+    query_log = g.get("query_log")
+
+    with _lock:
+        requests_total.inc((*labels, ("status", f"{response.status_code // 100}xx")))
+        request_seconds.observe(labels, now - start)
+
+        if response.content_length is not None:
+            response_bytes.observe(labels, response.content_length)
+
+        if query_log is not None:
+            db_seconds.observe(labels, query_log.time)
+            db_queries.inc(labels, query_log.count)
+
+        if "db_pool_wait" in g:
+            pool_wait_seconds.observe(labels, g.db_pool_wait)
+
+        overhead_seconds.inc((), time.perf_counter() - now)
+
+    return response
+
+
+def record_exception(error: BaseException) -> None:
+    """Count an exception no other error handler answered"""
+    labels = (*_route_labels(), ("exception", type(error).__name__))
+
+    with _lock:
+        exceptions_total.inc(labels)
+
+
+POOL_METRICS = [
+    ("db_pool_checkouts_total", "counter", "checkouts", "Connections checked out"),
+    ("db_pool_timeouts_total", "counter", "timeouts", "Checkouts that timed out"),
+    ("db_pool_wait_seconds_total", "counter", "wait_time", "Time spent waiting for checkouts"),
+    ("db_pool_max_wait_seconds", "gauge", "max_wait_time", "Longest wait for a checkout"),
+    ("db_pool_connections", "gauge", "size", "Open connections"),
+    ("db_pool_connections_in_use", "gauge", "in_use", "Connections checked out now"),
+    ("db_pool_max_connections", "gauge", "max_size", "Most connections the pool opens"),
+]
+STATEMENT_METRICS = [
+    ("db_statement_calls_total", "counter", "calls", "Runs of each registered statement"),
+    (
+        "db_statement_seconds_total",
+        "counter",
+        "total_time",
+        "Time spent running each registered statement",
+    ),
+]
+
+
+def _stats_lines(
+    metrics: list[tuple[str, str, str, str]],
+    label: str,
+    workers: dict[str | None, dict[str, Any]],
+    source: str,
+) -> Iterable[str]:
+    for name, kind, key, help in metrics:
+        values = {
+            (*_pid_label(pid), (label, owner)): stat[key]
+            for pid, worker in workers.items()
+            for owner, stat in worker[source].items()
+        }
+        yield from _samples(name, kind, help, values)
+
+
+def _pid_label(pid: str | None) -> Labels:
+    return (("pid", pid),) if pid is not None else ()
+
+
+def _snapshot() -> dict[str, Any]:
+    """Everything this process has collected, copied so it can be read without the lock"""
+    with _lock:
+        request_values = {metric.name: copy.deepcopy(metric.values) for metric in REQUEST_METRICS}
+
+    return {"requests": request_values, "pools": pool_stats(), "statements": queries.stats()}
+
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(METRICS_DIR, f"{pid}.json")
+
+
+def write_snapshot() -> None:
+    """Save this worker's snapshot to METRICS_DIR for the other workers' scrapes"""
+    snapshot = _snapshot()
+    snapshot["requests"] = {
+        name: [[labels, value] for labels, value in values.items()]
+        for name, values in snapshot["requests"].items()
+    }
+    path = _snapshot_path(os.getpid())
+
+    # Written aside and renamed, so a scrape never reads half a file
+    with open(path + ".tmp", "w") as f:
+        json.dump(snapshot, f)
+
+    os.replace(path + ".tmp", path)
+
+
+def _read_snapshots() -> dict[str | None, dict[str, Any]]:
+    """The latest snapshot of every other worker in METRICS_DIR, by pid"""
+    workers: dict[str | None, dict[str, Any]] = {}
+
+    for name in os.listdir(METRICS_DIR):
+        pid, extension = os.path.splitext(name)
+
+        if extension != ".json" or pid == str(os.getpid()):
+            continue
+
+        try:
+            with open(os.path.join(METRICS_DIR, name)) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            # The worker exited and its file was removed while listing
+            continue
+
+        snapshot["requests"] = {
+            metric: {tuple(map(tuple, labels)): value for labels, value in values}
+            for metric, values in snapshot["requests"].items()
+        }
+        workers[pid] = snapshot
+
+    return workers
+
+
+def _flush_snapshots() -> None:
+    while True:
+        time.sleep(FLUSH_SECONDS)
+
+        try:
+            write_snapshot()
+        except Exception:
+            traceback.print_exc()
+
+
+def start_worker() -> None:
+    """Start sharing this worker's metrics, called by gunicorn in each new worker"""
+    with _lock:
+        for metric in REQUEST_METRICS:
+            metric.values.clear()
+
+    if METRICS_DIR:
+        threading.Thread(target=_flush_snapshots, name="metrics-flush", daemon=True).start()
+
+
+def clear_snapshots() -> None:
+    """Create METRICS_DIR, or empty what a previous run left there, called by gunicorn on start"""
+    os.makedirs(METRICS_DIR, exist_ok=True)
+
+    for name in os.listdir(METRICS_DIR):
+        os.remove(os.path.join(METRICS_DIR, name))
+
+
+def remove_snapshot(pid: int) -> None:
+    """Drop the snapshot of a worker that exited, called by gunicorn's arbiter"""
+    try:
+        os.remove(_snapshot_path(pid))
+    except FileNotFoundError:
+        pass
+
+
+def render() -> str:
+    """Every metric in the Prometheus text exposition format"""
+    start = time.perf_counter()
+
+    if METRICS_DIR:
+        workers = _read_snapshots()
+        workers[str(os.getpid())] = _snapshot()
+    else:
+        workers = {None: _snapshot()}
+
+    lines = []
+
+    for metric in REQUEST_METRICS:
+        values = {
+            (*_pid_label(pid), *labels): value
+            for pid, worker in workers.items()
+            for labels, value in worker["requests"].get(metric.name, {}).items()
+        }
+        lines += metric.render(values)
+
+    lines += _stats_lines(POOL_METRICS, "pool", workers, "pools")
+    lines += _stats_lines(STATEMENT_METRICS, "statement", workers, "statements")
+
+    with _lock:
+        overhead_seconds.inc((), time.perf_counter() - start)
+
+    return "\n".join(lines) + "\n"
+
+
+def _allowed() -> bool:
+    if not METRICS_TOKEN:
+        return False
+
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+
+    return hmac.compare_digest(token, METRICS_TOKEN)
+
+
+def metrics() -> Response:
+    if not _allowed():
+        raise ForbiddenException()
+
+    return Response(render(), mimetype="text/plain; version=0.0.4")
+
+
+def init_metrics(app: Flask) -> None:
+    app.before_request(start_request)
+    app.after_request(record_request)
+    app.add_url_rule("/metrics", endpoint="metrics", view_func=metrics, methods=["GET"])
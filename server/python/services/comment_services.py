@@ -1,8 +1,10 @@
 from typing import Any, cast
+from psycopg2.extensions import connection
 from psycopg2.extras import RealDictCursor, RealDictRow
 from classes import Comment
+from db import queries
 from db.db import get_conn, put_conn
-from extensions import BadRequestException
+from extensions import BadRequestException, group_by_parent
 
 
 def create_team_comment(team_id: int, content: str) -> Comment:
@@ -41,15 +43,7 @@ def get_comments_by_team(team_id: int):
 
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                """
-                SELECT c.*
-                FROM comments c
-                JOIN teams_comments tc ON c.id = tc.comment_id
-                WHERE tc.team_id = %s;
-                """,
-                (team_id,),
-            )
+            queries.execute(cur, "comments_by_team", (team_id,))
             results = cur.fetchall()
 
             for row in results:
@@ -98,15 +92,7 @@ def get_comments_by_student(student_id: int):
 
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                """
-                SELECT c.*
-                FROM comments c
-                JOIN students_comments sc ON c.id = sc.comment_id
-                WHERE sc.student_id = %s;
-                """,
-                (student_id,),
-            )
+            queries.execute(cur, "comments_by_student", (student_id,))
             results = cur.fetchall()
 
             for row in results:
@@ -119,6 +105,42 @@ def get_comments_by_student(student_id: int):
         put_conn(conn)
 
 
+def get_comments_by_students(
+    student_ids: list[int], conn: connection | None = None
+) -> dict[int, list[Comment]]:
+    """Get the comments of many students in one query, keyed by student id"""
+    if not student_ids:
+        return {}
+
+    use_conn: connection = conn or get_conn()
+
+    try:
+        with use_conn.cursor(cursor_factory=RealDictCursor) as cur:
+            queries.execute(cur, "comments_by_students", (student_ids,))
+            return cast(dict[int, list[Comment]], group_by_parent(cur.fetchall()))
+    finally:
+        if not conn:
+            put_conn(use_conn)
+
+
+def get_comments_by_teams(
+    team_ids: list[int], conn: connection | None = None
+) -> dict[int, list[Comment]]:
+    """Get the comments of many teams in one query, keyed by team id"""
+    if not team_ids:
+        return {}
+
+    use_conn: connection = conn or get_conn()
+
+    try:
+        with use_conn.cursor(cursor_factory=RealDictCursor) as cur:
+            queries.execute(cur, "comments_by_teams", (team_ids,))
+            return cast(dict[int, list[Comment]], group_by_parent(cur.fetchall()))
+    finally:
+        if not conn:
+            put_conn(use_conn)
+
+
 def update_comment(comment_id: int, content: str) -> Comment | None:
     conn = get_conn()
 
@@ -1,22 +1,28 @@
 from typing import cast
 from psycopg2.extras import RealDictCursor, RealDictRow
 from classes import Course
+from db import queries
 from db.db import get_conn, put_conn
-from services import section_services, team_services
+from extensions import NotFoundException
+from services import ownership_services, tree_services
 
 
-def _fill_course_children(course: RealDictRow | None) -> None:
+def _fill_course_children(
+    course: RealDictRow | None,
+    depth: int | None = None,
+    include: set[str] | None = None,
+) -> None:
     """Get all children of courses
 
     Args:
       course (dict[str, Any]): The course dict returned by the RealDictCursor
+      depth (int | None): How many levels of children to load, None for all
+      include (set[str] | None): Which child collections to load, None for all
     """
     if not course:
         return
-    course["sections"] = section_services.get_sections_by_course(
-        course_id=course.get("id", -1)
-    )
-    course["teams"] = team_services.get_teams_by_course(course_id=course.get("id", -1))
+
+    tree_services.fill_course_trees([course], depth=depth, include=include)
 
 
 def create_course(
@@ -27,10 +33,10 @@ def create_course(
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
-                """
+                f"""
                 INSERT INTO courses (owner_id, name, code, term)
                 VALUES (%s, %s, %s, %s)
-                RETURNING *;
+                RETURNING {queries.COURSE_COLUMNS};
                 """,
                 (owner_id, name, code, term),
             )
@@ -47,52 +53,61 @@ def create_course(
         put_conn(conn)
 
 
-def get_courses(owner_id: int) -> list[Course]:
+def get_courses(
+    owner_id: int, depth: int | None = None, include: set[str] | None = None
+) -> list[Course]:
     conn = get_conn()
 
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                """
-                SELECT *
-                FROM courses
-                WHERE owner_id = %s
-                ORDER BY id;
-                """,
-                (owner_id,),
-            )
+            queries.execute(cur, "courses_by_owner", (owner_id,))
             results = cur.fetchall()
 
-        for course in results:
-            _fill_course_children(course)
+        tree_services.fill_course_trees(results, depth=depth, include=include)
 
         return cast(list[Course], results)
     finally:
         put_conn(conn)
 
 
-def get_course_by_id(course_id: int) -> Course | None:
+def get_course_by_id(
+    course_id: int, depth: int | None = None, include: set[str] | None = None
+) -> Course | None:
     conn = get_conn()
 
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                """
-                SELECT *
-                FROM courses
-                WHERE id = %s;
-                """,
-                (course_id,),
-            )
+            queries.execute(cur, "course_by_id", (course_id,))
             result = cur.fetchone()
 
-            _fill_course_children(result)
+            _fill_course_children(result, depth=depth, include=include)
 
             return cast(Course | None, result)
     finally:
         put_conn(conn)
 
 
+def get_course_version(course_id: int) -> int | None:
+    """Get the version of a course, which every write to it or under it bumps
+
+    Args:
+      course_id (int): The course to look up
+
+    Returns:
+      The version, or None if the course doesn't exist
+    """
+    conn = get_conn()
+
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            queries.execute(cur, "course_version", (course_id,))
+            result = cur.fetchone()
+
+            return result["version"] if result else None
+    finally:
+        put_conn(conn)
+
+
 def update_course(course_id: int, data: dict) -> Course | None:
     conn = get_conn()
 
@@ -114,13 +129,17 @@ def update_course(course_id: int, data: dict) -> Course | None:
             UPDATE courses 
             SET {", ".join(fields)}
             WHERE id = %s
-            RETURNING *;
+            RETURNING {queries.COURSE_COLUMNS};
         """
 
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(query, values)
             result = cur.fetchone()
 
+            # The course was deleted, maybe through a worker whose cache forgot it
+            if result is None:
+                raise NotFoundException()
+
             _fill_course_children(result)
 
             conn.commit()
@@ -142,6 +161,7 @@ def delete_course(course_id: int) -> int:
                 (course_id,),
             )
             conn.commit()
+            ownership_services.ownership_cache.invalidate_course(course_id)
             return cur.rowcount
     finally:
         put_conn(conn)
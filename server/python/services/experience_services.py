@@ -1,4 +1,7 @@
+from db import queries
 from db.db import get_conn, put_conn
+from extensions import group_by_parent
+from psycopg2.extensions import connection
 from psycopg2.extras import RealDictCursor
 
 
@@ -7,16 +10,7 @@ def get_languages_by_student(student_id: int):
 
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                """
-                    SELECT e.id, e.name
-                    FROM experiences e
-                    JOIN students_experiences se
-                    ON se.student_id = %s AND se.experience_id = e.id
-                    WHERE e.type = 'language';
-                """,
-                (student_id,),
-            )
+            queries.execute(cur, "languages_by_student", (student_id,))
             results = cur.fetchall()
 
         return results
@@ -29,18 +23,48 @@ def get_frameworks_by_student(student_id: int):
 
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                """
-                    SELECT e.id, e.name
-                    FROM experiences e
-                    JOIN students_experiences se
-                    ON se.student_id = %s AND se.experience_id = e.id
-                    WHERE e.type = 'framework';
-                """,
-                (student_id,),
-            )
+            queries.execute(cur, "frameworks_by_student", (student_id,))
             results = cur.fetchall()
 
         return results
     finally:
         put_conn(conn)
+
+
+def get_experiences_by_students(
+    student_ids: list[int], conn: connection | None = None
+) -> dict[int, dict[str, list[dict]]]:
+    """Get the languages and frameworks of many students in one query
+
+    Returns:
+      A dict of student id to {"languages": [...], "frameworks": [...]}
+    """
+    if not student_ids:
+        return {}
+
+    use_conn: connection = conn or get_conn()
+
+    try:
+        with use_conn.cursor(cursor_factory=RealDictCursor) as cur:
+            queries.execute(cur, "experiences_by_students", (student_ids,))
+            rows = cur.fetchall()
+    finally:
+        if not conn:
+            put_conn(use_conn)
+
+    return split_experiences(rows)
+
+
+def split_experiences(rows: list[dict]) -> dict[int, dict[str, list[dict]]]:
+    """Sort rows of the experiences_by_students query into languages and frameworks"""
+    grouped = group_by_parent(rows)
+    results = {}
+
+    for student_id, student_rows in grouped.items():
+        results[student_id] = {"languages": [], "frameworks": []}
+
+        for row in student_rows:
+            key = "languages" if row.pop("type") == "language" else "frameworks"
+            results[student_id][key].append(row)
+
+    return results
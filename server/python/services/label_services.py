@@ -1,5 +1,8 @@
+from psycopg2.extensions import connection
 from psycopg2.extras import RealDictCursor
+from db import queries
 from db.db import get_conn, put_conn
+from extensions import group_by_parent
 
 def create_label(owner_id: str, name: str, color: str) -> dict:
     conn = get_conn()
@@ -120,16 +123,7 @@ def get_student_labels(student_id: int):
 
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                """
-                SELECT l.*
-                FROM labels l 
-                INNER JOIN student_labels sl
-                ON sl.label_id = l.id
-                WHERE sl.student_id = %s
-                """,
-                (student_id,)
-            )
+            queries.execute(cur, "labels_by_student", (student_id,))
             return cur.fetchall()
     finally:
         put_conn(conn)
@@ -140,21 +134,48 @@ def get_team_labels(team_id: int):
 
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                """
-                SELECT l.*
-                FROM labels l 
-                INNER JOIN teams_labels tl
-                ON tl.label_id = l.id
-                WHERE tl.team_id = %s
-                """,
-                (team_id,)
-            )
+            queries.execute(cur, "labels_by_team", (team_id,))
             return cur.fetchall()
     finally:
         put_conn(conn)
 
 
+def get_labels_by_students(
+    student_ids: list[int], conn: connection | None = None
+) -> dict[int, list[dict]]:
+    """Get the labels of many students in one query, keyed by student id"""
+    if not student_ids:
+        return {}
+
+    use_conn: connection = conn or get_conn()
+
+    try:
+        with use_conn.cursor(cursor_factory=RealDictCursor) as cur:
+            queries.execute(cur, "labels_by_students", (student_ids,))
+            return group_by_parent(cur.fetchall())
+    finally:
+        if not conn:
+            put_conn(use_conn)
+
+
+def get_labels_by_teams(
+    team_ids: list[int], conn: connection | None = None
+) -> dict[int, list[dict]]:
+    """Get the labels of many teams in one query, keyed by team id"""
+    if not team_ids:
+        return {}
+
+    use_conn: connection = conn or get_conn()
+
+    try:
+        with use_conn.cursor(cursor_factory=RealDictCursor) as cur:
+            queries.execute(cur, "labels_by_teams", (team_ids,))
+            return group_by_parent(cur.fetchall())
+    finally:
+        if not conn:
+            put_conn(use_conn)
+
+
 def assign_student_labels(label_ids: list[int], student_id: int) -> list[dict]:
     conn = get_conn()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
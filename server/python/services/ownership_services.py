@@ -0,0 +1,239 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+from psycopg2.extras import RealDictCursor
+from db import queries
+from db.db import get_conn, put_conn
+
+
+class OwnershipCache:
+    """An in-process record of the course paths each user has been shown to own
+
+    Entries are keyed by (user id, course id) and hold the sections, teams and
+    students known to belong to that course. Only successful checks are recorded,
+    so anything created after an entry was filled is simply looked up again.
+    Entries expire `ttl` seconds after they are created and the least recently
+    used entry is dropped once there are more than `max_size` of them. Deletes
+    remove what they deleted explicitly, but only from the cache of the process
+    that ran them. Other gunicorn workers can hold a deleted path until its
+    entry expires, so writes don't trust the cache for existence: updates that
+    match no row and inserts under a missing parent answer 404.
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: OrderedDict[tuple[str, int], dict[str, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_entry(
+        self, user_id: str, course_id: int, create: bool = False
+    ) -> dict[str, Any] | None:
+        key = (user_id, course_id)
+        now = time.monotonic()
+        entry = self._entries.get(key)
+
+        if entry is not None and entry["expires_at"] <= now:
+            del self._entries[key]
+            entry = None
+
+        if entry is None and create:
+            entry = {
+                "expires_at": now + self.ttl,
+                "sections": set(),
+                "teams": set(),
+                # student id -> section id
+                "students": {},
+            }
+            self._entries[key] = entry
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+        if entry is not None:
+            self._entries.move_to_end(key)
+
+        return entry
+
+    def contains(
+        self,
+        user_id: str,
+        course_id: int,
+        section_id: int | None = None,
+        student_id: int | None = None,
+        team_id: int | None = None,
+    ) -> bool:
+        """Check if the path is known to be owned by the user"""
+        with self._lock:
+            entry = self._get_entry(user_id, course_id)
+
+            if entry is None:
+                return False
+            if section_id is not None and section_id not in entry["sections"]:
+                return False
+            if student_id is not None and entry["students"].get(student_id) != section_id:
+                return False
+            if team_id is not None and team_id not in entry["teams"]:
+                return False
+
+            return True
+
+    def contains_child(
+        self, user_id: str, student_id: int | None = None, team_id: int | None = None
+    ) -> bool:
+        """Check if a student or team is known to be in any course owned by the user"""
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] != user_id:
+                    continue
+
+                entry = self._get_entry(*key)
+
+                if entry is None:
+                    continue
+                if student_id is not None and student_id in entry["students"]:
+                    return True
+                if team_id is not None and team_id in entry["teams"]:
+                    return True
+
+            return False
+
+    def add(
+        self,
+        user_id: str,
+        course_id: int,
+        section_id: int | None = None,
+        student_id: int | None = None,
+        team_id: int | None = None,
+    ) -> None:
+        """Record that the user owns the path"""
+        with self._lock:
+            entry = self._get_entry(user_id, course_id, create=True)
+
+            if section_id is not None:
+                entry["sections"].add(section_id)
+
+                if student_id is not None:
+                    entry["students"][student_id] = section_id
+
+            if team_id is not None:
+                entry["teams"].add(team_id)
+
+    def invalidate_course(self, course_id: int) -> None:
+        with self._lock:
+            for key in [key for key in self._entries if key[1] == course_id]:
+                del self._entries[key]
+
+    def invalidate_sections(self, section_ids: list[int]) -> None:
+        """Forget the sections and every student recorded under them"""
+        with self._lock:
+            for entry in self._entries.values():
+                entry["sections"].difference_update(section_ids)
+
+                for student_id, section_id in list(entry["students"].items()):
+                    if section_id in section_ids:
+                        del entry["students"][student_id]
+
+    def invalidate_teams(
+        self, team_ids: list[int] | None = None, course_id: int | None = None
+    ) -> None:
+        """Forget the given teams, or every team of the given course"""
+        with self._lock:
+            for key, entry in self._entries.items():
+                if course_id is not None and key[1] == course_id:
+                    entry["teams"].clear()
+                elif team_ids is not None:
+                    entry["teams"].difference_update(team_ids)
+
+    def invalidate_students(self, student_ids: list[int]) -> None:
+        with self._lock:
+            for entry in self._entries.values():
+                for student_id in student_ids:
+                    entry["students"].pop(student_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+ownership_cache = OwnershipCache(
+    ttl=float(os.getenv("OWNERSHIP_CACHE_TTL", "300")),
+    max_size=int(os.getenv("OWNERSHIP_CACHE_SIZE", "1024")),
+)
+
+
+def path_owner_query(
+    course_id: int,
+    section_id: int | None = None,
+    student_id: int | None = None,
+    team_id: int | None = None,
+) -> tuple[str, list[int]]:
+    """Build the query resolving the owner of a path
+
+    Every id in the path has to belong to the one before it, e.g. the student
+    has to be in the section and the section has to be in the course. Each shape
+    of path is registered as its own statement.
+
+    Returns:
+      The name of the registered statement and its parameters
+    """
+    name = "path_owner"
+    joins = []
+    values: list[int] = []
+
+    if section_id is not None:
+        name += "_section"
+        joins.append("JOIN sections s ON s.course_id = c.id AND s.id = %s")
+        values.append(section_id)
+
+        if student_id is not None:
+            name += "_student"
+            joins.append("JOIN students st ON st.section_id = s.id AND st.id = %s")
+            values.append(student_id)
+
+    if team_id is not None:
+        name += "_team"
+        joins.append("JOIN teams t ON t.course_id = c.id AND t.id = %s")
+        values.append(team_id)
+
+    values.append(course_id)
+    query = f"""
+        SELECT c.owner_id
+        FROM courses c
+        {" ".join(joins)}
+        WHERE c.id = %s;
+    """
+
+    return queries.register(name, query), values
+
+
+def get_path_owner(
+    course_id: int,
+    section_id: int | None = None,
+    student_id: int | None = None,
+    team_id: int | None = None,
+) -> str | None:
+    """Resolve the owner of a course/section/student or course/team path in one query
+
+    Args:
+      course_id (int): The course at the root of the path
+      section_id (int | None): A section of the course
+      student_id (int | None): A student of the section, requires section_id
+      team_id (int | None): A team of the course
+
+    Returns:
+      The owner_id of the course, or None if any part of the path doesn't exist
+    """
+    name, values = path_owner_query(course_id, section_id, student_id, team_id)
+    conn = get_conn()
+
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            queries.execute(cur, name, values)
+            result = cur.fetchone()
+
+            return result["owner_id"] if result else None
+    finally:
+        put_conn(conn)
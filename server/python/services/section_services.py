@@ -1,22 +1,28 @@
 from typing import cast
 from psycopg2.extras import RealDictCursor, RealDictRow
 from classes import Section
+from db import queries
 from db.db import get_conn, put_conn
-from services import student_services
+from extensions import NotFoundException
+from services import ownership_services, tree_services
 
 
-def _fill_section_children(section: RealDictRow | None) -> None:
+def _fill_section_children(
+    section: RealDictRow | None,
+    depth: int | None = None,
+    include: set[str] | None = None,
+) -> None:
     """Get all children of sections
 
     Args:
       section (dict[str, Any]): The section dict returned by the RealDictCursor
+      depth (int | None): How many levels of children to load, None for all
+      include (set[str] | None): Which child collections to load, None for all
     """
     if not section:
         return
 
-    section["students"] = student_services.get_students_by_section(
-        section_id=section["id"]
-    )
+    tree_services.fill_sections([section], depth=depth, include=include)
 
 
 def create_section(course_id: int, name: str):
@@ -45,24 +51,16 @@ def create_section(course_id: int, name: str):
         put_conn(conn)
 
 
-def get_sections_by_course(course_id: int):
+def get_sections_by_course(
+    course_id: int, depth: int | None = None, include: set[str] | None = None
+):
     conn = get_conn()
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                """
-                SELECT s.*, c.name AS course_name
-                FROM sections s
-                JOIN courses c ON s.course_id = c.id
-                WHERE c.id = %s
-                ORDER BY s.id;
-                """,
-                (course_id,),
-            )
+            queries.execute(cur, "sections_by_course", (course_id,))
             results = cur.fetchall()
 
-            for section in results:
-                _fill_section_children(section)
+            tree_services.fill_sections(results, depth=depth, include=include)
 
             return results
 
@@ -70,24 +68,17 @@ def get_sections_by_course(course_id: int):
         put_conn(conn)
 
 
-def get_section_by_id(section_id: int) -> Section:
+def get_section_by_id(
+    section_id: int, depth: int | None = None, include: set[str] | None = None
+) -> Section:
     conn = get_conn()
 
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                """
-                SELECT s.*, c.name AS course_name
-                FROM sections s
-                JOIN courses c ON s.course_id = c.id
-                WHERE s.id = %s
-                ORDER BY s.id;
-                """,
-                (section_id,),
-            )
+            queries.execute(cur, "section_by_id", (section_id,))
             result = cur.fetchone()
 
-            _fill_section_children(result)
+            _fill_section_children(result, depth=depth, include=include)
 
             return cast(Section, result)
 
@@ -122,6 +113,10 @@ def update_section(section_id: int, data: dict):
             cur.execute(query, values)
             result = cur.fetchone()
 
+            # The section was deleted, maybe through a worker whose cache forgot it
+            if result is None:
+                raise NotFoundException()
+
             _fill_section_children(result)
 
             conn.commit()
@@ -143,6 +138,7 @@ def delete_section(section_id: int):
                 (section_id,),
             )
             conn.commit()
+            ownership_services.ownership_cache.invalidate_sections([section_id])
             return cur.rowcount
     finally:
         put_conn(conn)
@@ -1,116 +1,239 @@
 from typing import Any, cast
 from psycopg2.extensions import connection
-from psycopg2.extras import RealDictCursor, RealDictRow
+from psycopg2.extras import RealDictCursor, RealDictRow, execute_values
 from classes import Student
+from db import parallel, queries
 from db.db import get_conn, put_conn
-from extensions import BadRequestException, ForbiddenException
-from services import experience_services, label_services, comment_services
-
-
-def _fill_student_children(student: RealDictRow | None) -> None:
+from extensions import (
+    BadRequestException,
+    ForbiddenException,
+    NotFoundException,
+    wants_child,
+)
+from services import (
+    comment_services,
+    experience_services,
+    label_services,
+    ownership_services,
+)
+
+
+def _fill_student_children(
+    student: RealDictRow | None,
+    conn: connection | None = None,
+    depth: int | None = None,
+    include: set[str] | None = None,
+) -> None:
     """Get all children of students
 
     Args:
       student (dict[str, Any]): The student dict returned by the RealDictCursor
+      conn (connection | None): An open connection to run the child queries on
+      depth (int | None): How many levels of children to load, None for all
+      include (set[str] | None): Which child collections to load, None for all
     """
     if not student:
         return
 
+    _fill_students_children([student], conn=conn, depth=depth, include=include)
+
+
+def _fill_students_children(
+    students: list[RealDictRow],
+    conn: connection | None = None,
+    depth: int | None = None,
+    include: set[str] | None = None,
+) -> None:
+    """Get all children of many students, one query per child type
+
+    Labels, comments and experiences are each fetched once for the whole list
+    with `= ANY(%s)`, in parallel when db.parallel allows it, and then handed
+    back to their students.
+
+    Args:
+      students (list[dict[str, Any]]): The student dicts returned by the RealDictCursor
+      conn (connection | None): An open connection to run the child queries on
+      depth (int | None): How many levels of children to load, None for all
+      include (set[str] | None): Which child collections to load, None for all
+    """
+    if not students:
+        return
+
+    student_ids = [student["id"] for student in students]
+    loads = {}
+
+    if wants_child("labels", depth, include):
+        loads["labels"] = lambda c: label_services.get_labels_by_students(
+            student_ids, conn=c
+        )
+    if wants_child("comments", depth, include):
+        loads["comments"] = lambda c: comment_services.get_comments_by_students(
+            student_ids, conn=c
+        )
+    if wants_child("experiences", depth, include):
+        loads["experiences"] = lambda c: experience_services.get_experiences_by_students(
+            student_ids, conn=c
+        )
+
+    children = parallel.run_all(loads, conn=conn)
+
+    _attach_students_children(
+        students,
+        children.get("labels"),
+        children.get("comments"),
+        children.get("experiences"),
+    )
+
+
+def _attach_students_children(
+    students: list[RealDictRow],
+    labels: dict[int, list] | None,
+    comments: dict[int, list] | None,
+    experiences: dict[int, dict[str, list]] | None,
+) -> None:
+    """Hand batch-loaded children back to their students, None means not loaded"""
+    for student in students:
+        student["work_with"] = student.get("work_with", []) or []
+        student["dont_work_with"] = student.get("dont_work_with", []) or []
+
+        if labels is not None:
+            student["labels"] = labels.get(student["id"], [])
+        if comments is not None:
+            student["comments"] = comments.get(student["id"], [])
+        if experiences is not None:
+            student_experiences = experiences.get(student["id"], {})
+            student["languages"] = student_experiences.get("languages", [])
+            student["frameworks"] = student_experiences.get("frameworks", [])
+
+
+def _empty_student_children(student: RealDictRow) -> None:
+    """Set the children of a student that was just created and can't have any"""
     student["work_with"] = student.get("work_with", []) or []
     student["dont_work_with"] = student.get("dont_work_with", []) or []
-    student["labels"] = label_services.get_student_labels(student["id"]) or []
-    student["comments"] = comment_services.get_comments_by_student(student["id"]) or []
-    student["languages"] = experience_services.get_languages_by_student(student["id"])
-    student["frameworks"] = experience_services.get_frameworks_by_student(student["id"])
+    student["labels"] = []
+    student["comments"] = []
+    student["languages"] = []
+    student["frameworks"] = []
 
 
-def create_student(section_id: int, data: dict[str, Any]) -> Student:
-    conn = get_conn()
+def create_students(
+    section_id: int, data: list[dict[str, Any]], atomic: bool = False
+) -> tuple[list[Student], list[dict[str, Any]]]:
+    """Create many students in a section with one multi-row INSERT
 
-    fields = ["section_id"]
-    values = [section_id]
+    Every row is validated first. Valid rows are inserted in a single statement
+    and transaction, and rows whose email already exists in the section are
+    skipped and reported instead of aborting the insert.
 
-    allowed_keys = {
-        "name",
-        "email",
-        "major",
-    }
+    Args:
+      section_id (int): The section to create the students in
+      data (list[dict[str, Any]]): One dict per student with name, and optionally email and major
+      atomic (bool): If True, nothing is created when any row has an error
 
-    for key, val in data.items():
-        if key in allowed_keys:
-            fields.append(key)
-            values.append(val)
+    Returns:
+      The created students, and one {"index", "status", "error"} dict per rejected row
+    """
+    errors: list[dict[str, Any]] = []
+    rows: dict[int, tuple[Any, ...]] = {}
+    emails: dict[str, int] = {}
+
+    for index, item in enumerate(data):
+        if not isinstance(item, dict):
+            errors.append({"index": index, "status": 400, "error": "Invalid student"})
+            continue
+
+        name = item.get("name")
+        email = item.get("email")
+        major = item.get("major")
+
+        if not isinstance(name, str) or not name.strip():
+            errors.append({"index": index, "status": 400, "error": "Missing name"})
+        elif email is not None and not isinstance(email, str):
+            errors.append({"index": index, "status": 400, "error": "Invalid email"})
+        elif major is not None and not isinstance(major, str):
+            errors.append({"index": index, "status": 400, "error": "Invalid major"})
+        elif email is not None and email in emails:
+            errors.append({"index": index, "status": 409, "error": "Duplicate email"})
+        else:
+            rows[index] = (section_id, name, email, major)
+
+            if email is not None:
+                emails[email] = index
+
+    if not rows or (atomic and errors):
+        return [], errors
 
-    if len(fields) == 1:
-        raise BadRequestException()
+    conn = get_conn()
 
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            query = f"""
-                INSERT INTO students ({", ".join(fields)})
-                VALUES ({", ".join(["%s"] * len(fields))})
-                RETURNING *
-            """
+            results = execute_values(
+                cur,
+                """
+                INSERT INTO students (section_id, name, email, major)
+                VALUES %s
+                ON CONFLICT (email, section_id) DO NOTHING
+                RETURNING *;
+                """,
+                list(rows.values()),
+                page_size=len(rows),
+                fetch=True,
+            )
 
-            cur.execute(query, values)
-            result = cur.fetchone()
+        inserted_emails = {student["email"] for student in results}
 
-            if result:
-                _fill_student_children(result)
+        for email, index in emails.items():
+            if email not in inserted_emails:
+                errors.append({"index": index, "status": 409, "error": "Conflict"})
 
-        conn.commit()
+        if atomic and errors:
+            conn.rollback()
+            return [], sorted(errors, key=lambda error: error["index"])
 
-        return cast(Student, result)
+        conn.commit()
     except Exception as e:
         conn.rollback()
         raise e
     finally:
         put_conn(conn)
 
+    for student in results:
+        _empty_student_children(student)
+
+    return (
+        cast(list[Student], results),
+        sorted(errors, key=lambda error: error["index"]),
+    )
+
 
-def get_students_by_section(section_id: int) -> list[Student]:
+def get_students_by_section(
+    section_id: int, depth: int | None = None, include: set[str] | None = None
+) -> list[Student]:
     conn = get_conn()
 
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                """
-                SELECT st.*, c.id AS course_id
-                FROM students st
-                JOIN sections se
-                ON   se.id = st.section_id
-                JOIN courses c
-                ON   c.id = se.course_id
-                WHERE section_id = %s;
-                """,
-                (section_id,),
-            )
+            queries.execute(cur, "students_by_section", (section_id,))
             results = cur.fetchall()
 
-        for student in results:
-            _fill_student_children(student)
+        _fill_students_children(results, conn=conn, depth=depth, include=include)
 
         return cast(list[Student], results)
     finally:
         put_conn(conn)
 
 
-def get_student_by_id(student_id: int) -> Student | None:
+def get_student_by_id(
+    student_id: int, depth: int | None = None, include: set[str] | None = None
+) -> Student | None:
     conn = get_conn()
 
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                """
-                SELECT *
-                FROM students
-                WHERE id = %s;
-                """,
-                (student_id,),
-            )
+            queries.execute(cur, "student_by_id", (student_id,))
             result = cur.fetchone()
 
-        _fill_student_children(result)
+        _fill_student_children(result, conn=conn, depth=depth, include=include)
 
         return cast(Student | None, result)
     finally:
@@ -180,21 +303,16 @@ def update_student(
                 )
                 result = cur.fetchone()
 
-            if "languages" in data or "frameworks" in data:
-                cur.execute(
-                    """
-                    DELETE FROM students_experiences
-                    WHERE student_id = %s;
-                """,
-                    (student_id,),
-                )
-                _update_languages(student_id, cur, data.get("languages", []))
-                _update_frameworks(student_id, cur, data.get("frameworks", []))
+            # The student was deleted, maybe through a worker whose cache forgot it
+            if result is None:
+                raise NotFoundException()
+
+            _replace_experiences(cur, {student_id: data})
 
         if not conn:
             use_conn.commit()
 
-        _fill_student_children(result)
+        _fill_student_children(result, conn=use_conn)
 
         return cast(Student, result)
 
@@ -206,28 +324,223 @@ def update_student(
             put_conn(use_conn)
 
 
-def bulk_update_students(section_id: int, data: list[dict[str, Any]]):
+# Columns that can be changed through the bulk PATCH and their SQL types
+BULK_UPDATE_COLUMNS = {
+    "team_id": "int",
+    "name": "text",
+    "major": "text",
+    "leadership": "int",
+    "expertise": "int",
+    "work_with": "text[]",
+    "dont_work_with": "text[]",
+}
+
+
+def _bulk_update_columns(
+    cur: RealDictCursor, changes: dict[int, dict[str, Any]]
+) -> None:
+    """Apply the scalar column changes of many students with one UPDATE
+
+    Each row of the VALUES list carries a flag per column, so students that
+    change different columns still share the statement.
+    """
+    columns = [
+        column
+        for column in BULK_UPDATE_COLUMNS
+        if any(column in item for item in changes.values())
+    ]
+
+    if not columns:
+        return
+
+    template = "(%s::int, " + ", ".join(
+        f"%s::boolean, %s::{BULK_UPDATE_COLUMNS[column]}" for column in columns
+    ) + ")"
+    aliases = ", ".join(f"set_{column}, {column}" for column in columns)
+    assignments = ", ".join(
+        f"{column} = CASE WHEN v.set_{column} THEN v.{column} ELSE s.{column} END"
+        for column in columns
+    )
+
+    rows = []
+
+    for student_id, item in changes.items():
+        row: list[Any] = [student_id]
+
+        for column in columns:
+            row.append(column in item)
+            row.append(item.get(column))
+
+        rows.append(tuple(row))
+
+    execute_values(
+        cur,
+        f"""
+        UPDATE students s
+        SET {assignments}
+        FROM (VALUES %s) AS v(id, {aliases})
+        WHERE s.id = v.id;
+        """,
+        rows,
+        template=template,
+        page_size=len(rows),
+    )
+
+
+# Keys of a student update that hold experiences, and the experience type of each
+EXPERIENCE_KEYS = {"languages": "language", "frameworks": "framework"}
+
+
+def _replace_experiences(
+    cur: RealDictCursor, changes: dict[int, dict[str, Any]]
+) -> None:
+    """Set the languages and frameworks of many students in at most two statements
+
+    Only the experience types present in a student's change are touched, and
+    only the links that differ from the current ones are written.
+
+    Args:
+      cur (RealDictCursor): The cursor of the transaction to run in
+      changes (dict[int, dict[str, Any]]): The update of each student by id
+    """
+    student_ids: list[int] = []
+    kinds: list[str] = []
+    wanted: set[tuple[int, str, str]] = set()
+
+    for student_id, item in changes.items():
+        for key, kind in EXPERIENCE_KEYS.items():
+            if key not in item:
+                continue
+
+            student_ids.append(student_id)
+            kinds.append(kind)
+            wanted.update((student_id, name, kind) for name in item[key] or [])
+
+    if not student_ids:
+        return
+
+    pairs = sorted(wanted)
+    experiences = sorted({(name, kind) for _, name, kind in pairs})
+
+    if experiences:
+        cur.execute(
+            """
+            INSERT INTO experiences (name, type)
+            SELECT *
+            FROM unnest(%s::text[], %s::text[])
+            ON CONFLICT (name) DO NOTHING;
+            """,
+            ([name for name, _ in experiences], [kind for _, kind in experiences]),
+        )
+
+    cur.execute(
+        """
+        -- the links every student should have once this runs
+        WITH wanted AS (
+          SELECT v.student_id, e.id AS experience_id
+          FROM unnest(%s::int[], %s::text[], %s::text[]) AS v(student_id, name, type)
+          JOIN experiences e
+          ON e.name = v.name AND e.type = v.type
+        ),
+        -- links of the replaced types that aren't wanted anymore
+        removed AS (
+          DELETE FROM students_experiences se
+          USING experiences e, unnest(%s::int[], %s::text[]) AS r(student_id, type)
+          WHERE e.id = se.experience_id
+          AND se.student_id = r.student_id
+          AND e.type = r.type
+          AND NOT EXISTS (
+            SELECT 1
+            FROM wanted w
+            WHERE w.student_id = se.student_id AND w.experience_id = se.experience_id
+          )
+        )
+        -- links that already exist are left alone
+        INSERT INTO students_experiences (experience_id, student_id)
+        SELECT experience_id, student_id
+        FROM wanted
+        ON CONFLICT DO NOTHING;
+        """,
+        (
+            [student_id for student_id, _, _ in pairs],
+            [name for _, name, _ in pairs],
+            [kind for _, _, kind in pairs],
+            student_ids,
+            kinds,
+        ),
+    )
+
+
+def bulk_update_students(
+    section_id: int, data: list[dict[str, Any]]
+) -> list[Student]:
+    """Update many students of a section, matched by email, in one transaction
+
+    Emails are resolved with one query, scalar columns are changed with one
+    UPDATE and experiences are replaced with a fixed number of statements.
+    Emails that aren't in the section are skipped.
+
+    Args:
+      section_id (int): The section the students are in
+      data (list[dict[str, Any]]): One dict per student, each with an email and the fields to change
+
+    Returns:
+      The changed students, in the order they were given
+    """
+    if any(not isinstance(item, dict) or "email" not in item for item in data):
+        raise BadRequestException()
+
     conn = get_conn()
-    changed = []
 
     try:
-        for item in data:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute(
-                    "SELECT id FROM students WHERE email = %s AND section_id = %s",
-                    (item["email"], section_id),
-                )
-                student = cur.fetchone()
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                """
+                SELECT id, email
+                FROM students
+                WHERE section_id = %s AND email = ANY(%s);
+                """,
+                (section_id, [item["email"] for item in data]),
+            )
+            ids_by_email = {row["email"]: row["id"] for row in cur.fetchall()}
+
+            changes: dict[int, dict[str, Any]] = {}
+
+            for item in data:
+                student_id = ids_by_email.get(item["email"])
 
-                if student is None:
+                if student_id is None:
                     continue
+                if not any(
+                    key in item
+                    for key in [*BULK_UPDATE_COLUMNS, "languages", "frameworks"]
+                ):
+                    raise BadRequestException()
 
-                changed.append(
-                    update_student(student["id"], item, conn=conn, cursor=cur)
-                )
+                changes.setdefault(student_id, {}).update(item)
+
+            if not changes:
+                return []
+
+            _bulk_update_columns(cur, changes)
+            _replace_experiences(cur, changes)
+
+            cur.execute(
+                """
+                SELECT *
+                FROM students
+                WHERE id = ANY(%s);
+                """,
+                (list(changes),),
+            )
+            students = {student["id"]: student for student in cur.fetchall()}
 
         conn.commit()
-        return changed
+
+        changed = [students[student_id] for student_id in changes]
+        _fill_students_children(changed, conn=conn)
+
+        return cast(list[Student], changed)
     except Exception as e:
         conn.rollback()
         raise e
@@ -235,70 +548,84 @@ def bulk_update_students(section_id: int, data: list[dict[str, Any]]):
         put_conn(conn)
 
 
-def _update_languages(student_id: int, cur: RealDictCursor, languages: list[str]):
-    for language in languages:
-        cur.execute(
-            """
-            -- new_language is either an entity, or nothing
-            WITH new_language AS (
-              INSERT INTO experiences (name, type)
-              VALUES (%s, 'language')
-              ON CONFLICT (name)
-              DO NOTHING
-              RETURNING id
-            ),
-            -- always_id makes sure we have an ID value whether there was a conflict or not in the above statement
-            always_id AS (
-              SELECT id
-              FROM new_language
-              UNION ALL
-              SELECT id
-              FROM experiences
-              WHERE name = %s AND type = 'language'
-              LIMIT 1
+def move_students(
+    course_id: int, moves: list[dict[str, Any]], full: bool = False
+) -> list[dict[str, Any]]:
+    """Move many students between the teams of a course in one transaction
+
+    Every student, section and team in the moves is checked to belong to the
+    course with one query, then every team change is applied with one UPDATE.
+
+    Args:
+      course_id (int): The course the students and teams are in
+      moves (list[dict[str, Any]]): Dicts with sectionId, studentId and teamId, a None teamId removes the student from their team
+      full (bool): Return the moved students instead of a {studentId, teamId} diff
+
+    Returns:
+      The students whose team actually changed
+    """
+    # If a student is moved more than once the last move wins
+    targets = {move["studentId"]: move for move in moves}
+
+    if not targets:
+        return []
+
+    student_ids = list(targets)
+    section_ids = [move["sectionId"] for move in targets.values()]
+    team_ids = [move["teamId"] for move in targets.values()]
+
+    conn = get_conn()
+
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                """
+                SELECT COUNT(*) AS valid
+                FROM unnest(%s::int[], %s::int[], %s::int[]) AS v(student_id, section_id, team_id)
+                JOIN students st
+                ON st.id = v.student_id AND st.section_id = v.section_id
+                JOIN sections se
+                ON se.id = st.section_id AND se.course_id = %s
+                LEFT JOIN teams t
+                ON t.id = v.team_id AND t.course_id = se.course_id
+                WHERE v.team_id IS NULL OR t.id IS NOT NULL;
+                """,
+                (student_ids, section_ids, team_ids, course_id),
             )
-                    
-            -- Insert/Select syntax. We insert the selected "id" from "always_id" and raw string, student_id passed in below.
-            INSERT INTO students_experiences (experience_id, student_id)
-            SELECT id, %s
-            FROM always_id
-            ON CONFLICT DO NOTHING;
-            """,
-            (language, language, student_id),
-        )
 
+            if cur.fetchone()["valid"] != len(targets):
+                raise NotFoundException()
 
-def _update_frameworks(student_id: int, cur: RealDictCursor, frameworks: list[str]):
-    for framework in frameworks:
-        cur.execute(
-            """
-            -- new_framework is either an entity, or nothing
-            WITH new_framework AS (
-              INSERT INTO experiences (name, type)
-              VALUES (%s, 'framework')
-              ON CONFLICT (name)
-              DO NOTHING
-              RETURNING id
-            ),
-            -- always_id makes sure we have an ID value whether there was a conflict or not in the above statement
-            always_id AS (
-              SELECT id
-              FROM new_framework
-              UNION ALL
-              SELECT id
-              FROM experiences
-              WHERE name = %s AND type = 'framework'
-              LIMIT 1
+            cur.execute(
+                """
+                UPDATE students s
+                SET team_id = v.team_id
+                FROM unnest(%s::int[], %s::int[]) AS v(student_id, team_id)
+                WHERE s.id = v.student_id AND s.team_id IS DISTINCT FROM v.team_id
+                RETURNING s.*;
+                """,
+                (student_ids, team_ids),
             )
-                    
-            -- Insert/Select syntax. We insert the selected "id" from "always_id" and raw string, student_id passed in below.
-            INSERT INTO students_experiences (experience_id, student_id)
-            SELECT id, %s
-            FROM always_id
-            ON CONFLICT DO NOTHING;
-            """,
-            (framework, framework, student_id),
-        )
+            moved = cur.fetchall()
+
+        conn.commit()
+
+        order = {student_id: i for i, student_id in enumerate(student_ids)}
+        moved.sort(key=lambda student: order[student["id"]])
+
+        if full:
+            _fill_students_children(moved, conn=conn)
+            return moved
+
+        return [
+            {"studentId": student["id"], "teamId": student["team_id"]}
+            for student in moved
+        ]
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        put_conn(conn)
 
 
 def delete_student(student_id: int):
@@ -314,19 +641,59 @@ def delete_student(student_id: int):
                 (student_id,),
             )
             conn.commit()
+            ownership_services.ownership_cache.invalidate_students([student_id])
             return cur.rowcount
     finally:
         put_conn(conn)
 
 
-def check_student_is_owned(student_id: int, user_id: int):
+def delete_students(section_id: int, student_ids: list[int]) -> list[int]:
+    """Delete many students of a section with one statement
+
+    Ids that aren't in the section are ignored.
+
+    Args:
+      section_id (int): The section the students are in
+      student_ids (list[int]): The students to delete
+
+    Returns:
+      The ids of the students that were deleted
+    """
+    if not student_ids:
+        return []
+
     conn = get_conn()
 
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
                 """
-                SELECT owner_id FROM courses c 
+                DELETE FROM students
+                WHERE section_id = %s AND id = ANY(%s)
+                RETURNING id;
+                """,
+                (section_id, student_ids),
+            )
+            deleted = [row["id"] for row in cur.fetchall()]
+            conn.commit()
+            ownership_services.ownership_cache.invalidate_students(deleted)
+            return deleted
+    finally:
+        put_conn(conn)
+
+
+def check_student_is_owned(student_id: int, user_id: str):
+    if ownership_services.ownership_cache.contains_child(user_id, student_id=student_id):
+        return
+
+    conn = get_conn()
+
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                """
+                SELECT owner_id, c.id AS course_id, s.id AS section_id
+                FROM courses c 
                 INNER JOIN sections s
                 ON s.course_id = c.id 
                 INNER JOIN students s2 
@@ -337,7 +704,14 @@ def check_student_is_owned(student_id: int, user_id: int):
             )
             res = cur.fetchone()
 
-            if res.get("owner_id", -1) != user_id:
+            if not res or res.get("owner_id", -1) != user_id:
                 raise ForbiddenException()
+
+            ownership_services.ownership_cache.add(
+                user_id,
+                res["course_id"],
+                section_id=res["section_id"],
+                student_id=student_id,
+            )
     finally:
         put_conn(conn)
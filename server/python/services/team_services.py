@@ -1,26 +1,30 @@
 from typing import Any, cast
-from psycopg2.extras import RealDictCursor, RealDictRow
+from psycopg2.extras import RealDictCursor, RealDictRow, execute_values
 from classes import Team
+from db import queries
 from db.db import get_conn, put_conn
-from extensions import ForbiddenException
-from .student_services import _fill_student_children
-from .comment_services import get_comments_by_team
+from extensions import ForbiddenException, NotFoundException
+from .student_services import _fill_students_children
 from psycopg2.extensions import connection
-from services import label_services
+from services import ownership_services, tree_services
 
 
-def _fill_team_children(team: RealDictRow | None) -> None:
+def _fill_team_children(
+    team: RealDictRow | None,
+    depth: int | None = None,
+    include: set[str] | None = None,
+) -> None:
     """Get all children of teams
 
     Args:
       team (dict[str, Any]): The team dict returned by the RealDictCursor
+      depth (int | None): How many levels of children to load, None for all
+      include (set[str] | None): Which child collections to load, None for all
     """
     if not team:
         return
 
-    team["comments"] = get_comments_by_team(team["id"]) or []
-    team["labels"] = label_services.get_team_labels(team["id"]) or []
-    team["students"] = get_students_by_team(team["id"])
+    tree_services.fill_teams([team], depth=depth, include=include)
 
 
 def create_team(course_id: int, name: str, conn=None) -> Team:
@@ -53,46 +57,81 @@ def create_team(course_id: int, name: str, conn=None) -> Team:
             put_conn(use_conn)
 
 
-def get_teams_by_course(course_id: int):
+def create_teams(course_id: int, names: list[str]) -> list[Team]:
+    """Create many teams in a course with one multi-row INSERT
+
+    Either every team is created or, if any name is taken, none are.
+
+    Args:
+      course_id (int): The course to create the teams in
+      names (list[str]): The name of each team
+
+    Returns:
+      The created teams, in the order of `names`
+    """
+    if not names:
+        return []
+
     conn = get_conn()
 
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
+            results = execute_values(
+                cur,
                 """
-                SELECT *
-                FROM teams
-                WHERE course_id = %s;
+                INSERT INTO teams (name, course_id)
+                VALUES %s
+                RETURNING *;
                 """,
-                (course_id,),
+                [(name, course_id) for name in names],
+                page_size=len(names),
+                fetch=True,
             )
+
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        put_conn(conn)
+
+    for result in results:
+        result["comments"] = []
+        result["labels"] = []
+        result["students"] = []
+
+    return cast(list[Team], results)
+
+
+def get_teams_by_course(
+    course_id: int, depth: int | None = None, include: set[str] | None = None
+):
+    conn = get_conn()
+
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            queries.execute(cur, "teams_by_course", (course_id,))
             results = cur.fetchall()
 
-            for team in results:
-                _fill_team_children(team)
+            tree_services.fill_teams(results, depth=depth, include=include)
 
         return cast(list[Team], results)
     finally:
         put_conn(conn)
 
 
-def get_team_by_id(team_id: int):
+def get_team_by_id(
+    team_id: int, depth: int | None = None, include: set[str] | None = None
+):
     conn = get_conn()
 
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                """
-                SELECT *
-                FROM teams
-                WHERE id = %s;
-                """,
-                (team_id,),
-            )
+            queries.execute(cur, "team_by_id", (team_id,))
             result = cur.fetchone()
 
             if result:
-                _fill_team_children(result)
+                _fill_team_children(result, depth=depth, include=include)
 
         return cast(Team | None, result)
     finally:
@@ -127,6 +166,10 @@ def update_team(team_id: int, data: dict[str, Any]) -> Team | None:
             cur.execute(query, values)
             result = cur.fetchone()
 
+            # The team was deleted, maybe through a worker whose cache forgot it
+            if result is None:
+                raise NotFoundException()
+
             _fill_team_children(result)
 
             conn.commit()
@@ -148,34 +191,35 @@ def delete_team(team_id: int):
                 (team_id,),
             )
             conn.commit()
+            ownership_services.ownership_cache.invalidate_teams(team_ids=[team_id])
     finally:
         put_conn(conn)
 
 
-def batch_delete_teams(course_id: int):
+def batch_delete_teams(course_id: int) -> int:
+    """Delete every team of a course with one statement
+
+    Team comments and labels are removed and students are taken off their
+    teams by the foreign keys, which are all indexed on team_id.
+
+    Returns:
+      The number of teams deleted
+    """
     conn = get_conn()
 
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
                 """
-                SELECT id FROM teams
+                DELETE FROM teams
                 WHERE course_id = %s;
                 """,
                 (course_id,)
             )
-            results = cur.fetchall()
-
-            for res in results:
-                cur.execute(
-                    """
-                    DELETE FROM teams
-                    WHERE id = %s;
-                    """,
-                    (res["id"],),
-                )
 
             conn.commit()
+            ownership_services.ownership_cache.invalidate_teams(course_id=course_id)
+            return cur.rowcount
     finally:
         put_conn(conn)
 
@@ -197,22 +241,24 @@ def get_students_by_team(team_id: int):
             )
             results = cur.fetchall()
 
-        for student in results:
-            _fill_student_children(student)
+        _fill_students_children(results, conn=conn)
 
         return cast(list[Team], results)
     finally:
         put_conn(conn)
 
 
-def check_team_is_owned(team_id: int, user_id: int):
+def check_team_is_owned(team_id: int, user_id: str):
+    if ownership_services.ownership_cache.contains_child(user_id, team_id=team_id):
+        return
+
     conn = get_conn()
 
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
                 """
-                SELECT owner_id FROM courses c 
+                SELECT owner_id, c.id AS course_id FROM courses c 
                 INNER JOIN teams t 
                 ON t.course_id = c.id 
                 WHERE t.id = %s;
@@ -221,7 +267,11 @@ def check_team_is_owned(team_id: int, user_id: int):
             )
             res = cur.fetchone()
 
-            if res.get("owner_id", -1) != user_id:
+            if not res or res.get("owner_id", -1) != user_id:
                 raise ForbiddenException()
+
+            ownership_services.ownership_cache.add(
+                user_id, res["course_id"], team_id=team_id
+            )
     finally:
         put_conn(conn)
@@ -64,8 +64,10 @@ class TestCreateCourse:
 
     @patch("services.course_services.put_conn")
     @patch("services.course_services.get_conn")
+    @patch("services.course_services.tree_services")
     def test_create_course_success(
         self,
+        mock_tree_services,
         mock_get_conn,
         mock_put_conn,
     ):
@@ -118,8 +120,10 @@ class TestGetCourses:
 
     @patch("services.course_services.put_conn")
     @patch("services.course_services.get_conn")
+    @patch("services.course_services.tree_services")
     def test_get_courses_success(
         self,
+        mock_tree_services,
         mock_get_conn,
         mock_put_conn,
     ):
@@ -142,7 +146,7 @@ class TestGetCourses:
         )
         (sql,) = mock_cursor.execute.call_args[0][:1]
         normalized_sql = " ".join(sql.split())
-        assert "SELECT * FROM courses WHERE owner_id = %s ORDER BY id;" in normalized_sql
+        assert "SELECT id, owner_id, name, code, term, created_at FROM courses WHERE owner_id = %s ORDER BY id;" in normalized_sql
 
         mock_cursor.fetchall.assert_called_once()
         mock_put_conn.assert_called_once_with(mock_conn)
@@ -173,7 +177,7 @@ class TestGetCourses:
         )
         (sql,) = mock_cursor.execute.call_args[0][:1]
         normalized_sql = " ".join(sql.split())
-        assert "SELECT * FROM courses WHERE owner_id = %s ORDER BY id;" in normalized_sql
+        assert "SELECT id, owner_id, name, code, term, created_at FROM courses WHERE owner_id = %s ORDER BY id;" in normalized_sql
 
         assert res == []
 
@@ -191,8 +195,10 @@ class TestGetCourseById:
 
     @patch("services.course_services.put_conn")
     @patch("services.course_services.get_conn")
+    @patch("services.course_services.tree_services")
     def test_get_course_by_id_success(
         self,
+        mock_tree_services,
         mock_get_conn,
         mock_put_conn,
     ):
@@ -218,7 +224,7 @@ class TestGetCourseById:
         )
         (sql,) = mock_cursor.execute.call_args[0][:1]
         normalized_sql = " ".join(sql.split())
-        assert "SELECT * FROM courses WHERE id = %s;" in normalized_sql
+        assert "SELECT id, owner_id, name, code, term, created_at FROM courses WHERE id = %s;" in normalized_sql
 
         mock_put_conn.assert_called_once_with(mock_conn)
         mock_cursor.fetchone.assert_called_once()
@@ -248,7 +254,7 @@ class TestGetCourseById:
         )
         (sql,) = mock_cursor.execute.call_args[0][:1]
         normalized_sql = " ".join(sql.split())
-        assert "SELECT * FROM courses WHERE id = %s;" in normalized_sql
+        assert "SELECT id, owner_id, name, code, term, created_at FROM courses WHERE id = %s;" in normalized_sql
 
         mock_put_conn.assert_called_once_with(mock_conn)
         mock_cursor.fetchone.assert_called_once()
@@ -259,8 +265,10 @@ class TestGetCourseById:
 class TestUpdateCourse:
     @patch("services.course_services.put_conn")
     @patch("services.course_services.get_conn")
+    @patch("services.course_services.tree_services")
     def test_update_course_success(
         self,
+        mock_tree_services,
         mock_get_conn,
         mock_put_conn,
     ):
@@ -360,3 +368,23 @@ class TestDeleteCourse:
 https://docs.pytest.org/en/stable/index.html
 https://www.psycopg.org/docs/errors.html
 """
+
+
+class TestGetCourseVersion:
+    @patch("services.course_services.put_conn")
+    @patch("services.course_services.get_conn")
+    def test_get_course_version(self, mock_get_conn, mock_put_conn):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_get_conn.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_cursor.fetchone.return_value = {"version": 4}
+
+        assert get_course_version(1) == 4
+        # A single lookup by primary key
+        mock_cursor.execute.assert_called_once_with(queries.QUERIES["course_version"].sql, (1,))
+        mock_put_conn.assert_called_once_with(mock_conn)
+
+        mock_cursor.fetchone.return_value = None
+
+        assert get_course_version(2) is None
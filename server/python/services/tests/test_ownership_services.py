@@ -0,0 +1,149 @@
+from unittest.mock import patch, MagicMock
+from services.ownership_services import *
+
+
+class TestGetPathOwner:
+    @patch("services.ownership_services.put_conn")
+    @patch("services.ownership_services.get_conn")
+    def test_get_path_owner_student(
+        self,
+        mock_get_conn: MagicMock,
+        mock_put_conn: MagicMock,
+    ):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_get_conn.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_cursor.fetchone.return_value = {"owner_id": "1"}
+
+        result = get_path_owner(1, section_id=2, student_id=3)
+
+        # The whole path is resolved in a single query
+        mock_cursor.execute.assert_called_once()
+        (sql, params) = mock_cursor.execute.call_args[0]
+        normalized_sql = " ".join(sql.split())
+        assert "JOIN sections s ON s.course_id = c.id AND s.id = %s" in normalized_sql
+        assert "JOIN students st ON st.section_id = s.id AND st.id = %s" in normalized_sql
+        assert "teams" not in normalized_sql
+        assert params == [2, 3, 1]
+        mock_put_conn.assert_called_once_with(mock_conn)
+
+        assert result == "1"
+
+    @patch("services.ownership_services.put_conn")
+    @patch("services.ownership_services.get_conn")
+    def test_get_path_owner_team(
+        self,
+        mock_get_conn: MagicMock,
+        mock_put_conn: MagicMock,
+    ):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_get_conn.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_cursor.fetchone.return_value = {"owner_id": "1"}
+
+        get_path_owner(1, team_id=4)
+
+        (sql, params) = mock_cursor.execute.call_args[0]
+        normalized_sql = " ".join(sql.split())
+        assert "JOIN teams t ON t.course_id = c.id AND t.id = %s" in normalized_sql
+        assert "sections" not in normalized_sql
+        assert params == [4, 1]
+
+    @patch("services.ownership_services.put_conn")
+    @patch("services.ownership_services.get_conn")
+    def test_get_path_owner_not_found(
+        self,
+        mock_get_conn: MagicMock,
+        mock_put_conn: MagicMock,
+    ):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_get_conn.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_cursor.fetchone.return_value = None
+
+        result = get_path_owner(1, section_id=2)
+
+        (sql, params) = mock_cursor.execute.call_args[0]
+        assert params == [2, 1]
+        mock_put_conn.assert_called_once_with(mock_conn)
+
+        assert result is None
+
+
+class TestOwnershipCache:
+    def setup_method(self):
+        self.cache = OwnershipCache(ttl=60, max_size=2)
+
+    def test_contains_path(self):
+        self.cache.add("1", 1, section_id=2, student_id=3)
+        self.cache.add("1", 1, team_id=4)
+
+        assert self.cache.contains("1", 1)
+        assert self.cache.contains("1", 1, section_id=2)
+        assert self.cache.contains("1", 1, section_id=2, student_id=3)
+        assert self.cache.contains("1", 1, team_id=4)
+
+        # Unknown children, other sections and other users are misses
+        assert not self.cache.contains("1", 1, section_id=5)
+        assert not self.cache.contains("1", 1, section_id=5, student_id=3)
+        assert not self.cache.contains("1", 1, team_id=5)
+        assert not self.cache.contains("2", 1)
+
+    def test_contains_child(self):
+        self.cache.add("1", 1, section_id=2, student_id=3)
+        self.cache.add("1", 1, team_id=4)
+
+        assert self.cache.contains_child("1", student_id=3)
+        assert self.cache.contains_child("1", team_id=4)
+        assert not self.cache.contains_child("2", student_id=3)
+        assert not self.cache.contains_child("1", team_id=3)
+
+    @patch("services.ownership_services.time.monotonic")
+    def test_entries_expire(self, mock_monotonic: MagicMock):
+        mock_monotonic.return_value = 100
+        self.cache.add("1", 1, section_id=2)
+
+        mock_monotonic.return_value = 159
+        assert self.cache.contains("1", 1, section_id=2)
+
+        mock_monotonic.return_value = 160
+        assert not self.cache.contains("1", 1, section_id=2)
+
+    def test_size_bound_drops_least_recently_used(self):
+        self.cache.add("1", 1)
+        self.cache.add("1", 2)
+        # Touch course 1 so course 2 is the least recently used
+        assert self.cache.contains("1", 1)
+        self.cache.add("1", 3)
+
+        assert self.cache.contains("1", 1)
+        assert not self.cache.contains("1", 2)
+        assert self.cache.contains("1", 3)
+
+    def test_invalidate(self):
+        self.cache.add("1", 1, section_id=2, student_id=3)
+        self.cache.add("1", 1, section_id=5, student_id=6)
+        self.cache.add("1", 1, team_id=4)
+        self.cache.add("1", 1, team_id=7)
+
+        self.cache.invalidate_sections([2])
+        assert not self.cache.contains("1", 1, section_id=2)
+        assert not self.cache.contains_child("1", student_id=3)
+        assert self.cache.contains("1", 1, section_id=5, student_id=6)
+
+        self.cache.invalidate_students([6])
+        assert not self.cache.contains("1", 1, section_id=5, student_id=6)
+        assert self.cache.contains("1", 1, section_id=5)
+
+        self.cache.invalidate_teams(team_ids=[4])
+        assert not self.cache.contains("1", 1, team_id=4)
+        assert self.cache.contains("1", 1, team_id=7)
+
+        self.cache.invalidate_teams(course_id=1)
+        assert not self.cache.contains("1", 1, team_id=7)
+
+        self.cache.invalidate_course(1)
+        assert not self.cache.contains("1", 1)
@@ -38,8 +38,10 @@ class TestCreateSection:
 
     @patch("services.section_services.put_conn")
     @patch("services.section_services.get_conn")
+    @patch("services.section_services.tree_services")
     def test_create_section_success(
         self,
+        mock_tree_services,
         mock_get_conn,
         mock_put_conn,
     ):
@@ -114,8 +116,10 @@ class TestGetSectionsByCourse:
 
     @patch("services.section_services.put_conn")
     @patch("services.section_services.get_conn")
+    @patch("services.section_services.tree_services")
     def test_get_sections_by_course_with_sections(
         self,
+        mock_tree_services,
         mock_get_conn,
         mock_put_conn,
     ):
@@ -197,8 +201,10 @@ class TestGetSectionById:
 
     @patch("services.section_services.put_conn")
     @patch("services.section_services.get_conn")
+    @patch("services.section_services.tree_services")
     def test_get_section_by_id_found(
         self,
+        mock_tree_services,
         mock_get_conn,
         mock_put_conn,
     ):
@@ -242,8 +248,10 @@ class TestUpdateSection:
 
     @patch("services.section_services.put_conn")
     @patch("services.section_services.get_conn")
+    @patch("services.section_services.tree_services")
     def test_update_section_success(
         self,
+        mock_tree_services,
         mock_get_conn,
         mock_put_conn,
     ):
@@ -285,14 +293,13 @@ class TestUpdateSection:
 
         mock_cursor.fetchone.return_value = None
 
-        result = update_section(self.section_id, self.data)
+        with pytest.raises(NotFoundException):
+            update_section(self.section_id, self.data)
 
         mock_cursor.fetchone.assert_called_once()
-        mock_conn.commit.assert_called_once()
+        mock_conn.commit.assert_not_called()
         mock_put_conn.assert_called_once_with(mock_conn)
 
-        assert result is None
-
 
 class TestDeleteSection:
     @patch("services.section_services.put_conn")
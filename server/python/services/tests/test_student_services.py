@@ -2,13 +2,7 @@ import psycopg2.errors
 import pytest
 from unittest.mock import MagicMock, patch
 from services.student_services import *
-
-@staticmethod
-def baseData() -> list[dict]: 
-    return {
-            "name": "Trent Reed",
-            "email": "test123@your_email.com",
-        }
+from services.student_services import _fill_students_children
 
 @staticmethod
 def expected_res_fetchone() -> dict:
@@ -29,76 +23,100 @@ def expected_res_fetchone() -> dict:
 def expected_res_fetchall() -> list[dict]:
     return [expected_res_fetchone()]
 
-class TestCreateStudent:
+class TestCreateStudents:
     @staticmethod
-    def baseData() -> list[dict]: 
-        return {
-                "name": "Trent Reed",
-                "email": "test123@your_email.com",
-            }
+    def rows() -> list[dict]:
+        return [
+            {"name": "Trent Reed", "email": "trent@test.com"},
+            {"email": "missing@test.com"},
+            {"name": "Isaac Maddox", "email": "isaac@test.com", "major": "CS"},
+            {"name": "Isaac Again", "email": "isaac@test.com"},
+        ]
 
     @patch("services.student_services.put_conn")
     @patch("services.student_services.get_conn")
-    def test_create_student_success(
+    @patch("services.student_services.execute_values")
+    def test_create_students_reports_row_errors(
         self,
+        mock_execute_values: MagicMock,
         mock_get_conn: MagicMock,
         mock_put_conn: MagicMock,
     ):
         mock_conn = MagicMock()
-        mock_cursor = MagicMock()
-
         mock_get_conn.return_value = mock_conn
-        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
-
-        mock_cursor.fetchone.return_value = expected_res_fetchone()
-        result = create_student(
-            section_id=1,
-            data=baseData(),
-        )
-
-        mock_cursor.execute.assert_called_once()
-        (_, params) = mock_cursor.execute.call_args[0]
-        assert list(params) == [1, baseData()["name"], baseData()["email"],]
+        # trent@test.com already exists in the section
+        mock_execute_values.return_value = [
+            {"id": 2, "section_id": 1, "name": "Isaac Maddox", "email": "isaac@test.com"},
+        ]
 
-        (sql,) = mock_cursor.execute.call_args[0][:1]
-        normalized_sql = " ".join(sql.split())
-        assert "INSERT INTO students (section_id, name, email) VALUES (%s, %s, %s) RETURNING *" in normalized_sql
+        created, errors = create_students(1, TestCreateStudents.rows())
 
-        mock_cursor.fetchone.assert_called_once()
+        # Every valid row goes out in a single statement
+        mock_execute_values.assert_called_once()
+        (_, sql, values) = mock_execute_values.call_args[0]
+        assert "ON CONFLICT (email, section_id) DO NOTHING" in sql
+        assert values == [
+            (1, "Trent Reed", "trent@test.com", None),
+            (1, "Isaac Maddox", "isaac@test.com", "CS"),
+        ]
         mock_conn.commit.assert_called_once()
         mock_put_conn.assert_called_once_with(mock_conn)
 
-        assert result == expected_res_fetchone()
+        assert [student["id"] for student in created] == [2]
+        assert created[0]["labels"] == []
+        assert created[0]["work_with"] == []
+        assert errors == [
+            {"index": 0, "status": 409, "error": "Conflict"},
+            {"index": 1, "status": 400, "error": "Missing name"},
+            {"index": 3, "status": 409, "error": "Duplicate email"},
+        ]
 
-        mock_put_conn.reset_mock()
+    @patch("services.student_services.get_conn")
+    @patch("services.student_services.execute_values")
+    def test_create_students_atomic_validation_error(
+        self,
+        mock_execute_values: MagicMock,
+        mock_get_conn: MagicMock,
+    ):
+        created, errors = create_students(1, TestCreateStudents.rows(), atomic=True)
+
+        # Nothing is sent to the database when a row is already known to be bad
+        mock_get_conn.assert_not_called()
+        mock_execute_values.assert_not_called()
+        assert created == []
+        assert len(errors) == 2
 
     @patch("services.student_services.put_conn")
     @patch("services.student_services.get_conn")
-    def test_create_student_failure_invalid_key(
+    @patch("services.student_services.execute_values")
+    def test_create_students_atomic_conflict_rolls_back(
         self,
-        mock_get_conn,
-        mock_put_conn,
+        mock_execute_values: MagicMock,
+        mock_get_conn: MagicMock,
+        mock_put_conn: MagicMock,
     ):
         mock_conn = MagicMock()
-        mock_cursor = MagicMock()
         mock_get_conn.return_value = mock_conn
-        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_execute_values.return_value = []
 
-        with pytest.raises(BadRequestException):
-            create_student(
-                section_id=1,
-                data={"invalid_key": "value"},
-            )
+        created, errors = create_students(
+            1, [{"name": "Trent Reed", "email": "trent@test.com"}], atomic=True
+        )
 
-        mock_cursor.execute.assert_not_called()
+        mock_conn.rollback.assert_called_once()
         mock_conn.commit.assert_not_called()
+        mock_put_conn.assert_called_once_with(mock_conn)
+        assert created == []
+        assert errors == [{"index": 0, "status": 409, "error": "Conflict"}]
 
 
 class TestGetStudentsBySection:
     @patch("services.student_services.put_conn")
     @patch("services.student_services.get_conn")
+    @patch("services.student_services._fill_students_children")
     def test_get_students_by_section(
         self,
+        mock__fill_students_children: MagicMock,
         mock_get_conn,
         mock_put_conn,
     ):
@@ -115,6 +133,9 @@ class TestGetStudentsBySection:
         assert list(params) == [1]
 
         mock_cursor.fetchall.assert_called_once()   
+        mock__fill_students_children.assert_called_once_with(
+            expected_res_fetchall(), conn=mock_conn, depth=None, include=None
+        )
         mock_put_conn.assert_called_once_with(mock_conn)
 
         assert result == expected_res_fetchall()
@@ -149,8 +170,10 @@ class TestGetStudentsBySection:
 class TestGetStudentById:
     @patch("services.student_services.put_conn")
     @patch("services.student_services.get_conn")
+    @patch("services.student_services._fill_student_children")
     def test_get_student_by_id(
         self,
+        mock__fill_student_children: MagicMock,
         mock_get_conn,
         mock_put_conn,
     ):
@@ -198,20 +221,77 @@ class TestGetStudentById:
         assert result is None
 
 
+class TestFillStudentsChildren:
+    @pytest.mark.parametrize("times", [1, 60])
+    @patch("services.student_services.experience_services")
+    @patch("services.student_services.comment_services")
+    @patch("services.student_services.label_services")
+    def test_fill_students_children(
+        self,
+        mock_label_services: MagicMock,
+        mock_comment_services: MagicMock,
+        mock_experience_services: MagicMock,
+        times: int,
+    ):
+        students = [
+            {"id": i, "work_with": None, "dont_work_with": ["Isaac Maddox"]}
+            for i in range(1, times + 1)
+        ]
+        label = {"id": 1, "owner_id": "1", "color": "#fff", "name": "Leader"}
+        comment = {"id": 1, "student_id": 1, "team_id": None, "content": "Hi"}
+
+        mock_label_services.get_labels_by_students.return_value = {1: [label]}
+        mock_comment_services.get_comments_by_students.return_value = {1: [comment]}
+        mock_experience_services.get_experiences_by_students.return_value = {
+            1: {"languages": [{"id": 1, "name": "Python"}], "frameworks": []}
+        }
+
+        _fill_students_children(students)
+
+        # Each child type is fetched once for the whole list
+        ids = list(range(1, times + 1))
+        mock_label_services.get_labels_by_students.assert_called_once_with(ids, conn=None)
+        mock_comment_services.get_comments_by_students.assert_called_once_with(ids, conn=None)
+        mock_experience_services.get_experiences_by_students.assert_called_once_with(
+            ids, conn=None
+        )
+
+        assert students[0]["labels"] == [label]
+        assert students[0]["comments"] == [comment]
+        assert students[0]["languages"] == [{"id": 1, "name": "Python"}]
+        assert students[0]["frameworks"] == []
+        assert students[0]["work_with"] == []
+        assert students[0]["dont_work_with"] == ["Isaac Maddox"]
+
+        for student in students[1:]:
+            assert student["labels"] == []
+            assert student["comments"] == []
+            assert student["languages"] == []
+
+    @patch("services.student_services.label_services")
+    def test_fill_students_children_empty(self, mock_label_services: MagicMock):
+        _fill_students_children([])
+
+        mock_label_services.get_labels_by_students.assert_not_called()
+
+
 class TestBulkUpdateStudents:
     @staticmethod
     def payload(times: int):
         return [
-            {"email": "test@test.com", "work_with": ["Isaac Maddox"]} for _ in range(times)
+            {"email": f"test{i}@test.com", "work_with": ["Isaac Maddox"]}
+            for i in range(times)
         ]
 
     @pytest.mark.parametrize("times", [10, 20, 30])
     @patch("services.student_services.put_conn")
     @patch("services.student_services.get_conn")
-    @patch("services.student_services.update_student")
+    @patch("services.student_services.execute_values")
+    @patch("services.student_services._fill_students_children")
     def test_bulk_update_students(
         self,
-        mock_update_student: MagicMock,
+        mock__fill_students_children: MagicMock,
+        mock_execute_values: MagicMock,
         mock_get_conn: MagicMock,
         mock_put_conn: MagicMock,
         times: int,
@@ -221,20 +301,157 @@ class TestBulkUpdateStudents:
         mock_get_conn.return_value = mock_conn
         mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
         mock_conn.cursor.return_value.__exit__.return_value = False
+        mock_cursor.fetchall.side_effect = [
+            [{"id": i, "email": f"test{i}@test.com"} for i in range(times)],
+            [{"id": i, "email": f"test{i}@test.com"} for i in range(times)],
+        ]
+
+        result = bulk_update_students(1, TestBulkUpdateStudents.payload(times))
+
+        # The emails are resolved and the students re-read once each,
+        # no matter how many students there are
+        assert mock_cursor.execute.call_count == 2
+        (_, params) = mock_cursor.execute.call_args_list[0][0]
+        assert params == (1, [f"test{i}@test.com" for i in range(times)])
 
-        bulk_update_students(1, TestBulkUpdateStudents.payload(times))
-
-        # Make sure a cursor was opened only once per student
-        assert mock_conn.cursor.call_count == times
-        # Make sure N = len(payload) queries were issued
-        # (because we mocked update_student, so those queries are never issued)
-        assert mock_cursor.execute.call_count == times
-        # Make sure our update_student mock is called once per student
-        assert mock_update_student.call_count == times
-        # Make sure the connection is only put once
-        # (to avoid an unkeyed connection error)
+        # Every column change goes out in a single UPDATE
+        mock_execute_values.assert_called_once()
+        (_, sql, rows) = mock_execute_values.call_args[0]
+        assert "UPDATE students s" in sql
+        assert rows == [(i, True, ["Isaac Maddox"]) for i in range(times)]
+
+        mock__fill_students_children.assert_called_once()
+        mock_conn.commit.assert_called_once()
         mock_put_conn.assert_called_once()
 
+        assert [student["id"] for student in result] == list(range(times))
+
+    @patch("services.student_services.put_conn")
+    @patch("services.student_services.get_conn")
+    @patch("services.student_services.execute_values")
+    @patch("services.student_services._fill_students_children")
+    def test_bulk_update_students_experiences(
+        self,
+        mock__fill_students_children: MagicMock,
+        mock_execute_values: MagicMock,
+        mock_get_conn: MagicMock,
+        mock_put_conn: MagicMock,
+    ):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_get_conn.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_cursor.fetchall.side_effect = [
+            [{"id": 1, "email": "a@test.com"}, {"id": 2, "email": "b@test.com"}],
+            [{"id": 1}, {"id": 2}],
+        ]
+
+        bulk_update_students(
+            1,
+            [
+                {"email": "a@test.com", "languages": ["Python"], "frameworks": ["Flask"]},
+                {"email": "b@test.com", "languages": ["Python"]},
+                {"email": "unknown@test.com", "languages": ["Go"]},
+            ],
+        )
+
+        # No scalar columns changed, so only the experience statements run,
+        # one to upsert the names and one to diff the links of every student
+        mock_execute_values.assert_not_called()
+        assert mock_cursor.execute.call_count == 4
+
+        (_, names) = mock_cursor.execute.call_args_list[1][0]
+        assert names == (["Flask", "Python"], ["framework", "language"])
+
+        (sql, pairs) = mock_cursor.execute.call_args_list[2][0]
+        assert "unnest" in sql
+        assert pairs == (
+            [1, 1, 2],
+            ["Flask", "Python", "Python"],
+            ["framework", "language", "language"],
+            # Student 2 didn't send frameworks, so only their languages are replaced
+            [1, 1, 2],
+            ["language", "framework", "language"],
+        )
+
+    @patch("services.student_services.get_conn")
+    def test_bulk_update_students_missing_email(self, mock_get_conn: MagicMock):
+        with pytest.raises(BadRequestException):
+            bulk_update_students(1, [{"name": "Trent Reed"}])
+
+        mock_get_conn.assert_not_called()
+
+
+class TestMoveStudents:
+    @staticmethod
+    def moves(times: int) -> list[dict]:
+        return [
+            {"sectionId": 1, "studentId": i, "teamId": 2} for i in range(1, times + 1)
+        ]
+
+    @pytest.mark.parametrize("times", [1, 50])
+    @patch("services.student_services.put_conn")
+    @patch("services.student_services.get_conn")
+    @patch("services.student_services._fill_students_children")
+    def test_move_students(
+        self,
+        mock__fill_students_children: MagicMock,
+        mock_get_conn: MagicMock,
+        mock_put_conn: MagicMock,
+        times: int,
+    ):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_get_conn.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_cursor.fetchone.return_value = {"valid": times}
+        # Students are returned out of order, and the first one was already on team 2
+        mock_cursor.fetchall.return_value = [
+            {"id": i, "team_id": 2} for i in range(times, 1, -1)
+        ]
+
+        result = move_students(1, TestMoveStudents.moves(times))
+
+        # One query validates every move and one UPDATE applies them
+        assert mock_cursor.execute.call_count == 2
+        (_, params) = mock_cursor.execute.call_args_list[0][0]
+        assert params == (
+            list(range(1, times + 1)),
+            [1] * times,
+            [2] * times,
+            1,
+        )
+        mock_conn.commit.assert_called_once()
+        mock_put_conn.assert_called_once_with(mock_conn)
+        mock__fill_students_children.assert_not_called()
+
+        assert result == [
+            {"studentId": i, "teamId": 2} for i in range(2, times + 1)
+        ]
+
+    @patch("services.student_services.put_conn")
+    @patch("services.student_services.get_conn")
+    def test_move_students_outside_course(
+        self,
+        mock_get_conn: MagicMock,
+        mock_put_conn: MagicMock,
+    ):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_get_conn.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_cursor.fetchone.return_value = {"valid": 1}
+
+        with pytest.raises(NotFoundException):
+            move_students(1, TestMoveStudents.moves(2))
+
+        # Nothing is updated when any move points outside the course
+        mock_cursor.execute.assert_called_once()
+        mock_conn.commit.assert_not_called()
+        mock_conn.rollback.assert_called_once()
+        mock_put_conn.assert_called_once_with(mock_conn)
+
+
 class TestDeleteStudent:
     @patch("services.student_services.put_conn")
     @patch("services.student_services.get_conn")
@@ -281,3 +498,30 @@ class TestDeleteStudent:
         mock_put_conn.assert_called_once_with(mock_conn)
 
         assert result == 0
+
+
+class TestDeleteStudents:
+    @patch("services.student_services.put_conn")
+    @patch("services.student_services.get_conn")
+    def test_delete_students(self, mock_get_conn, mock_put_conn):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_get_conn.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_cursor.fetchall.return_value = [{"id": 1}, {"id": 2}]
+
+        result = delete_students(1, [1, 2, 3])
+
+        # Every student is deleted by one statement scoped to the section
+        mock_cursor.execute.assert_called_once()
+        (_, params) = mock_cursor.execute.call_args[0]
+        assert params == (1, [1, 2, 3])
+        mock_conn.commit.assert_called_once()
+        mock_put_conn.assert_called_once_with(mock_conn)
+
+        assert result == [1, 2]
+
+    @patch("services.student_services.get_conn")
+    def test_delete_students_empty(self, mock_get_conn):
+        assert delete_students(1, []) == []
+        mock_get_conn.assert_not_called()
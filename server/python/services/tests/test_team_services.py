@@ -81,16 +81,69 @@ class TestCreateTeam:
 
         assert result == expected_res
 
+class TestCreateTeams:
+    @pytest.mark.parametrize("times", [1, 100, 500])
+    @patch("services.team_services.put_conn")
+    @patch("services.team_services.get_conn")
+    @patch("services.team_services.execute_values")
+    def test_create_teams_success(
+        self,
+        mock_execute_values,
+        mock_get_conn,
+        mock_put_conn,
+        times,
+    ):
+        mock_conn = MagicMock()
+        mock_get_conn.return_value = mock_conn
+        names = [f"Team {i + 1}" for i in range(times)]
+        mock_execute_values.return_value = [
+            {"id": i + 1, "name": name, "course_id": 1} for i, name in enumerate(names)
+        ]
+
+        result = create_teams(1, names)
+
+        # All of the teams go out in one statement and one transaction
+        mock_execute_values.assert_called_once()
+        (_, _, rows) = mock_execute_values.call_args[0]
+        assert rows == [(name, 1) for name in names]
+        mock_conn.commit.assert_called_once()
+        mock_put_conn.assert_called_once_with(mock_conn)
+
+        assert len(result) == times
+        assert result[0]["students"] == []
+
+    @patch("services.team_services.put_conn")
+    @patch("services.team_services.get_conn")
+    @patch("services.team_services.execute_values")
+    def test_create_teams_conflict(
+        self,
+        mock_execute_values,
+        mock_get_conn,
+        mock_put_conn,
+    ):
+        mock_conn = MagicMock()
+        mock_get_conn.return_value = mock_conn
+        mock_execute_values.side_effect = psycopg2.errors.UniqueViolation()
+
+        with pytest.raises(psycopg2.errors.UniqueViolation):
+            create_teams(1, ["Team 1"])
+
+        mock_conn.commit.assert_not_called()
+        mock_conn.rollback.assert_called_once()
+        # The connection goes back to the pool even when the insert fails
+        mock_put_conn.assert_called_once_with(mock_conn)
+
+
 class TestGetTeamsByCourse:
     def setup_method(self):
         self.course_id = 1
 
     @patch("services.team_services.put_conn")
     @patch("services.team_services.get_conn")
-    @patch("services.team_services._fill_team_children")
+    @patch("services.team_services.tree_services")
     def test_get_teams_by_course_success(
         self,
-        mock__fill_team_children,
+        mock_tree_services,
         mock_get_conn,
         mock_put_conn,
     ):
@@ -113,10 +166,12 @@ class TestGetTeamsByCourse:
         ]
 
         mock_cursor.fetchall.return_value = expected_res
-        mock__fill_team_children.return_value = None
 
         result = get_teams_by_course(self.course_id)
 
+        mock_tree_services.fill_teams.assert_called_once_with(
+            expected_res, depth=None, include=None
+        )
         mock_put_conn.assert_called_once_with(mock_conn)
 
         assert result == expected_res
@@ -282,4 +337,25 @@ class TestDeleteTeam:
         mock_conn.commit.assert_called_once()
         mock_put_conn.assert_called_once_with(mock_conn)
 
-        mock_put_conn.reset_mock()
\ No newline at end of file
+        mock_put_conn.reset_mock()
+
+class TestBatchDeleteTeams:
+    @patch("services.team_services.put_conn")
+    @patch("services.team_services.get_conn")
+    def test_batch_delete_teams(self, mock_get_conn, mock_put_conn):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_get_conn.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_cursor.rowcount = 40
+
+        result = batch_delete_teams(1)
+
+        # One DELETE removes every team no matter how many there are
+        mock_cursor.execute.assert_called_once()
+        (_, params) = mock_cursor.execute.call_args[0]
+        assert params == (1,)
+        mock_conn.commit.assert_called_once()
+        mock_put_conn.assert_called_once_with(mock_conn)
+
+        assert result == 40
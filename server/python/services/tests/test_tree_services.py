@@ -0,0 +1,284 @@
+import pytest
+from unittest.mock import patch, MagicMock
+from services.tree_services import *
+
+
+class TestFillCourseTrees:
+    @staticmethod
+    def rows(student_count: int) -> list[list[dict]]:
+        students = [
+            {
+                "id": i,
+                "section_id": 1,
+                "team_id": 1 if i % 2 else None,
+                "name": f"Student {i}",
+                "work_with": None,
+                "dont_work_with": None,
+                "course_id": 1,
+            }
+            for i in range(1, student_count + 1)
+        ]
+
+        return [
+            # sections
+            [{"id": 1, "course_id": 1, "name": "Section A", "course_name": "Course"}],
+            # teams
+            [{"id": 1, "course_id": 1, "name": "Team 1"}],
+            # team labels
+            [{"parent_id": 1, "id": 3, "owner_id": "1", "color": "#fff", "name": "L"}],
+            # team comments
+            [{"parent_id": 1, "id": 7, "team_id": 1, "student_id": None, "content": "c"}],
+            # students
+            students,
+            # student labels
+            [{"parent_id": 1, "id": 3, "owner_id": "1", "color": "#fff", "name": "L"}],
+            # student comments
+            [{"parent_id": 2, "id": 8, "team_id": None, "student_id": 2, "content": "c"}],
+            # experiences
+            [
+                {"parent_id": 1, "id": 4, "name": "Python", "type": "language"},
+                {"parent_id": 1, "id": 5, "name": "Flask", "type": "framework"},
+            ],
+        ]
+
+    @pytest.mark.parametrize("student_count", [1, 30, 300])
+    @patch("services.tree_services.put_conn")
+    @patch("services.tree_services.get_conn")
+    def test_fill_course_trees_constant_queries(
+        self,
+        mock_get_conn: MagicMock,
+        mock_put_conn: MagicMock,
+        student_count: int,
+    ):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_get_conn.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_cursor.fetchall.side_effect = TestFillCourseTrees.rows(student_count)
+
+        course = {"id": 1, "owner_id": "1", "name": "Course"}
+        fill_course_trees([course])
+
+        # The number of queries does not depend on the size of the roster
+        assert mock_cursor.execute.call_count == 8
+        mock_get_conn.assert_called_once()
+        mock_put_conn.assert_called_once_with(mock_conn)
+
+        (section,) = course["sections"]
+        (team,) = course["teams"]
+
+        assert len(section["students"]) == student_count
+        assert [s["id"] for s in team["students"]] == list(
+            range(1, student_count + 1, 2)
+        )
+        assert team["labels"] == [{"id": 3, "owner_id": "1", "color": "#fff", "name": "L"}]
+        assert team["comments"][0]["id"] == 7
+
+        first = section["students"][0]
+        assert first["work_with"] == []
+        assert first["dont_work_with"] == []
+        assert first["labels"] == [{"id": 3, "owner_id": "1", "color": "#fff", "name": "L"}]
+        assert first["comments"] == []
+        assert first["languages"] == [{"id": 4, "name": "Python"}]
+        assert first["frameworks"] == [{"id": 5, "name": "Flask"}]
+
+        # Students are shared between their section and their team
+        assert team["students"][0] is first
+
+    @patch("services.tree_services.put_conn")
+    @patch("services.tree_services.get_conn")
+    def test_fill_course_trees_empty_course(
+        self,
+        mock_get_conn: MagicMock,
+        mock_put_conn: MagicMock,
+    ):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_get_conn.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_cursor.fetchall.side_effect = [[], []]
+
+        course = {"id": 1, "owner_id": "1", "name": "Course"}
+        fill_course_trees([course])
+
+        # Only sections and teams are queried when there is nothing beneath them
+        assert mock_cursor.execute.call_count == 2
+        mock_put_conn.assert_called_once_with(mock_conn)
+
+        assert course["sections"] == []
+        assert course["teams"] == []
+
+    @patch("services.tree_services.get_conn")
+    def test_fill_course_trees_no_courses(self, mock_get_conn: MagicMock):
+        fill_course_trees([])
+
+        mock_get_conn.assert_not_called()
+
+
+class TestFillSections:
+    @patch("services.tree_services.put_conn")
+    @patch("services.tree_services.get_conn")
+    def test_fill_sections(
+        self,
+        mock_get_conn: MagicMock,
+        mock_put_conn: MagicMock,
+    ):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_get_conn.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_cursor.fetchall.side_effect = [
+            [
+                {"id": 1, "section_id": 1, "team_id": None, "course_id": 1},
+                {"id": 2, "section_id": 2, "team_id": None, "course_id": 1},
+            ],
+            [],
+            [],
+            [],
+        ]
+
+        sections = [{"id": 1, "course_id": 1}, {"id": 2, "course_id": 1}]
+        fill_sections(sections)
+
+        assert mock_cursor.execute.call_count == 4
+        (_, params) = mock_cursor.execute.call_args_list[0][0]
+        assert params == ([1, 2], [])
+        mock_put_conn.assert_called_once_with(mock_conn)
+
+        assert [s["id"] for s in sections[0]["students"]] == [1]
+        assert [s["id"] for s in sections[1]["students"]] == [2]
+
+
+class TestFillTeams:
+    @patch("services.tree_services.put_conn")
+    @patch("services.tree_services.get_conn")
+    def test_fill_teams_no_students(
+        self,
+        mock_get_conn: MagicMock,
+        mock_put_conn: MagicMock,
+    ):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_get_conn.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_cursor.fetchall.side_effect = [[], [], []]
+
+        teams = [{"id": 1, "course_id": 1, "name": "Team 1"}]
+        fill_teams(teams)
+
+        assert mock_cursor.execute.call_count == 3
+        mock_put_conn.assert_called_once_with(mock_conn)
+
+        assert teams[0]["labels"] == []
+        assert teams[0]["comments"] == []
+        assert teams[0]["students"] == []
+
+
+class TestFillCourseTreesDepth:
+    @patch("services.tree_services.get_conn")
+    def test_depth_zero_skips_children(self, mock_get_conn: MagicMock):
+        course = {"id": 1, "owner_id": "1", "name": "Course"}
+        fill_course_trees([course], depth=0)
+
+        mock_get_conn.assert_not_called()
+        assert "sections" not in course
+        assert "teams" not in course
+
+    @patch("services.tree_services.put_conn")
+    @patch("services.tree_services.get_conn")
+    def test_depth_one_loads_bare_sections_and_teams(
+        self,
+        mock_get_conn: MagicMock,
+        mock_put_conn: MagicMock,
+    ):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_get_conn.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_cursor.fetchall.side_effect = [
+            [{"id": 1, "course_id": 1, "name": "Section A"}],
+            [{"id": 1, "course_id": 1, "name": "Team 1"}],
+        ]
+
+        course = {"id": 1, "owner_id": "1", "name": "Course"}
+        fill_course_trees([course], depth=1)
+
+        assert mock_cursor.execute.call_count == 2
+        assert course["sections"] == [{"id": 1, "course_id": 1, "name": "Section A"}]
+        assert course["teams"] == [{"id": 1, "course_id": 1, "name": "Team 1"}]
+
+    @patch("services.tree_services.put_conn")
+    @patch("services.tree_services.get_conn")
+    def test_include_sections_only(
+        self,
+        mock_get_conn: MagicMock,
+        mock_put_conn: MagicMock,
+    ):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_get_conn.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_cursor.fetchall.side_effect = [
+            [{"id": 1, "course_id": 1, "name": "Section A"}],
+        ]
+
+        course = {"id": 1, "owner_id": "1", "name": "Course"}
+        fill_course_trees([course], include={"sections"})
+
+        mock_cursor.execute.assert_called_once()
+        assert course["sections"] == [{"id": 1, "course_id": 1, "name": "Section A"}]
+        assert "teams" not in course
+
+
+class TestNormalizeCourse:
+    def test_normalize_course(self):
+        label = {"id": 3, "name": "L"}
+        python = {"id": 4, "name": "Python"}
+        student = {
+            "id": 1,
+            "section_id": 1,
+            "team_id": 2,
+            "labels": [label],
+            "comments": [{"id": 8, "content": "c"}],
+            "languages": [python],
+            "frameworks": [{"id": 5, "name": "Flask"}],
+        }
+        other = {**student, "id": 6, "team_id": None, "labels": [dict(label)], "comments": []}
+        course = {
+            "id": 1,
+            "name": "Course",
+            "sections": [{"id": 1, "name": "Section A", "students": [student, other]}],
+            "teams": [
+                {"id": 2, "name": "Team", "students": [student], "labels": [label], "comments": []}
+            ],
+        }
+
+        normalized = normalize_course(course)
+
+        assert normalized["course"] == {"id": 1, "name": "Course", "sections": [1], "teams": [2]}
+        assert normalized["sections"] == {1: {"id": 1, "name": "Section A", "students": [1, 6]}}
+        assert normalized["teams"][2]["students"] == [1]
+        assert normalized["teams"][2]["labels"] == [3]
+        # Shared entities are only included once
+        assert list(normalized["students"]) == [1, 6]
+        assert normalized["labels"] == {3: label}
+        assert normalized["students"][1] == {
+            "id": 1,
+            "section_id": 1,
+            "team_id": 2,
+            "labels": [3],
+            "comments": [8],
+            "languages": [4],
+            "frameworks": [5],
+        }
+        assert normalized["comments"] == {8: {"id": 8, "content": "c"}}
+        assert normalized["experiences"] == {
+            4: {"id": 4, "name": "Python", "type": "language"},
+            5: {"id": 5, "name": "Flask", "type": "framework"},
+        }
+
+    def test_normalize_course_without_children(self):
+        normalized = normalize_course({"id": 1, "name": "Course"})
+
+        assert normalized["course"] == {"id": 1, "name": "Course"}
+        assert normalized["students"] == {}
@@ -0,0 +1,303 @@
+from collections import defaultdict
+from typing import Any
+from psycopg2.extensions import connection
+from psycopg2.extras import RealDictCursor, RealDictRow
+from classes import NormalizedCourse
+from db import parallel, queries
+from db.db import get_conn, put_conn
+from extensions import child_depth, wants_child
+from services import comment_services, label_services, student_services
+
+
+def _fetch_all(conn: connection, name: str, params: tuple) -> list[RealDictRow]:
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        queries.execute(cur, name, params)
+        return cur.fetchall()
+
+
+def _fetch_students(
+    conn: connection,
+    section_ids: list[int],
+    team_ids: list[int],
+    depth: int | None,
+    include: set[str] | None,
+) -> list[RealDictRow]:
+    if not section_ids and not team_ids:
+        return []
+
+    students = _fetch_all(conn, "students_by_sections_or_teams", (section_ids, team_ids))
+
+    student_services._fill_students_children(
+        students, conn=conn, depth=depth, include=include
+    )
+
+    return students
+
+
+def _attach_team_children(
+    conn: connection,
+    teams: list[RealDictRow],
+    depth: int | None,
+    include: set[str] | None,
+) -> None:
+    """Fill labels and comments for every team at once"""
+    if not teams:
+        return
+
+    team_ids = [team["id"] for team in teams]
+    loads = {}
+
+    if wants_child("labels", depth, include):
+        loads["labels"] = lambda c: label_services.get_labels_by_teams(team_ids, conn=c)
+    if wants_child("comments", depth, include):
+        loads["comments"] = lambda c: comment_services.get_comments_by_teams(
+            team_ids, conn=c
+        )
+
+    children = parallel.run_all(loads, conn=conn)
+
+    nest_team_children(teams, children.get("labels"), children.get("comments"))
+
+
+def nest_team_children(
+    teams: list[RealDictRow],
+    labels: dict[int, list] | None,
+    comments: dict[int, list] | None,
+) -> None:
+    """Hand batch-loaded labels and comments back to their teams, None means not loaded"""
+    for team in teams:
+        if labels is not None:
+            team["labels"] = labels.get(team["id"], [])
+        if comments is not None:
+            team["comments"] = comments.get(team["id"], [])
+
+
+def _attach_tree(
+    conn: connection,
+    sections: list[RealDictRow],
+    teams: list[RealDictRow],
+    depth: int | None,
+    include: set[str] | None,
+) -> None:
+    """Load every student under the given sections and teams and nest them
+
+    Students are fetched once and shared between their section and their team.
+    `depth` counts the levels to load below the sections and teams.
+    """
+    loads = {}
+
+    if teams:
+        loads["teams"] = lambda c: _attach_team_children(c, teams, depth, include)
+    if wants_child("students", depth, include):
+        loads["students"] = lambda c: _fetch_students(
+            c,
+            section_ids=[section["id"] for section in sections],
+            team_ids=[team["id"] for team in teams],
+            depth=child_depth(depth),
+            include=include,
+        )
+
+    children = parallel.run_all(loads, conn=conn)
+
+    if "students" in children:
+        nest_students(sections, teams, children["students"])
+
+
+def nest_students(
+    sections: list[RealDictRow],
+    teams: list[RealDictRow],
+    students: list[RealDictRow],
+) -> None:
+    """Hand students to their section and team, sharing each student between both"""
+    by_section: dict[int, list[RealDictRow]] = defaultdict(list)
+    by_team: dict[int, list[RealDictRow]] = defaultdict(list)
+
+    for student in students:
+        by_section[student["section_id"]].append(student)
+
+        if student["team_id"] is not None:
+            by_team[student["team_id"]].append(student)
+
+    for section in sections:
+        section["students"] = by_section.get(section["id"], [])
+
+    for team in teams:
+        team["students"] = by_team.get(team["id"], [])
+
+
+def fill_course_trees(
+    courses: list[RealDictRow],
+    depth: int | None = None,
+    include: set[str] | None = None,
+) -> None:
+    """Fill sections and teams, with all of their students, for every course
+
+    Runs a fixed number of queries no matter how many courses, sections, teams
+    or students are involved. Independent queries may run in parallel, see
+    db.parallel.
+
+    Args:
+      courses (list[dict[str, Any]]): Course dicts returned by the RealDictCursor
+      depth (int | None): How many levels of children to load, None for all
+      include (set[str] | None): Which child collections to load, None for all
+    """
+    want_sections = wants_child("sections", depth, include)
+    want_teams = wants_child("teams", depth, include)
+
+    if not courses or not (want_sections or want_teams):
+        return
+
+    course_ids = [course["id"] for course in courses]
+    loads = {}
+
+    if want_sections:
+        loads["sections"] = lambda c: _fetch_all(c, "sections_by_courses", (course_ids,))
+    if want_teams:
+        loads["teams"] = lambda c: _fetch_all(c, "teams_by_courses", (course_ids,))
+
+    conn = get_conn()
+
+    try:
+        children = parallel.run_all(loads, conn=conn)
+        sections: list[RealDictRow] = children.get("sections", [])
+        teams: list[RealDictRow] = children.get("teams", [])
+
+        _attach_tree(conn, sections, teams, child_depth(depth), include)
+    finally:
+        put_conn(conn)
+
+    nest_course_children(courses, sections, teams, want_sections, want_teams)
+
+
+def nest_course_children(
+    courses: list[RealDictRow],
+    sections: list[RealDictRow],
+    teams: list[RealDictRow],
+    want_sections: bool,
+    want_teams: bool,
+) -> None:
+    """Hand sections and teams to their course"""
+    sections_by_course: dict[int, list[RealDictRow]] = defaultdict(list)
+    teams_by_course: dict[int, list[RealDictRow]] = defaultdict(list)
+
+    for section in sections:
+        sections_by_course[section["course_id"]].append(section)
+
+    for team in teams:
+        teams_by_course[team["course_id"]].append(team)
+
+    for course in courses:
+        if want_sections:
+            course["sections"] = sections_by_course.get(course["id"], [])
+        if want_teams:
+            course["teams"] = teams_by_course.get(course["id"], [])
+
+
+def fill_sections(
+    sections: list[RealDictRow],
+    depth: int | None = None,
+    include: set[str] | None = None,
+) -> None:
+    """Fill the students of every section in a fixed number of queries
+
+    Args:
+      sections (list[dict[str, Any]]): Section dicts returned by the RealDictCursor
+      depth (int | None): How many levels of children to load, None for all
+      include (set[str] | None): Which child collections to load, None for all
+    """
+    if not sections or not wants_child("students", depth, include):
+        return
+
+    conn = get_conn()
+
+    try:
+        _attach_tree(conn, sections, [], depth, include)
+    finally:
+        put_conn(conn)
+
+
+def fill_teams(
+    teams: list[RealDictRow],
+    depth: int | None = None,
+    include: set[str] | None = None,
+) -> None:
+    """Fill the labels, comments and students of every team in a fixed number of queries
+
+    Args:
+      teams (list[dict[str, Any]]): Team dicts returned by the RealDictCursor
+      depth (int | None): How many levels of children to load, None for all
+      include (set[str] | None): Which child collections to load, None for all
+    """
+    if not teams or not (depth is None or depth > 0):
+        return
+
+    conn = get_conn()
+
+    try:
+        _attach_tree(conn, [], teams, depth, include)
+    finally:
+        put_conn(conn)
+
+
+# The child collections each kind of entity refers to by id, and the map they are in
+NORMALIZED_CHILDREN: dict[str, dict[str, str]] = {
+    "course": {"sections": "sections", "teams": "teams"},
+    "sections": {"students": "students"},
+    "teams": {"students": "students", "labels": "labels", "comments": "comments"},
+    "students": {
+        "labels": "labels",
+        "comments": "comments",
+        "languages": "experiences",
+        "frameworks": "experiences",
+    },
+}
+EXPERIENCE_TYPES = {"languages": "language", "frameworks": "framework"}
+
+
+def _normalize(
+    entity: dict[str, Any], kind: str, entities: dict[str, dict[int, dict]]
+) -> dict[str, Any]:
+    for key, child_kind in NORMALIZED_CHILDREN.get(kind, {}).items():
+        children = entity.get(key)
+
+        if children is None:
+            continue
+
+        found = entities[child_kind]
+
+        for child in children:
+            if child["id"] not in found:
+                if key in EXPERIENCE_TYPES:
+                    child = {**child, "type": EXPERIENCE_TYPES[key]}
+
+                found[child["id"]] = _normalize(child, child_kind, entities)
+
+        entity[key] = [child["id"] for child in children]
+
+    return entity
+
+
+def normalize_course(course: dict[str, Any]) -> NormalizedCourse:
+    """Flatten a course tree into maps of entities keyed by id
+
+    Every entity is included once, in the map of its kind, and refers to its
+    children by id. Students are shared by their section and their team, and
+    labels and experiences by everyone who has them. A student's `languages`
+    and `frameworks` refer to `experiences`, which carry their `type`.
+    Collections that weren't loaded are left out of their parent.
+
+    The tree is flattened in place, it can't be used afterwards.
+
+    Args:
+      course (dict[str, Any]): A course filled by fill_course_trees
+
+    Returns:
+      The course, with ids in place of its sections and teams, and a map per kind
+    """
+    entities: dict[str, dict[int, dict]] = {
+        kind: {}
+        for kind in ("sections", "teams", "students", "labels", "comments", "experiences")
+    }
+    flat_course = _normalize(course, "course", entities)
+
+    return {"course": flat_course, **entities}